@@ -0,0 +1,250 @@
+#   benchmark.py
+#   Benchmarks for the market data pipeline, driven by synthetic or recorded frames.
+#   Each stage (decode, the process_* helpers, candle aggregation) is timed per frame on its own
+#   and end to end (raw frame -> visible in market_data), for a growing number of strikes.
+#   Usage:
+#       python benchmark.py                                         # 40/80/400/2000 strikes
+#       python benchmark.py --strikes 80 --iterations 5000 --output bench.json
+#       python benchmark.py --recording feed.bin                    # frames from feed_recorder
+#       python benchmark.py --decoder                               # MessageToDict vs decoder, full vs tiered modes
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+from google.protobuf.json_format import MessageToDict
+import MarketDataFeed_pb2 as pb
+from feed_decoder import decode_feed_response
+from synthetic_feed import NIFTY_KEY, option_instrument_keys, build_frames
+from subscription_manager import StrikeWindow
+from decode_worker import FrameRing
+from snapshot import SnapshotPublisher
+from event_bus import EventBus
+from candle_builder import exchange_ms_to_ist_seconds
+from candle_data import CANDLE_DEPTH, CANDLE_INTERVALS, register_candle_engine
+
+DEFAULT_STRIKES = (40, 80, 400, 2000)
+
+
+def dict_path(message):    #   Previous path: MessageToDict plus the .get() walks done by the process_* helpers
+    feeds = MessageToDict(pb.FeedResponse().FromString(message)).get("feeds", {})
+    nifty = feeds.get(NIFTY_KEY, {})
+    index_ff = nifty.get("ff", {}).get("indexFF", {})
+    spot = index_ff.get("ltpc", {}).get("ltp")
+    candles = [c for c in index_ff.get("marketOHLC", {}).get("ohlc", []) if c.get("interval") == "I1"]
+    rows = []
+    for key, data in feeds.items():
+        if key == NIFTY_KEY or not data:
+            continue
+        market_ff = data.get("ff", {}).get("marketFF", {})
+        ltpc = market_ff.get("ltpc", {})
+        greeks = market_ff.get("optionGreeks", {})
+        bid_ask = market_ff.get("marketLevel", {}).get("bidAskQuote", [{}])[0]
+        ohlc = market_ff.get("marketOHLC", {}).get("ohlc", [{}])[0]
+        feed_details = market_ff.get("eFeedDetails", {})
+        rows.append((ltpc.get("ltp"), greeks.get("delta"), greeks.get("theta"), greeks.get("gamma"),
+                     greeks.get("vega"), greeks.get("iv"), bid_ask.get("bp"), bid_ask.get("ap"),
+                     ohlc.get("volume"), feed_details.get("oi"), feed_details.get("poi")))
+    return spot, candles, rows
+
+
+def fast_path(message, response=pb.FeedResponse()):
+    return decode_feed_response(message, response)
+
+
+def time_per_frame(func, frames, repeat=3):  #   Best of `repeat` runs, in microseconds per frame
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best / len(frames) * 1e6
+
+
+def tiered_modes(instruments_df, spot=24000.0):     #   Feed mode per key with the default distance-from-ATM tiers
+    window = StrikeWindow(None, 'NIFTY', None)
+    return window.plan_modes(instruments_df, window.atm_strike(spot))
+
+
+def bench_decoder(strikes_count=80, frames_count=200):
+    option_keys = option_instrument_keys(strikes_count)
+    frames = build_frames(option_keys, frames_count)
+    dict_us = time_per_frame(dict_path, frames)
+    fast_us = time_per_frame(fast_path, frames)
+    frame_bytes = sum(len(f) for f in frames) // len(frames)
+    tiered_frames = build_frames(option_keys, frames_count, modes=tiered_modes(synthetic_instruments(option_keys)))
+    tiered_us = time_per_frame(fast_path, tiered_frames)
+    tiered_bytes = sum(len(f) for f in tiered_frames) // len(tiered_frames)
+    print(f"decode  strikes={strikes_count}  frame={frame_bytes}B")
+    print(f"    MessageToDict + .get()   : {dict_us:10.1f} us/frame")
+    print(f"    decode_feed_response     : {fast_us:10.1f} us/frame   ({dict_us / fast_us:.1f}x)")
+    print(f"    tiered modes             : {tiered_us:10.1f} us/frame   ({fast_us / tiered_us:.1f}x, frame={tiered_bytes}B)")
+    return dict_us, fast_us, tiered_us
+
+
+def latency_summary(samples_ns):   #   Throughput and latency percentiles (microseconds) for one stage
+    samples = np.asarray(samples_ns, dtype=np.float64) / 1e3
+    total_seconds = samples.sum() / 1e6
+    return {
+        'frames': int(samples.size),
+        'frames_per_second': round(samples.size / total_seconds, 1) if total_seconds else None,
+        'mean_us': round(float(samples.mean()), 2),
+        'p50_us': round(float(np.percentile(samples, 50)), 2),
+        'p99_us': round(float(np.percentile(samples, 99)), 2),
+        'p999_us': round(float(np.percentile(samples, 99.9)), 2),
+        'max_us': round(float(samples.max()), 2),
+    }
+
+
+def time_stage(func, inputs, iterations):  #   Per-call wall time in ns, cycling through inputs
+    samples = np.empty(iterations, dtype=np.int64)
+    count = len(inputs)
+    clock = time.perf_counter_ns
+    for i in range(iterations):
+        item = inputs[i % count]
+        start = clock()
+        func(item)
+        samples[i] = clock() - start
+    return samples
+
+
+def synthetic_instruments(option_keys):
+    return pd.DataFrame({
+        'instrument_key': option_keys,
+        'strike': [24000 + 50 * (i // 2 - len(option_keys) // 4) for i in range(len(option_keys))],
+        'option_type': ['CE' if i % 2 == 0 else 'PE' for i in range(len(option_keys))],
+        'expiry': '2024-11-28',
+    })
+
+
+def new_candle_engine(market_data, option_keys=()):    #   Registered as fetch_candle_data does, plus the given options, seeded empty
+    engine = register_candle_engine(market_data)
+    for key in option_keys:
+        for interval in CANDLE_INTERVALS:
+            engine.subscribe(key, interval, CANDLE_DEPTH)
+    for key in list(engine.instruments):
+        engine.seed(key, [])
+    return engine
+
+
+def new_market_data(instruments_df):    #   Same pieces start_websocket and fetch_candle_data put in market_data
+    from websocket import attach_option_chain
+    market_data = {
+        'nifty_spot_price': None,
+        'complete_candle_data': pd.DataFrame(),
+        'snapshots': SnapshotPublisher(),
+        'events': EventBus(),
+    }
+    attach_option_chain(market_data, instruments_df)
+    new_candle_engine(market_data, instruments_df['instrument_key'][:2])    #   Stand-ins for the ATM call and put
+    return market_data
+
+
+def bench_pipeline(frames, instruments_df, iterations):    #   Every stage on its own, then end to end
+    from websocket import process_nifty_spot, process_nifty_candles, process_options_chain, process_frame
+
+    response = pb.FeedResponse()
+    decoded = [decode_feed_response(frame, pb.FeedResponse()) for frame in frames]
+    data_dict = new_market_data(instruments_df)
+    engine = new_candle_engine({})
+
+    def aggregate(frame):   #   Candle aggregation alone: fold the I1 bars into every interval, publishing is in process_nifty_candles
+        tick = frame.index.get(NIFTY_KEY)
+        if tick is None:
+            return
+        for c in tick.candles:
+            if c.interval == "I1" and c.ts:
+                engine.update_bar(NIFTY_KEY, exchange_ms_to_ist_seconds(c.ts), c.open, c.high, c.low, c.close)
+
+    stages = {
+        'decode': (lambda frame: decode_feed_response(frame, response), frames),
+        'process_nifty_spot': (lambda frame: process_nifty_spot(data_dict, frame.index.get(NIFTY_KEY)), decoded),
+        'process_nifty_candles': (lambda frame: process_nifty_candles(data_dict, frame.index.get(NIFTY_KEY)), decoded),
+        'process_options_chain': (lambda frame: process_options_chain(data_dict, frame.options), decoded),
+        'candle_aggregation': (aggregate, decoded),
+    }
+    results = {name: latency_summary(time_stage(func, inputs, iterations)) for name, (func, inputs) in stages.items()}
+
+    end_to_end_dict = new_market_data(instruments_df)
+    results['end_to_end'] = latency_summary(time_stage(
+        lambda frame: process_frame(end_to_end_dict, frame, response), frames, iterations))
+
+    # What the websocket thread still pays per frame with FEED_DECODE_WORKER=1 (ring copy in, and out again)
+    ring = FrameRing()
+    results['decode_worker_handoff'] = latency_summary(time_stage(lambda frame: ring.push(frame) and ring.pop(), frames, iterations))
+    ring.close(unlink=True)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def print_results(strikes_count, frame_bytes, results):
+    print(f"\nstrikes={strikes_count}  frame={frame_bytes}B")
+    print(f"    {'stage':24}{'frames/s':>12}{'p50 us':>10}{'p99 us':>10}{'p99.9 us':>10}")
+    for stage, summary in results.items():
+        print(f"    {stage:24}{summary['frames_per_second']:>12}{summary['p50_us']:>10}{summary['p99_us']:>10}{summary['p999_us']:>10}")
+
+
+def run_suite(strikes_list=DEFAULT_STRIKES, iterations=1000, pool_size=50, recording=None):
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'iterations': iterations,
+        'source': recording or 'synthetic',
+        'runs': [],
+    }
+
+    if recording:
+        from feed_recorder import read_frames, load_meta
+        frames = [payload for _, payload in read_frames(recording)]
+        instruments_df = load_meta(recording)
+        if instruments_df is None:
+            keys = sorted({key for frame in frames[:50] for key in decode_feed_response(frame).options})
+            instruments_df = synthetic_instruments(keys)
+        cases = [(len(instruments_df), frames, instruments_df)]
+    else:
+        cases = []
+        for strikes_count in strikes_list:
+            option_keys = option_instrument_keys(strikes_count)
+            cases.append((strikes_count, build_frames(option_keys, pool_size), synthetic_instruments(option_keys)))
+
+    for strikes_count, frames, instruments_df in cases:
+        frame_bytes = sum(len(frame) for frame in frames) // len(frames)
+        results = bench_pipeline(frames, instruments_df, iterations)
+        print_results(strikes_count, frame_bytes, results)
+        report['runs'].append({'strikes': strikes_count, 'frame_bytes': frame_bytes, 'stages': results})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Market data pipeline benchmarks")
+    parser.add_argument('--strikes', default=','.join(map(str, DEFAULT_STRIKES)), help="comma separated strike counts")
+    parser.add_argument('--iterations', type=int, default=1000, help="timed frames per stage")
+    parser.add_argument('--pool', type=int, default=50, help="distinct synthetic frames cycled per run")
+    parser.add_argument('--recording', default=None, help="frames recorded with feed_recorder instead of synthetic ones")
+    parser.add_argument('--output', default=None, help="write machine-readable results as JSON")
+    parser.add_argument('--decoder', action='store_true', help="only compare MessageToDict with the decoder")
+    args = parser.parse_args()
+
+    if args.decoder:
+        for strikes_count in map(int, args.strikes.split(',')):
+            bench_decoder(strikes_count)
+        sys.exit(0)
+
+    report = run_suite([int(s) for s in args.strikes.split(',')], args.iterations, args.pool, args.recording)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
@@ -0,0 +1,282 @@
+#   candle_builder.py
+#   Incremental OHLC aggregation: 1-minute bars and ticks are folded into the current
+#   bucket in O(1) and completed candles are kept in a bounded ring.
+#   Timestamps are IST wall-clock epoch seconds (UTC epoch + 5:30), matching the
+#   naive IST Datetime index the resampled DataFrame used to have.
+
+import threading
+from collections import deque
+import pandas as pd
+
+IST_OFFSET_SECONDS = 19800
+
+
+def exchange_ms_to_ist_seconds(ts_ms):   #   Exchange timestamps (epoch ms, UTC) to IST wall-clock seconds
+    return ts_ms // 1000 + IST_OFFSET_SECONDS
+
+
+def bars_from_frame(df):    #   (minute_ts, open, high, low, close) tuples in ascending order from a Date/Time/OHLC frame
+    if df is None or df.empty:
+        return []
+    stamps = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'].astype(str))
+    seconds = stamps.to_numpy(dtype='datetime64[s]').astype('int64')
+    bars = zip(seconds.tolist(), df['Open'].tolist(), df['High'].tolist(), df['Low'].tolist(), df['Close'].tolist())
+    return sorted(bars)
+
+
+def _combine(minute_bars):  #   OHLC of a bucket from its 1-minute bars (at most interval entries)
+    first, last = min(minute_bars), max(minute_bars)
+    return (minute_bars[first][0],
+            max(bar[1] for bar in minute_bars.values()),
+            min(bar[2] for bar in minute_bars.values()),
+            minute_bars[last][3])
+
+
+class CandleAggregator:
+
+    def __init__(self, interval_minutes=5, depth=20, pending_limit=1000):
+        self.interval_minutes = interval_minutes
+        self.interval = interval_minutes * 60
+        self.depth = depth
+        self.completed = deque(maxlen=depth)    #   (bucket_ts, open, high, low, close), oldest first
+        self.bucket_ts = None
+        self.minute_bars = {}                   #   minute_ts -> (open, high, low, close) for the current bucket
+        self.previous_minute_bars = {}          #   Kept so late revisions of the last completed bucket still apply
+        self.seeded = False
+        self.pending = deque(maxlen=pending_limit)  #   Live bars that arrive before seed() runs
+        self.version = 0
+        self.lock = threading.Lock()            #   seed() runs on the candle thread, updates on the websocket thread
+
+    def seed(self, bars):   #   Fold history once, then replay live bars buffered while it was loading
+        horizon = None
+        if bars:
+            horizon = bars[-1][0] - (self.depth + 1) * self.interval    #   Older bars cannot reach the ring
+        with self.lock:
+            for bar in bars:
+                if horizon is None or bar[0] >= horizon:
+                    self._fold(*bar)
+            self.seeded = True
+            while self.pending:
+                self._fold(*self.pending.popleft())
+            self.version += 1
+
+    def update_bar(self, minute_ts, open_, high, low, close):  #   Returns True when the published candles changed
+        with self.lock:
+            if not self.seeded:
+                self.pending.append((minute_ts, open_, high, low, close))
+                return False
+            if self._fold(minute_ts, open_, high, low, close) is not None:
+                self.version += 1
+                return True
+            return False
+
+    def update_tick(self, ts, price):   #   Fold a trade price into the bar of its minute
+        minute_ts = ts - ts % 60
+        bar = self.minute_bars.get(minute_ts)
+        if bar is None:
+            return self.update_bar(minute_ts, price, price, price, price)
+        return self.update_bar(minute_ts, bar[0], max(bar[1], price), min(bar[2], price), price)
+
+    def _fold(self, minute_ts, open_, high, low, close):   #   Returns the bucket_ts that changed, None if nothing did
+        bar = (open_, high, low, close)
+        bucket_ts = minute_ts - minute_ts % self.interval
+
+        if self.bucket_ts is None or bucket_ts > self.bucket_ts:    #   New bucket, close the current one
+            if self.bucket_ts is not None:
+                self.completed.append((self.bucket_ts,) + _combine(self.minute_bars))
+                self.previous_minute_bars = self.minute_bars
+            self.bucket_ts = bucket_ts
+            self.minute_bars = {minute_ts: bar}
+            return bucket_ts
+
+        if bucket_ts == self.bucket_ts:
+            if self.minute_bars.get(minute_ts) == bar:
+                return None
+            self.minute_bars[minute_ts] = bar
+            return bucket_ts
+
+        # Late revision of the bucket that just closed
+        if self.completed and self.completed[-1][0] == bucket_ts:
+            if self.previous_minute_bars.get(minute_ts) == bar:
+                return None
+            self.previous_minute_bars[minute_ts] = bar
+            self.completed[-1] = (bucket_ts,) + _combine(self.previous_minute_bars)
+            return bucket_ts
+        return None
+
+    def bucket(self, bucket_ts):   #   OHLC of the current bucket or the one that just closed
+        if bucket_ts == self.bucket_ts:
+            return _combine(self.minute_bars)
+        if self.completed and self.completed[-1][0] == bucket_ts:
+            return self.completed[-1][1:]
+        return None
+
+    def candles(self):     #   Last `depth` candles including the one still forming, oldest first
+        with self.lock:
+            rows = list(self.completed)
+            if self.bucket_ts is not None:
+                rows.append((self.bucket_ts,) + _combine(self.minute_bars))
+        return rows[-self.depth:]
+
+    def to_frame(self):    #   Same layout as the old resample output: Datetime index, Open/High/Low/Close
+        rows = self.candles()
+        df = pd.DataFrame([row[1:] for row in rows], columns=['Open', 'High', 'Low', 'Close'],
+                          index=pd.to_datetime([row[0] for row in rows], unit='s'))
+        df.index.name = 'Datetime'
+        return df
+
+
+class CandleEngine:     #   Many (instrument, interval, depth) series fed from one pass over 1-minute bars and ticks
+    # Each interval rolls up from the largest subscribed interval of the same instrument that divides
+    # it (15 <- 5 <- 1, 3 <- 1), so every bar costs O(subscribed intervals) and nothing is resampled.
+    # All series share one lock and are driven from the websocket thread, no thread per series.
+
+    def __init__(self, pending_limit=1000):
+        self.series = {}        #   (instrument_key, interval_minutes) -> CandleAggregator
+        self.chains = {}        #   instrument_key -> [(interval_minutes, parent_interval or None)], parents first
+        self.minute_bars = {}   #   instrument_key -> (minute_ts, open, high, low, close) built from ticks
+        self.seeded = set()
+        self.pending = {}       #   instrument_key -> deque of bars that arrived before seed()
+        self.pending_limit = pending_limit
+        self.versions = {}      #   (instrument_key, interval_minutes) -> change counter
+        self.closed_versions = {}   #   (instrument_key, interval_minutes) -> number of buckets that closed
+        self.on_close = None    #   on_close(instrument_key, interval_minutes, candle) for live candles that close
+        self.lock = threading.Lock()
+
+    @property
+    def instruments(self):
+        return self.chains.keys()
+
+    def subscribe(self, instrument_key, interval_minutes, depth=20):
+        with self.lock:
+            key = (instrument_key, interval_minutes)
+            existing = self.series.get(key)
+            if existing is not None:
+                if depth > existing.depth:
+                    existing.depth = depth
+                    existing.completed = deque(existing.completed, maxlen=depth)
+                return
+            aggregator = CandleAggregator(interval_minutes, depth)
+            aggregator.seeded = True    #   Pending bars are buffered per instrument by the engine
+            self.series[key] = aggregator
+            self.versions[key] = 0
+            self.pending.setdefault(instrument_key, deque(maxlen=self.pending_limit))
+
+            intervals = sorted(interval for (instrument, interval) in self.series if instrument == instrument_key)
+            chain = []
+            for interval in intervals:
+                parents = [p for p, _ in chain if interval % p == 0]
+                chain.append((interval, parents[-1] if parents else None))
+            self.chains[instrument_key] = chain
+
+    def unsubscribe(self, instrument_key, interval_minutes=None):
+        with self.lock:
+            for key in [k for k in self.series if k[0] == instrument_key and interval_minutes in (None, k[1])]:
+                del self.series[key]
+                del self.versions[key]
+                self.closed_versions.pop(key, None)
+            chain = [interval for (instrument, interval) in sorted(self.series) if instrument == instrument_key]
+            if not chain:
+                self.chains.pop(instrument_key, None)
+                self.pending.pop(instrument_key, None)
+                self.minute_bars.pop(instrument_key, None)
+                self.seeded.discard(instrument_key)
+                return
+            rebuilt = []
+            for interval in chain:
+                parents = [p for p, _ in rebuilt if interval % p == 0]
+                rebuilt.append((interval, parents[-1] if parents else None))
+            self.chains[instrument_key] = rebuilt
+
+    def seed(self, instrument_key, bars):  #   Fold history for one instrument, then the live bars buffered meanwhile
+        with self.lock:
+            if instrument_key not in self.chains:
+                return
+            for bar in bars:
+                self._fold(instrument_key, *bar)
+            self.seeded.add(instrument_key)
+            pending = self.pending.get(instrument_key)
+            while pending:
+                self._fold(instrument_key, *pending.popleft())
+
+    def update_bar(self, instrument_key, minute_ts, open_, high, low, close):  #   Returns the intervals that changed
+        with self.lock:
+            if instrument_key not in self.chains:
+                return []
+            if instrument_key not in self.seeded:
+                self.pending[instrument_key].append((minute_ts, open_, high, low, close))
+                return []
+            return self._fold(instrument_key, minute_ts, open_, high, low, close)
+
+    def update_tick(self, instrument_key, ts, price):  #   Fold a trade into its 1-minute bar, then into every interval
+        if instrument_key not in self.chains:
+            return []
+        minute_ts = ts - ts % 60
+        bar = self.minute_bars.get(instrument_key)
+        if bar is None or bar[0] != minute_ts:
+            bar = (minute_ts, price, price, price, price)
+        else:
+            bar = (minute_ts, bar[1], max(bar[2], price), min(bar[3], price), price)
+        self.minute_bars[instrument_key] = bar
+        return self.update_bar(instrument_key, *bar)
+
+    def _fold(self, instrument_key, minute_ts, open_, high, low, close):
+        changed_buckets = {None: minute_ts}     #   interval -> bucket_ts that changed, None is the raw 1-minute input
+        changed = []
+        for interval, parent in self.chains[instrument_key]:
+            if parent not in changed_buckets:
+                continue
+            source_ts = changed_buckets[parent]
+            ohlc = (open_, high, low, close) if parent is None else self.series[(instrument_key, parent)].bucket(source_ts)
+            if ohlc is None:
+                continue
+            aggregator = self.series[(instrument_key, interval)]
+            previous_ts = aggregator.bucket_ts
+            bucket_ts = aggregator._fold(source_ts, *ohlc)
+            if bucket_ts is not None:
+                changed_buckets[interval] = bucket_ts
+                self.versions[(instrument_key, interval)] += 1
+                changed.append(interval)
+                if previous_ts is not None and bucket_ts != previous_ts:    #   A bucket closed, or the one that closed was revised
+                    key = (instrument_key, interval)
+                    self.closed_versions[key] = self.closed_versions.get(key, 0) + 1
+                    if bucket_ts > previous_ts and self.on_close is not None and instrument_key in self.seeded:    #   History folded by seed() is not announced
+                        self.on_close(instrument_key, interval, aggregator.completed[-1])
+        return changed
+
+    def version(self, instrument_key, interval_minutes):
+        return self.versions.get((instrument_key, interval_minutes), 0)
+
+    def closed_version(self, instrument_key, interval_minutes):    #   Changes only when closed buckets change, not on every tick
+        return self.closed_versions.get((instrument_key, interval_minutes), 0)
+
+    def candles(self, instrument_key, interval_minutes, forming=True):    #   forming=False leaves out the bucket still open
+        aggregator = self.series[(instrument_key, interval_minutes)]
+        with self.lock:
+            rows = list(aggregator.completed)
+            if forming and aggregator.bucket_ts is not None:
+                rows.append((aggregator.bucket_ts,) + _combine(aggregator.minute_bars))
+        return rows[-aggregator.depth:]
+
+    def to_frame(self, instrument_key, interval_minutes, forming=True):
+        rows = self.candles(instrument_key, interval_minutes, forming)
+        df = pd.DataFrame([row[1:] for row in rows], columns=['Open', 'High', 'Low', 'Close'],
+                          index=pd.to_datetime([row[0] for row in rows], unit='s'))
+        df.index.name = 'Datetime'
+        return df
+
+    def forming_frame(self, frame, instrument_key, interval_minutes):    #   to_frame(), reusing a frame built since the last closed_version change
+        # Only the forming row can differ: the same frame comes back when it did not, otherwise a
+        # new frame sharing the index, so frames already handed out are never modified
+        aggregator = self.series[(instrument_key, interval_minutes)]
+        with self.lock:
+            bucket_ts = aggregator.bucket_ts
+            row = _combine(aggregator.minute_bars) if bucket_ts is not None else None
+        if row is None or frame is None or not len(frame) or frame.index.asi8[-1] != bucket_ts * 1_000_000_000:
+            return self.to_frame(instrument_key, interval_minutes)
+        values = frame.to_numpy()
+        if tuple(values[-1]) == row:
+            return frame
+        values = values.copy()
+        values[-1] = row
+        return pd.DataFrame(values, index=frame.index, columns=frame.columns)
@@ -1,158 +1,192 @@
 import pandas as pd
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import requests
 import time 
-
-def fetch_historical_data(instrument_key):
+from candle_builder import CandleEngine, bars_from_frame, IST_OFFSET_SECONDS
+from candle_store import CandleStore
+from endpoints import api_url
+from http_client import HTTP
+from metrics import METRICS
+from event_bus import TOPIC_SPOT, TOPIC_SNAPSHOT, candle_topic
+
+# Candle engine subscriptions: every interval for the index and for the ATM call and put
+CANDLE_INSTRUMENT = "NSE_INDEX|Nifty 50"
+CANDLE_INTERVALS = (1, 3, 5, 15)  # in minutes
+CANDLE_DEPTH = 20
+PUBLISHED_INTERVAL = 5  # market_data['complete_candle_data'] holds the Nifty candles of this interval, forming one last
+
+def parse_candles(candles_data):    # Vectorized parse of [[timestamp, open, high, low, close, ...], ...] into Date/Time/OHLC
+    standard_columns = ['Date', 'Time', 'Open', 'High', 'Low', 'Close']
+    if not candles_data:
+        return pd.DataFrame(columns=standard_columns)
+
+    raw = pd.DataFrame([row[:5] for row in candles_data], columns=['Timestamp', 'Open', 'High', 'Low', 'Close'])
+    stamps = pd.to_datetime(raw['Timestamp'], errors='coerce')  # One parse for the whole column
+    valid = stamps.notna()  # Rows whose timestamp failed to parse are skipped
+    raw, stamps = raw[valid], stamps[valid]
+    if stamps.dt.tz is not None:
+        stamps = stamps.dt.tz_localize(None)  # Keep IST wall-clock time, drop the +05:30 offset
+
+    return pd.DataFrame({
+        'Date': stamps.dt.date,
+        'Time': stamps.dt.strftime('%H:%M'),
+        'Open': raw['Open'].astype(float),
+        'High': raw['High'].astype(float),
+        'Low': raw['Low'].astype(float),
+        'Close': raw['Close'].astype(float),
+    })[standard_columns]
+
+def get_candles(url):  # Candles of a historical/intraday response, raises on an error status or error body
+    response = HTTP.get(url, headers={'accept': 'application/json', 'Api-Version': '2.0'})
+    response.raise_for_status()
+    body = response.json()
+    if body.get('status') != 'success':
+        raise Exception(f"Candle request failed: {body.get('errors')}")
+    return body.get('data', {}).get('candles', [])
+
+def fetch_historical_data(instrument_key, candle_store=None):    # Raises when the window cannot be downloaded
     india_tz = ZoneInfo("Asia/Kolkata")
     current_date = datetime.now(india_tz)
-    from_date = (current_date - timedelta(days=10)).strftime('%Y-%m-%d')
+    window_start = (current_date - timedelta(days=10)).strftime('%Y-%m-%d')
     to_date = current_date.strftime('%Y-%m-%d')
+    candle_store = candle_store or CandleStore()
     
-    url = f"https://api.upstox.com/v2/historical-candle/{instrument_key}/1minute/{to_date}/{from_date}"
-    headers = {'accept': 'application/json', 'Api-Version': '2.0'}
+    # Only days after the recorded coverage are requested, earlier ones are read from disk. Coverage is
+    # written only after a download succeeded, stored intraday bars alone never count as history
+    covered = candle_store.covered(instrument_key, '1minute')
+    if covered is None or covered[0] > window_start:
+        from_date = window_start
+    else:
+        from_date = max(covered[1], window_start)
     
-    try:
-        response = requests.get(url, headers=headers).json()
-        candles_data = response.get('data', {}).get('candles', [])
-        
-        # Process historical data directly
-        processed_rows = []
-        for row in candles_data:
-            dt = pd.to_datetime(row[0], errors='coerce')  # First element is datetime
-            if pd.isna(dt):  # If parsing failed, skip this row
-                continue
-            processed_rows.append([dt.date(), dt.strftime('%H:%M'), float(row[1]), float(row[2]), float(row[3]), float(row[4])])
-        
-        df = pd.DataFrame(processed_rows, columns=['Date', 'Time', 'Open', 'High', 'Low', 'Close'])
-
-        # Standardize DataFrame directly here
-        if df.empty:
-            return pd.DataFrame(columns=['Date', 'Time', 'Open', 'High', 'Low', 'Close'])
-        
-        # Standardize columns 
-        df['Date'] = pd.to_datetime(df['Date']).dt.date
-        
-        # Add datetime column for sorting
-        df['Datetime'] = pd.to_datetime(df['Date'].astype(str) + ' ' + df['Time'])
-        
-        # Sort by datetime in descending order
-        df = df.sort_values('Datetime', ascending=False)
-        
-        return df[['Date', 'Time', 'Open', 'High', 'Low', 'Close']]
+    if covered is None or covered[0] > window_start or covered[1] != to_date:
+        url = api_url(f"/v2/historical-candle/{instrument_key}/1minute/{to_date}/{from_date}")
+        # Merged rather than appended, so days missing before bars already stored get filled
+        candle_store.merge(instrument_key, '1minute', bars_from_frame(parse_candles(get_candles(url))))
+        candle_store.set_covered(instrument_key, '1minute', from_date if covered is None else min(covered[0], from_date), to_date)
     
-    except Exception as e:
-        print(f"Error fetching historical data: {e}")
-        return pd.DataFrame()
+    # Newest first, as before
+    return candle_store.to_frame(instrument_key, '1minute', since=int(pd.Timestamp(window_start).timestamp()))
 
 def fetch_intraday_data(instrument_key):
-    url = f"https://api.upstox.com/v2/historical-candle/intraday/{instrument_key}/1minute"
-    headers = {'accept': 'application/json', 'Api-Version': '2.0'}
+    url = api_url(f"/v2/historical-candle/intraday/{instrument_key}/1minute")
     
     try:
-        response = requests.get(url, headers=headers).json()
-        candles_data = response.get('data', {}).get('candles', [])
-        
-        # Process intraday data directly
-        processed_rows = []
-        for row in candles_data:
-            dt = pd.to_datetime(row[0], errors='coerce')  # First element is datetime
-            if pd.isna(dt):  # If parsing failed, skip this row
-                continue
-            processed_rows.append([dt.date(), dt.strftime('%H:%M'), float(row[1]), float(row[2]), float(row[3]), float(row[4])])
-        
-        df = pd.DataFrame(processed_rows, columns=['Date', 'Time', 'Open', 'High', 'Low', 'Close'])
-
-        # Standardize DataFrame directly here
-        if df.empty:
-            return pd.DataFrame(columns=['Date', 'Time', 'Open', 'High', 'Low', 'Close'])
-
-        # Standardize columns 
-        df['Date'] = pd.to_datetime(df['Date']).dt.date
-        
-        return df[['Date', 'Time', 'Open', 'High', 'Low', 'Close']]
+        return parse_candles(get_candles(url))
     
     except Exception as e:
         print(f"Error fetching intraday data: {e}")
         return pd.DataFrame()
 
 
-def fetch_websocket_data(market_data):
-    # Convert to DataFrame from 'websocket_candle_data' in market_data
-    df = market_data.get('websocket_candle_data')
-    
-    # Create a copy of the DataFrame to avoid modifying the original data
-    df = df.copy()  
-    
-    # Ensure time format consistency:
-    # Replace any space-separated time with colon-separated format
-    df['Time'] = df['Time'].apply(lambda x: x.replace(" ", ":") if isinstance(x, str) else x)
-    
-    # Convert to datetime format, ensure format is %H:%M:%S and handle errors properly
-    # Coerce errors to NaT and then format the datetime object to '%H:%M'
-    df['Time'] = pd.to_datetime(df['Time'], format='%H:%M:%S', errors='coerce').dt.strftime('%H:%M')
-    
-    # Ensure the DataFrame has the required column names and order
-    standard_columns = ['Date', 'Time', 'Open', 'High', 'Low', 'Close']
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    
-    return df[standard_columns]
+def seed_instruments(engine, instrument_keys, candle_store):    # History and intraday for every key concurrently, then seed the engine
+    historical_futures = {key: HTTP.submit(fetch_historical_data, key, candle_store) for key in instrument_keys}
+    intraday_futures = {key: HTTP.submit(fetch_intraday_data, key) for key in instrument_keys}
 
-def fetch_candle_data(market_data):
-    import pandas as pd
+    seeded = {}
+    for key in instrument_keys:
+        intraday_df = intraday_futures[key].result()
+        try:
+            historical_df = historical_futures[key].result()  # Local read plus a delta request
+        except Exception as e:  # Seed from today alone; persisting it now would hide the missing days
+            METRICS.increment('candle_errors')
+            print(f"Error fetching historical data for {key}: {e}")
+            historical_df = None
+
+        # Persist the intraday bars that have already closed, behind complete history only
+        if historical_df is not None:
+            now_ist = int(time.time()) + IST_OFFSET_SECONDS
+            candle_store.append(key, '1minute', [bar for bar in bars_from_frame(intraday_df) if bar[0] + 60 <= now_ist])
+        else:
+            historical_df = pd.DataFrame(columns=intraday_df.columns)
+
+        engine.seed(key, sorted(bars_from_frame(historical_df) + bars_from_frame(intraday_df)))
+        seeded[key] = (historical_df, intraday_df)
+    return seeded
+
+def backfill_instruments(engine, instrument_keys, since_ts, candle_store=None):    # Intraday bars from since_ts (IST seconds) into the engine after a feed gap
+    intraday_futures = {key: HTTP.submit(fetch_intraday_data, key) for key in instrument_keys}
+    now_ist = int(time.time()) + IST_OFFSET_SECONDS
+    folded = 0
+    for key, future in intraday_futures.items():
+        bars = [bar for bar in bars_from_frame(future.result()) if bar[0] >= since_ts]
+        for bar in bars:
+            engine.update_bar(key, *bar)
+        if candle_store is not None:
+            candle_store.append(key, '1minute', [bar for bar in bars if bar[0] + 60 <= now_ist])
+        folded += len(bars)
+    return folded
+
+def atm_option_keys(market_data):   # ATM call and put from the option chain around the current spot
+    option_chain = market_data.get('nifty_option_chain')
+    spot = market_data.get('nifty_spot_price')
+    if option_chain is None or not spot:
+        return []
+    atm_strike = round(spot / 50) * 50
+    return [key for key, strike in zip(option_chain.instrument_keys, option_chain.strikes) if strike == atm_strike]
+
+def register_candle_engine(market_data):    # Index candle engine in market_data, every interval, closes announced on the bus
+    engine = CandleEngine()
+    for interval in CANDLE_INTERVALS:
+        engine.subscribe(CANDLE_INSTRUMENT, interval, CANDLE_DEPTH)
+    events = market_data.get('events')
+    if events is not None:  # Announce every live candle that closes, for every subscribed interval
+        engine.on_close = lambda key, interval, candle: events.publish(candle_topic(key, interval), candle)
+    market_data['candle_engine'] = engine
+    return engine
+
+def fetch_candle_data(market_data, ready=None):   # ready: threading.Event set once the index candles are seeded
     import time
 
-    instrument_key = "NSE_INDEX|Nifty 50"
-    candles_count = 20
-    time_interval = 5  # in minutes
-    historical_candle_fetched = False
+    # Register the engine first so websocket bars arriving during the download are buffered
+    engine = register_candle_engine(market_data)
+    events = market_data.get('events')
+    candle_store = CandleStore()
     while True:
-        time.sleep(2)
         try:
-            if historical_candle_fetched == False : 
-                historical_df = fetch_historical_data(instrument_key)
-                market_data['historical_candle_data'] = historical_df  # Update historical candle data
-                historical_candle_fetched = True 
-            else : historical_df = market_data['historical_candle_data']
-            
-            # Fetch intraday data
-            intraday_df = fetch_intraday_data(instrument_key)
+            # Seed once, from here on the websocket thread folds each new bar into every interval
+            started = time.perf_counter_ns()
+            historical_df, intraday_df = seed_instruments(engine, [CANDLE_INSTRUMENT], candle_store)[CANDLE_INSTRUMENT]
+            market_data['historical_candle_data'] = historical_df  # Update historical candle data
             market_data['intraday_candle_data'] = intraday_df  # Update intraday candle data
-
-            # Fetch websocket data by passing market_data
-            websocket_df = fetch_websocket_data(market_data)  # Fetch websocket data and format it
-
-            # Combine historical, intraday, and websocket data
-            dfs = [df for df in [historical_df, intraday_df, websocket_df] if not df.empty]
-            if not dfs:
-                continue
-
-            # Combine all the data sources and clean up
-            combined_df = pd.concat(dfs, ignore_index=True)
-            
-            # Add datetime column for resampling
-            combined_df['Datetime'] = pd.to_datetime(combined_df['Date'].astype(str) + ' ' + combined_df['Time'])
-            combined_df = combined_df.sort_values('Datetime', ascending=False)
-            combined_df = combined_df.drop_duplicates(subset=['Datetime'], keep='first')
-
-            # Set datetime as index for resampling
-            combined_df.set_index('Datetime', inplace=True)
-
-            # Resample data to the specified time interval
-            resampled_df = combined_df.resample(f'{time_interval}min').agg({
-                'Open': 'first',
-                'High': 'max',
-                'Low': 'min',
-                'Close': 'last'
-            }).dropna()
-
-            # Take only the last candles_count candles
-            market_data['complete_candle_data'] = resampled_df.tail(candles_count)
+            market_data['complete_candle_data'] = engine.to_frame(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+            market_data['complete_candle_closed'] = engine.closed_version(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+            if market_data.get('snapshots') is not None:
+                snapshot = market_data['snapshots'].publish(complete_candle_data=market_data['complete_candle_data'])
+                if events is not None: events.publish(TOPIC_SNAPSHOT, snapshot)
+            METRICS.histogram('candle_seed').record(time.perf_counter_ns() - started)
+
+            # History is complete on disk, the websocket thread appends each bar as it closes
+            market_data['candle_store'] = candle_store
+            if ready is not None: ready.set()
+            break
 
         except KeyboardInterrupt:
             print("Shutting down...")  # Gracefully handle keyboard interrupt
-            break
+            return
         except Exception as e:
+            METRICS.increment('candle_errors')
             print(f"Error in fetch_candle_data: {e}")
             time.sleep(5)  # Wait before retrying to avoid rapid error loops
+
+    # ATM options need the option chain and a first spot tick from the websocket
+    option_keys = atm_option_keys(market_data)
+    deadline = time.monotonic() + 30
+    if not option_keys and events is not None:
+        with events.subscribe(TOPIC_SPOT, maxsize=1) as spot_updates:  # Woken by the first spot tick instead of polling
+            option_keys = atm_option_keys(market_data)
+            while not option_keys and time.monotonic() < deadline:
+                spot_updates.get(timeout=deadline - time.monotonic())
+                option_keys = atm_option_keys(market_data)
+    while not option_keys and time.monotonic() < deadline:
+        time.sleep(1)
+        option_keys = atm_option_keys(market_data)
+
+    try:
+        for key in option_keys:
+            for interval in CANDLE_INTERVALS:
+                engine.subscribe(key, interval, CANDLE_DEPTH)
+        seed_instruments(engine, option_keys, candle_store)
+    except Exception as e:
+        METRICS.increment('candle_errors')
+        print(f"Error seeding option candles: {e}")
@@ -0,0 +1,121 @@
+#   candle_store.py
+#   Append-only, columnar on-disk candle store keyed by (instrument, interval).
+#   Each series is a directory with one raw little-endian file per column; the ts column
+#   (IST wall-clock epoch seconds, ascending) doubles as the time index. coverage.json records
+#   the date range a history download actually covered, which the last bar alone cannot prove.
+
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+CANDLE_DIR = os.path.join('cache', 'candles')
+COLUMNS = (('ts', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'))
+
+
+def series_name(instrument_key, interval):     #   "NSE_INDEX|Nifty 50", "1minute" -> "NSE_INDEX_Nifty_50__1minute"
+    return f"{instrument_key.replace('|', '_').replace(' ', '_')}__{interval}"
+
+
+class CandleStore:
+
+    def __init__(self, root=CANDLE_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        self._last_ts = {}      #   Cached last timestamp per series, avoids touching disk on every append
+
+    def _path(self, instrument_key, interval, column):
+        return os.path.join(self.root, series_name(instrument_key, interval), f"{column}.bin")
+
+    def _length(self, instrument_key, interval):    #   Rows common to all columns, a torn append leaves some columns longer
+        lengths = []
+        for column, dtype in COLUMNS:
+            path = self._path(instrument_key, interval, column)
+            lengths.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+        return min(lengths)
+
+    def last_timestamp(self, instrument_key, interval):
+        key = (instrument_key, interval)
+        if key not in self._last_ts:
+            length = self._length(instrument_key, interval)
+            if length == 0:
+                self._last_ts[key] = None
+            else:
+                ts = np.memmap(self._path(instrument_key, interval, 'ts'), dtype='<i8', mode='r', shape=(length,))
+                self._last_ts[key] = int(ts[-1])
+        return self._last_ts[key]
+
+    def append(self, instrument_key, interval, bars):   #   bars: ascending (ts, open, high, low, close), only newer rows are written
+        with self.lock:
+            last_ts = self.last_timestamp(instrument_key, interval)
+            rows = [bar for bar in bars if last_ts is None or bar[0] > last_ts]
+            if not rows:
+                return 0
+            length = self._length(instrument_key, interval)
+            os.makedirs(os.path.dirname(self._path(instrument_key, interval, 'ts')), exist_ok=True)
+            for position, (column, dtype) in enumerate(COLUMNS):
+                path = self._path(instrument_key, interval, column)
+                values = np.array([row[position] for row in rows], dtype=dtype)
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+                    file.truncate(length * values.itemsize)     #   Drop any torn tail before appending
+                    file.seek(0, os.SEEK_END)
+                    file.write(values.tobytes())
+            self._last_ts[(instrument_key, interval)] = int(rows[-1][0])
+            return len(rows)
+
+    def merge(self, instrument_key, interval, bars):   #   Like append, but bars older than the stored ones fill gaps (rewrites the series)
+        with self.lock:
+            columns = {column: np.array(values) for column, values in self.load(instrument_key, interval).items()}
+            if bars:
+                new = np.array(bars, dtype=np.float64)
+                columns = {column: np.concatenate([columns[column], new[:, position].astype(dtype)])
+                           for position, (column, dtype) in enumerate(COLUMNS)}
+            # Downloaded bars come last, keep them where a timestamp is already stored
+            ts_reversed = columns['ts'][::-1]
+            _, first = np.unique(ts_reversed, return_index=True)
+            keep = len(ts_reversed) - 1 - first
+            os.makedirs(os.path.dirname(self._path(instrument_key, interval, 'ts')), exist_ok=True)
+            for column, dtype in COLUMNS:
+                path = self._path(instrument_key, interval, column)
+                with open(path + '.tmp', 'wb') as file:
+                    file.write(columns[column][keep].astype(dtype).tobytes())
+                os.replace(path + '.tmp', path)
+            self._last_ts[(instrument_key, interval)] = int(columns['ts'][keep][-1]) if len(keep) else None
+            return len(keep)
+
+    def covered(self, instrument_key, interval):   #   (from_date, to_date) a history download covered, None if unknown
+        try:
+            with open(os.path.join(self.root, series_name(instrument_key, interval), 'coverage.json')) as file:
+                coverage = json.load(file)
+            return coverage['from'], coverage['to']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set_covered(self, instrument_key, interval, from_date, to_date):   #   'YYYY-MM-DD' dates, after the bars are on disk
+        directory = os.path.join(self.root, series_name(instrument_key, interval))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'coverage.json.tmp'), 'w') as file:
+            json.dump({'from': from_date, 'to': to_date}, file)
+        os.replace(os.path.join(directory, 'coverage.json.tmp'), os.path.join(directory, 'coverage.json'))
+
+    def load(self, instrument_key, interval, since=None):   #   Dict of read-only memory-mapped column arrays from `since` onwards
+        length = self._length(instrument_key, interval)
+        if length == 0:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in COLUMNS}
+        columns = {column: np.memmap(self._path(instrument_key, interval, column), dtype=dtype, mode='r', shape=(length,))
+                   for column, dtype in COLUMNS}
+        start = 0 if since is None else int(np.searchsorted(columns['ts'], since, side='left'))
+        return {column: values[start:] for column, values in columns.items()}
+
+    def to_frame(self, instrument_key, interval, since=None):  #   Date/Time/OHLC frame, newest first like fetch_historical_data
+        columns = self.load(instrument_key, interval, since)
+        stamps = pd.to_datetime(np.asarray(columns['ts'])[::-1], unit='s')
+        return pd.DataFrame({
+            'Date': stamps.date,
+            'Time': stamps.strftime('%H:%M'),
+            'Open': np.asarray(columns['open'])[::-1],
+            'High': np.asarray(columns['high'])[::-1],
+            'Low': np.asarray(columns['low'])[::-1],
+            'Close': np.asarray(columns['close'])[::-1],
+        })
@@ -0,0 +1,276 @@
+#   connection_manager.py
+#   Spreads feed subscriptions over N websocket connections ("shards"), each with its own thread
+#   and event loop, all handing frames to one callback that merges them into the shared market
+#   state. Keys stay on the shard they were first assigned to (the least loaded one), so
+#   sub/unsub/change_mode go to exactly one socket, and each shard keeps its own health and
+#   throughput stats.
+#   Every shard is supervised: a dropped socket is reopened with exponential backoff (fresh
+#   authorize, same token), the subscription set is resent, on_reconnect gets a chance to
+#   backfill what was missed, and the time from drop to first frame is recorded.
+#   Receiving and processing are split: the receive coroutine only reads the socket and queues
+#   frames (see ingest_queue.py), a processing thread per shard decodes and applies them in batches.
+
+import asyncio
+import random
+import ssl
+import threading
+import time
+from collections import defaultdict, deque
+import websockets
+import MarketDataFeed_pb2 as pb
+from feed_decoder import decode_feed_response
+from ingest_queue import IngestQueue
+from metrics import METRICS
+from subscription_manager import subscription_message
+
+RATE_WINDOW_SECONDS = 10   #   frames_per_second is averaged over about this long
+
+
+class FeedShard:
+
+    def __init__(self, shard_id, authorize, handle_frame, on_reconnect=None, backoff=(0.5, 30.0), on_message=None,
+                 decode=decode_feed_response, queue_size=256, policy='block', max_batch=32):
+        self.shard_id = shard_id
+        self.authorize = authorize          #   () -> authorized feed uri, a fresh one per connection
+        self.handle_frame = handle_frame    #   handle_frame(shard, frame, frame_bytes) with a DecodedFrame, on the processing thread
+        self.on_reconnect = on_reconnect    #   on_reconnect(shard, last_frame_wall), blocking calls allowed
+        self.on_message = on_message        #   on_message(shard, message) for every raw frame, on the receiving thread
+        # Frames wait here between recv() and handle_frame, None when there is nothing to process
+        self.ingest = IngestQueue(decode, queue_size, policy, max_batch) if handle_frame is not None else None
+        self.processor = None
+        self.backoff_initial, self.backoff_max = backoff
+        self.stopped = False
+        self.subscriptions = {}             #   instrument_key -> mode
+        self.lock = threading.Lock()
+        self.loop = None
+        self.websocket = None
+        self.thread = None
+        # Health and throughput
+        self.connected = False
+        self.connects = 0
+        self.frames = 0
+        self.bytes = 0
+        self.errors = 0
+        self.disconnects = 0
+        self.last_frame_at = None
+        self.last_frame_wall = None         #   time.time() of the last frame, to size the gap after a drop
+        self.disconnected_at = None         #   monotonic time of the drop, cleared by the first frame after it
+        self.last_recovery_ms = None
+        self.recovery = METRICS.histogram('feed_recovery', unit='ms')
+        # (monotonic, frames) about once a second from the receive loop, stats() only reads it
+        self._rate_samples = deque([(time.monotonic(), 0)], maxlen=RATE_WINDOW_SECONDS + 1)
+        self.recv_wait = METRICS.histogram(f'shard{shard_id}_recv_wait')
+        self.decode_batch = METRICS.histogram('decode_batch')     #   Decode and merge of one ingest batch, 'decode' is per frame
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def _send(self, payload):  #   Thread-safe, dropped while disconnected (the set is resent on connect)
+        websocket, loop = self.websocket, self.loop
+        if websocket is not None and loop is not None:
+            asyncio.run_coroutine_threadsafe(websocket.send(payload), loop)
+
+    def subscribe(self, instrument_keys, mode='full'):
+        with self.lock:
+            self.subscriptions.update(dict.fromkeys(instrument_keys, mode))
+            self._send(subscription_message("sub", instrument_keys, mode))
+
+    def unsubscribe(self, instrument_keys):
+        with self.lock:
+            for key in instrument_keys:
+                self.subscriptions.pop(key, None)
+            self._send(subscription_message("unsub", instrument_keys))
+
+    def change_mode(self, instrument_keys, mode):
+        with self.lock:
+            self.subscriptions.update(dict.fromkeys(instrument_keys, mode))
+            self._send(subscription_message("change_mode", instrument_keys, mode))
+
+    async def connect(self):   #   Open the socket and (re)send the whole subscription set
+        feed_uri = self.authorize()
+        ssl_context = None  # Plain ws:// is only used against a local mock server
+        if feed_uri.startswith('wss://'):
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        websocket = await websockets.connect(feed_uri, ssl=ssl_context, max_size=None)
+        with self.lock:
+            self.websocket = websocket
+            grouped = defaultdict(list)
+            for key, mode in self.subscriptions.items():
+                grouped[mode].append(key)
+        for mode, keys in grouped.items():
+            await websocket.send(subscription_message("sub", keys, mode))
+        self.connected = True
+        self.connects += 1
+        return websocket
+
+    async def run(self):   #   Receive side: read the socket and queue, never process inline
+        self.loop = asyncio.get_running_loop()
+        websocket = await self.connect()
+        try:
+            if self.disconnected_at is not None and self.on_reconnect is not None:
+                # Frames queue up in the socket meanwhile, the loop keeps answering pings
+                await self.loop.run_in_executor(None, self.on_reconnect, self, self.last_frame_wall)
+            while True:
+                try:
+                    waiting = time.perf_counter_ns()
+                    message = await websocket.recv()
+                    self.recv_wait.record(time.perf_counter_ns() - waiting)
+                    self.frames += 1
+                    self.bytes += len(message)
+                    self.last_frame_at = time.monotonic()
+                    self.last_frame_wall = time.time()
+                    if self.last_frame_at - self._rate_samples[-1][0] >= 1.0:
+                        self._rate_samples.append((self.last_frame_at, self.frames))
+                    if self.disconnected_at is not None:    #   Recovered: drop to first frame
+                        self.last_recovery_ms = int((self.last_frame_at - self.disconnected_at) * 1000)
+                        self.recovery.record(self.last_recovery_ms)
+                        self.disconnected_at = None
+                        print(f"Websocket shard {self.shard_id} recovered in {self.last_recovery_ms} ms")
+                    if self.on_message is not None:
+                        self.on_message(self, message)
+                    if self.ingest is not None:
+                        await self.ingest.put(message)     #   Waits only under the block policy with a full queue
+
+                except websockets.ConnectionClosed:
+                    raise
+                except Exception as e:  #   One bad frame costs that frame, not a second of feed
+                    self.errors += 1
+                    METRICS.increment('processing_errors')
+                    print(f"Error in websocket receive (shard {self.shard_id}): {e}")
+        finally:
+            self.connected = False
+            self.websocket = None
+            await websocket.close()
+
+    def process_forever(self):     #   Processing thread body: merged batches from the ingest queue until stop()
+        feed_response = pb.FeedResponse()   #   Reused across frames, ParseFromString clears it
+        while not self.stopped:
+            batch = self.ingest.get_batch(timeout=1.0)
+            if batch is None:
+                continue
+            try:
+                started = time.perf_counter_ns()
+                frame, frame_bytes = self.ingest.merge(batch, feed_response)
+                self.decode_batch.record(time.perf_counter_ns() - started)
+                self.handle_frame(self, frame, frame_bytes)
+            except Exception as e:
+                self.errors += 1
+                METRICS.increment('processing_errors')
+                print(f"Error in websocket processing (shard {self.shard_id}): {e}")
+
+    def run_forever(self):     #   Thread body: private event loop for this shard, reconnecting until stop()
+        if self.ingest is not None and self.processor is None:
+            self.processor = threading.Thread(target=self.process_forever, daemon=True, name=f'feed-process-{self.shard_id}')
+            self.processor.start()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        delay = self.backoff_initial
+        try:
+            while not self.stopped:
+                frames = self.frames
+                try:    loop.run_until_complete(self.run())
+                except Exception as e:  print(f"Websocket shard {self.shard_id} error: {e}")
+                if self.stopped:
+                    break
+                if self.disconnected_at is None:
+                    self.disconnected_at = time.monotonic()
+                self.disconnects += 1
+                METRICS.increment('feed_disconnects')
+                if self.frames > frames:    #   The connection worked, start the backoff over
+                    delay = self.backoff_initial
+                time.sleep(delay * random.uniform(0.8, 1.2))
+                delay = min(delay * 2, self.backoff_max)
+        finally:    loop.close()
+
+    def stop(self):
+        self.stopped = True
+        if self.ingest is not None:
+            self.ingest.close()
+        websocket, loop = self.websocket, self.loop
+        if websocket is not None and loop is not None:
+            asyncio.run_coroutine_threadsafe(websocket.close(), loop)
+
+    def stats(self):   #   Read-only, any number of pollers see the same rate
+        now = time.monotonic()
+        marked_at, marked_frames = self._rate_samples[0]
+        return {
+            'shard': self.shard_id,
+            'connected': self.connected,
+            'connects': self.connects,
+            'instruments': len(self.subscriptions),
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'disconnects': self.disconnects,
+            'last_recovery_ms': self.last_recovery_ms,
+            'frames_per_second': round((self.frames - marked_frames) / (now - marked_at), 2) if now > marked_at else 0.0,
+            'last_frame_age_s': round(now - self.last_frame_at, 3) if self.last_frame_at is not None else None,
+            'recv_wait_p99_ns': self.recv_wait.percentile(99),
+            'ingest': self.ingest.stats() if self.ingest is not None else None,
+        }
+
+
+class ConnectionManager:
+
+    def __init__(self, shard_count, authorize, handle_frame, on_reconnect=None, **shard_options):   #   shard_options: see FeedShard
+        self.shards = [FeedShard(i, authorize, handle_frame, on_reconnect, **shard_options) for i in range(max(1, shard_count))]
+        self.shard_of = {}      #   instrument_key -> FeedShard
+        self.load = {shard: 0 for shard in self.shards}     #   Keys per shard, owned by the manager (shard.subscriptions is the shard's)
+        self.lock = threading.Lock()
+
+    def subscribe(self, instrument_keys, mode='full', shard_id=None):  #   New keys go to the least loaded shard
+        assigned = defaultdict(list)
+        with self.lock:
+            for key in instrument_keys:
+                shard = self.shard_of.get(key)
+                if shard is None:
+                    shard = self.shards[shard_id] if shard_id is not None else min(self.shards, key=self.load.get)
+                    self.shard_of[key] = shard
+                    self.load[shard] += 1   #   Counted right away so the next key balances
+                assigned[shard].append(key)
+        for shard, keys in assigned.items():
+            shard.subscribe(keys, mode)
+
+    def unsubscribe(self, instrument_keys):
+        assigned = defaultdict(list)
+        with self.lock:
+            for key in instrument_keys:
+                shard = self.shard_of.pop(key, None)
+                if shard is not None:
+                    self.load[shard] -= 1
+                    assigned[shard].append(key)
+        for shard, keys in assigned.items():
+            shard.unsubscribe(keys)
+
+    def change_mode(self, instrument_keys, mode):
+        assigned = defaultdict(list)
+        with self.lock:
+            for key in instrument_keys:
+                if key in self.shard_of:
+                    assigned[self.shard_of[key]].append(key)
+        for shard, keys in assigned.items():
+            shard.change_mode(keys, mode)
+
+    def apply(self, subscribe, unsubscribe, change_mode):  #   One StrikeWindow.recentre() result
+        if unsubscribe: self.unsubscribe(unsubscribe)
+        for mode, keys in subscribe.items():
+            self.subscribe(keys, mode)
+        for mode, keys in change_mode.items():
+            self.change_mode(keys, mode)
+
+    def run(self):     #   Blocks: shards 1..N-1 on their own threads, shard 0 on the calling thread
+        for shard in self.shards[1:]:
+            shard.thread = threading.Thread(target=shard.run_forever, daemon=True, name=f'feed-shard-{shard.shard_id}')
+            shard.thread.start()
+        self.shards[0].run_forever()
+        for shard in self.shards[1:]:
+            shard.thread.join()
+
+    def stop(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def stats(self):
+        return [shard.stats() for shard in self.shards]
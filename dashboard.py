@@ -0,0 +1,202 @@
+#   dashboard.py
+#   Live terminal view of spot, the option chain around ATM, the newest candles and feed health.
+#   Each frame is laid out as plain text lines and compared with what is already on screen;
+#   only the changed span of each changed line is rewritten with ANSI cursor moves, in one write.
+#   Redraws follow SnapshotPublisher versions, capped at `fps`, and read the snapshot's
+#   read-only arrays and the candle engine's rows directly, no DataFrame is built per frame.
+
+import os
+import shutil
+import sys
+import time
+import numpy as np
+from datetime import datetime, timezone, timedelta
+from candle_data import CANDLE_INSTRUMENT, PUBLISHED_INTERVAL
+from metrics import METRICS
+
+IST = timezone(timedelta(hours=5, minutes=30))
+_CHAIN_HEADER = (f"{'OI':>8} {'OI chg':>8} {'Volume':>8} {'IV':>6} {'LTP':>8}  {'STRIKE':^9}  "
+                 f"{'LTP':>8} {'IV':>6} {'Volume':>8} {'OI chg':>8} {'OI':>8}")
+
+
+def _number(value, spec='.2f', width=8):  #   Right aligned, '-' for missing values
+    if value is None or value != value:
+        return f"{'-':>{width}}"
+    return f"{value:>{width}{spec}}"
+
+
+def _compact(value, width=8):  #   1234567 -> 12.35L, keeps OI and volume columns narrow
+    if value is None or value != value:
+        return f"{'-':>{width}}"
+    for divisor, suffix in ((1e7, 'Cr'), (1e5, 'L'), (1e3, 'K')):
+        if abs(value) >= divisor:
+            return f"{value / divisor:>{width - len(suffix)}.2f}{suffix}"
+    return f"{value:>{width}.0f}"
+
+
+class ChainLayout:     #   Strike -> (call row, put row) of one option chain layout, rebuilt only when the window moves
+
+    def __init__(self, option_chain):
+        self.instrument_keys = option_chain.instrument_keys
+        self.strikes, inverse = np.unique(option_chain.strikes, return_inverse=True)
+        self.call_row = np.full(len(self.strikes), -1, dtype=np.intp)
+        self.put_row = np.full(len(self.strikes), -1, dtype=np.intp)
+        rows = np.arange(len(option_chain.strikes))
+        self.call_row[inverse[option_chain.is_call]] = rows[option_chain.is_call]
+        self.put_row[inverse[~option_chain.is_call]] = rows[~option_chain.is_call]
+
+
+class Dashboard:
+
+    def __init__(self, data_dict, stream=None, fps=4.0, strikes=5, candle_rows=6, interval=PUBLISHED_INTERVAL):
+        self.data_dict = data_dict
+        self.stream = stream or sys.stdout
+        self.frame_interval = 1.0 / fps
+        self.strikes = strikes          #   Strikes shown either side of ATM
+        self.candle_rows = candle_rows
+        self.interval = interval
+        self.ansi = self.stream.isatty()    #   Redirected output gets whole frames, and only every plain_interval seconds
+        self.plain_interval = 5.0
+        self.screen = []                #   Lines currently on the terminal
+        self.size = None
+        self.layout = None
+        self.last_frames = None         #   (monotonic, frames counter) for the frame rate
+        self.frames_per_second = 0.0
+        self.draws = 0
+        self.bytes_written = 0
+
+    # Content
+
+    def header_lines(self, snapshot):
+        spot = snapshot.nifty_spot_price
+        summary = snapshot.option_analytics or {}
+        pcr_oi, pcr_volume = summary.get('pcr_oi'), summary.get('pcr_volume')
+        return [
+            f"NIFTY 50  {_number(spot, width=10)}    {datetime.now(IST):%H:%M:%S} IST    version {snapshot.version}",
+            f"PCR OI {_number(pcr_oi, width=5)}   PCR volume {_number(pcr_volume, width=5)}   "
+            f"net delta {_compact(summary.get('net_delta'))}   net GEX {_compact(summary.get('net_gamma_exposure'))}",
+        ]
+
+    def chain_lines(self, snapshot):   #   Calls left, puts right, strikes around the one nearest spot
+        option_chain, spot = snapshot.option_chain, snapshot.nifty_spot_price
+        if option_chain is None or not len(option_chain) or spot is None:
+            return ["Option chain: waiting for data"]
+        if self.layout is None or self.layout.instrument_keys is not option_chain.instrument_keys:
+            self.layout = ChainLayout(option_chain)
+        layout = self.layout
+        atm = int(np.argmin(np.abs(layout.strikes - spot)))
+        first, last = max(0, atm - self.strikes), min(len(layout.strikes), atm + self.strikes + 1)
+        ltp, iv, volume = option_chain['LTP'], option_chain['IV'], option_chain['Volume']
+        oi, poi = option_chain['OI'], option_chain['POI']
+        lines = [_CHAIN_HEADER]
+        for index in range(first, last):
+            call, put = layout.call_row[index], layout.put_row[index]
+            call_cells = '-' if call < 0 else (f"{_compact(oi[call])} {_compact(oi[call] - poi[call])} "
+                                               f"{_compact(volume[call])} {_number(iv[call], width=6)} {_number(ltp[call])}")
+            put_cells = '-' if put < 0 else (f"{_number(ltp[put])} {_number(iv[put], width=6)} {_compact(volume[put])} "
+                                             f"{_compact(oi[put] - poi[put])} {_compact(oi[put])}")
+            marker = '>' if index == atm else ' '
+            lines.append(f"{call_cells:>42} {marker}{layout.strikes[index]:^9.0f}{marker} {put_cells:>42}")
+        return lines
+
+    def candle_lines(self):
+        candle_engine = self.data_dict.get('candle_engine')
+        if candle_engine is None:
+            return [f"{self.interval}m candles: waiting for history"]
+        rows = candle_engine.candles(CANDLE_INSTRUMENT, self.interval)[-self.candle_rows:]
+        lines = [f"{self.interval}m candles   {'Open':>10} {'High':>10} {'Low':>10} {'Close':>10}"]
+        for ts, open_, high, low, close in rows:   #   IST wall-clock seconds
+            lines.append(f"{datetime.fromtimestamp(ts, timezone.utc):%d %b %H:%M}  "
+                         f"{open_:>10.2f} {high:>10.2f} {low:>10.2f} {close:>10.2f}")
+        return lines
+
+    def health_lines(self, snapshot):  #   Counters and gauges read one by one, METRICS.snapshot() would summarise every histogram
+        now = time.monotonic()
+        frames = METRICS.counter('frames') + METRICS.counter('offloaded_reads')
+        if self.last_frames is not None and now > self.last_frames[0]:
+            self.frames_per_second = (frames - self.last_frames[1]) / (now - self.last_frames[0])
+        self.last_frames = (now, frames)
+        lag = METRICS.gauge('feed_lag_ms')
+        snapshot_age = now - snapshot.published_at if snapshot.version else None
+        lines = [f"Feed   frames/s {self.frames_per_second:7.1f}   lag {_number(lag, '.0f', 6)} ms"
+                 f" (p99 {METRICS.histogram('feed_lag', unit='ms').percentile(99):.0f})"
+                 f"   errors {METRICS.counter('processing_errors')}"
+                 f"   snapshot age {_number(snapshot_age, '.1f', 5)} s"]
+        connections = self.data_dict.get('feed_connections')
+        for shard in (connections.stats() if connections is not None else []):
+            ingest = shard.get('ingest') or {}
+            lines.append(f"Shard {shard['shard']}  {'up  ' if shard['connected'] else 'DOWN'}  "
+                         f"instruments {shard['instruments']:>4}  frames/s {shard['frames_per_second'] or 0:7.1f}  "
+                         f"last frame {_number(shard['last_frame_age_s'], '.1f', 5)} s  reconnects {max(0, shard['connects'] - 1)}  "
+                         f"queue {ingest.get('depth', 0)}/{ingest.get('max_depth', 0)} max  "
+                         f"dropped {ingest.get('dropped', 0)}  conflated {ingest.get('conflated', 0)}")
+        return lines
+
+    def lines(self, snapshot):
+        return (self.header_lines(snapshot) + [''] + self.chain_lines(snapshot) + [''] +
+                self.candle_lines() + [''] + self.health_lines(snapshot))
+
+    # Output
+
+    def start(self):
+        if not self.ansi:
+            return
+        if os.name == 'nt':
+            os.system('')   #   Once, switches the Windows console to ANSI escape processing
+        self._write('\x1b[?1049h\x1b[?25l\x1b[2J')     #   Alternate screen, hidden cursor
+
+    def close(self):
+        if self.ansi:
+            self._write('\x1b[?25h\x1b[?1049l')     #   Cursor back, original screen restored
+
+    def _write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+        self.bytes_written += len(text)
+
+    def draw(self, lines):     #   Rewrite only what differs from the previous frame
+        if not self.ansi:
+            self._write('\n'.join(lines) + '\n\n')
+            return
+        size = shutil.get_terminal_size()
+        if size != self.size:   #   Resized: nothing on screen can be trusted
+            self.size, self.screen = size, []
+            self._write('\x1b[2J')
+        width, height = size
+        lines = [line[:width].ljust(width) for line in lines[:height]]
+        out = []
+        for row, line in enumerate(lines):
+            old = self.screen[row] if row < len(self.screen) else None
+            if line == old:
+                continue
+            if old is None:
+                start, end = 0, width
+            else:
+                start = next(i for i in range(width) if line[i] != old[i])
+                end = next(i for i in range(width, 0, -1) if line[i - 1] != old[i - 1])
+            out.append(f"\x1b[{row + 1};{start + 1}H{line[start:end]}")
+        for row in range(len(lines), len(self.screen)):     #   Frame got shorter
+            out.append(f"\x1b[{row + 1};1H\x1b[K")
+        self.screen = lines
+        if out:
+            self._write(''.join(out))
+
+    def run(self, stop=None):  #   Blocking loop until stop (a threading.Event) is set or Ctrl+C
+        snapshots = self.data_dict['snapshots']
+        self.start()
+        try:
+            version, shown_at = -1, 0.0
+            while stop is None or not stop.is_set():
+                snapshot = snapshots.wait_for_change(version, timeout=1.0)     #   Idle feed still refreshes ages once a second
+                if not self.ansi and time.monotonic() - shown_at < self.plain_interval:
+                    time.sleep(self.frame_interval)
+                    continue
+                started = time.perf_counter_ns()
+                self.draw(self.lines(snapshot))
+                METRICS.histogram('dashboard_draw').record(time.perf_counter_ns() - started)
+                self.draws += 1
+                version, shown_at = snapshot.version, time.monotonic()
+                #   Frame rate cap, versions published meanwhile collapse into the next draw
+                time.sleep(max(0.0, self.frame_interval - (time.perf_counter_ns() - started) / 1e9))
+        finally:
+            self.close()
@@ -0,0 +1,318 @@
+#   decode_worker.py
+#   Optional decode offload. Websocket threads only copy raw frames into a shared-memory ring;
+#   a worker process parses them and writes the option chain into arrays that live in shared
+#   memory, marking each row with the frame that last touched it. An applier thread in the main
+#   process then copies just the changed rows under a seqlock, so protobuf parsing runs on its
+#   own core and a candle rebuild or analytics holding the GIL here no longer backs frames up.
+#   The shared chain covers every strike of the expiry, so a strike window re-centre in the
+#   main process never has to be coordinated with the worker.
+
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+import numpy as np
+import MarketDataFeed_pb2 as pb
+from feed_decoder import FEED_MODES, Candle, IndexTick, ModeStats, OptionTick, decode_feed_response
+from option_chain import FIELD_COLUMNS, OptionChainStore
+
+RING_BYTES = 16 << 20           #   Roughly 10 s of a 400-strike full-mode feed
+INDEX_KEY = "NSE_INDEX|Nifty 50"
+MAX_INDEX_CANDLES = 8           #   Latest revision of the last 8 I1 minutes, so a slow reader misses none
+_WRAP = 0xFFFFFFFF              #   Length marker: the rest of the ring is padding, continue at offset 0
+_LENGTH = struct.Struct('<I')
+
+
+def layout_size(layout):   #   Bytes for (name, dtype, shape) arrays, each 8-byte aligned
+    return sum((np.dtype(dtype).itemsize * int(np.prod(shape)) + 7) // 8 * 8 for _, dtype, shape in layout)
+
+
+def shared_arrays(buffer, layout, offset=0):   #   name -> ndarray view into buffer, in layout order from offset
+    arrays = {}
+    for name, dtype, shape in layout:
+        array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        arrays[name] = array
+        offset += (array.nbytes + 7) // 8 * 8
+    return arrays
+
+
+class SeqLock:     #   One writer, any number of readers; the counter is odd while a write is in progress
+
+    def __init__(self, counter):   #   1-element uint64 array, usually in shared memory
+        self.counter = counter
+
+    def write_begin(self):
+        self.counter[0] += 1
+
+    def write_end(self):
+        self.counter[0] += 1
+
+    def read(self, func, retries=10000):   #   (func(), version) with no write overlapping the call
+        for attempt in range(retries):
+            version = int(self.counter[0])
+            if not version & 1:
+                result = func()
+                if int(self.counter[0]) == version:
+                    return result, version
+            if attempt > 10:
+                time.sleep(0)      #   Writer is slow, let it run
+        raise TimeoutError("Seqlock writer did not finish")
+
+
+class FrameRing:   #   Length-prefixed frames in shared memory, producers in one process, one consumer
+
+    HEADER = 64     #   uint64 head, tail, pushed, dropped, capacity
+
+    def __init__(self, name=None, size=RING_BYTES):
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=self.HEADER + size if create else 0)
+        self.name = self.shm.name
+        self.counters = np.ndarray(5, dtype=np.uint64, buffer=self.shm.buf)
+        if create:
+            self.counters[:] = (0, 0, 0, 0, size)
+        self.capacity = int(self.counters[4])
+        self.data = self.shm.buf[self.HEADER:self.HEADER + self.capacity]
+        self.lock = threading.Lock()    #   Several shard threads push
+
+    def push(self, message):   #   False (and counted as dropped) when the consumer is a whole ring behind
+        size = _LENGTH.size + len(message)
+        counters, capacity = self.counters, self.capacity
+        with self.lock:
+            head, tail = int(counters[0]), int(counters[1])
+            position = head % capacity
+            pad = capacity - position if capacity - position < size else 0
+            if head + pad + size - tail > capacity:
+                counters[3] += 1
+                return False
+            if pad:
+                if pad >= _LENGTH.size:
+                    _LENGTH.pack_into(self.data, position, _WRAP)
+                head, position = head + pad, 0
+            _LENGTH.pack_into(self.data, position, len(message))
+            self.data[position + _LENGTH.size:position + size] = message
+            counters[0] = head + size     #   Published last, the consumer never sees a half-written frame
+            counters[2] += 1
+        return True
+
+    def pop(self):     #   Oldest frame as bytes, None when empty
+        counters, capacity = self.counters, self.capacity
+        tail = int(counters[1])
+        if tail == int(counters[0]):
+            return None
+        position = tail % capacity
+        if capacity - position < _LENGTH.size or _LENGTH.unpack_from(self.data, position)[0] == _WRAP:
+            tail, position = tail + capacity - position, 0
+        length = _LENGTH.unpack_from(self.data, position)[0]
+        message = bytes(self.data[position + _LENGTH.size:position + _LENGTH.size + length])
+        counters[1] = tail + _LENGTH.size + length
+        return message
+
+    def backlog(self):     #   Bytes pushed but not yet consumed
+        return int(self.counters[0]) - int(self.counters[1])
+
+    def close(self, unlink=False):
+        self.data.release()
+        self.counters = self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def chain_layout(rows):
+    return (
+        ('seq', np.uint64, (1,)),
+        ('frame', np.uint64, (1,)),                 #   Frames applied, the mark of the newest one
+        ('stats', np.uint64, (4,)),                 #   decode_ns, errors, stop flag, worker pid
+        ('mode_stats', np.uint64, (3, len(FEED_MODES))),   #   ModeStats records, bytes, decode_ns per FEED_MODES entry
+        ('index', np.float64, (3,)),                #   ltp, ltt, current_ts
+        ('index_frame', np.uint64, (1,)),
+        ('candles', np.float64, (MAX_INDEX_CANDLES, 6)),   #   ts, open, high, low, close, volume; slot by minute
+        ('values', np.float64, (len(FIELD_COLUMNS), rows)),
+        ('ltt', np.int64, (rows,)),
+        ('row_frame', np.uint64, (rows,)),          #   Frame that last wrote the row
+        ('mode', np.uint8, (rows,)),                #   FEED_MODES index of that record
+    )
+
+
+class SharedChain:     #   Option chain arrays plus the index state, written by the worker only
+
+    def __init__(self, rows, name=None):
+        layout = chain_layout(rows)
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=layout_size(layout) if create else 0)
+        self.name = self.shm.name
+        self.arrays = shared_arrays(self.shm.buf, layout)
+        for field, array in self.arrays.items():
+            setattr(self, field, array)
+        if create:
+            self.values[:] = np.nan
+        self.lock = SeqLock(self.seq)
+
+    def apply(self, frame, store, mode_codes):     #   Worker side: one DecodedFrame, under the seqlock
+        number = int(self.frame[0]) + 1
+        row_of, row_frame, modes = store.row_of, self.row_frame, self.mode
+        self.lock.write_begin()
+        try:
+            for key, tick in frame.options.items():
+                row = row_of.get(key)
+                if row is not None:
+                    store.update(key, tick)
+                    row_frame[row] = number
+                    modes[row] = mode_codes[tick.mode]
+            nifty_tick = frame.index.get(INDEX_KEY)
+            if nifty_tick is not None:
+                for c in nifty_tick.candles:
+                    if c.interval == "I1" and c.ts:
+                        self.candles[c.ts // 60000 % MAX_INDEX_CANDLES] = (c.ts, c.open, c.high, c.low, c.close, c.volume)
+                self.index[:] = (np.nan if nifty_tick.ltp is None else nifty_tick.ltp, nifty_tick.ltt or 0, frame.current_ts)
+                self.index_frame[0] = number
+            self.frame[0] = number
+        finally:
+            self.lock.write_end()
+
+    def close(self, unlink=False):     #   Views must be gone before the block can be closed
+        self.arrays = self.lock = None
+        for field, _, _ in chain_layout(0):
+            setattr(self, field, None)
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def run_worker(ring_name, chain_name, instruments_df, frames_ready, results_ready):    #   Worker process body
+    ring = FrameRing(ring_name)
+    chain = SharedChain(len(instruments_df), chain_name)
+    store = OptionChainStore(instruments_df, buffers=(chain.values, chain.ltt))
+    mode_codes = {mode: code for code, mode in enumerate(FEED_MODES)}
+    response = pb.FeedResponse()
+    mode_stats = ModeStats()    #   Published into the shared block after every batch, read by DecodeOffload.mode_totals()
+    stats = chain.stats
+    stats[3] = multiprocessing.current_process().pid
+    try:
+        while not stats[2]:
+            frames_ready.acquire(timeout=0.5)
+            applied = False
+            while True:
+                message = ring.pop()
+                if message is None:
+                    break
+                started = time.perf_counter_ns()
+                try:
+                    chain.apply(decode_feed_response(message, response, mode_stats), store, mode_codes)
+                    applied = True
+                except Exception as e:
+                    stats[1] += 1
+                    print(f"Decode worker error: {e}")
+                stats[0] += time.perf_counter_ns() - started
+            chain.mode_stats[:] = [[counter[mode] for mode in FEED_MODES]
+                                   for counter in (mode_stats.records, mode_stats.bytes, mode_stats.decode_ns)]
+            if applied:
+                results_ready.release()
+    finally:
+        del store, stats   #   Views into the shared blocks, they must go before close()
+        chain.close()
+        ring.close()
+
+
+class OffloadedFrame(NamedTuple):  #   What the worker applied since the previous read, copied out of shared memory
+    frame: int
+    current_ts: int
+    index: Optional[IndexTick]          #   None when no index record arrived
+    options: list                       #   instrument_keys of the changed rows
+    values: np.ndarray                  #   FIELD_COLUMNS x changed rows
+    ltt: np.ndarray
+    modes: np.ndarray
+
+    def option_tick(self, i):   #   The i-th changed row as an OptionTick, for per-key event subscribers
+        fields = dict(zip(FIELD_COLUMNS.values(), (None if np.isnan(v) else float(v) for v in self.values[:, i])))
+        return OptionTick(ltt=int(self.ltt[i]), mode=FEED_MODES[self.modes[i]], **fields)
+
+
+class DecodeOffload:   #   Main process side: owns the shared memory and the worker process
+
+    def __init__(self, instruments_df, ring_bytes=RING_BYTES):
+        context = multiprocessing.get_context('spawn')     #   No fork of a process with running threads
+        self.instruments = instruments_df.reset_index(drop=True)
+        self.instrument_keys = np.array(self.instruments['instrument_key'].tolist(), dtype=object)
+        self.ring = FrameRing(size=ring_bytes)
+        self.chain = SharedChain(len(self.instruments))
+        self.frames_ready = context.Semaphore(0)
+        self.results_ready = context.Semaphore(0)
+        self.process = context.Process(target=run_worker, name='feed-decoder', daemon=True,
+                                       args=(self.ring.name, self.chain.name, self.instruments, self.frames_ready, self.results_ready))
+        self.seen = 0           #   Newest frame already read
+        self.seen_index = 0
+        self.seen_minute = 0    #   Newest I1 minute already read, it and the one before are read again
+        self.reads = 0
+        self.final_stats = None     #   stats() and mode_totals() as of stop(), the shared blocks are gone after it
+        self.final_mode_totals = None
+
+    def start(self):
+        self.process.start()
+        return self
+
+    def push(self, message):   #   Called from the websocket threads, a memcpy and a semaphore post
+        if self.ring.push(message):
+            self.frames_ready.release()
+
+    def _copy_changes(self):
+        chain = self.chain
+        frame = int(chain.frame[0])
+        rows = np.flatnonzero(chain.row_frame > self.seen)
+        index = None
+        if int(chain.index_frame[0]) > self.seen_index:
+            ltp, ltt, current_ts = chain.index
+            since = self.seen_minute - 60000
+            candles = tuple(Candle("I1", o, h, l, c, int(v), int(ts)) for ts, o, h, l, c, v in sorted(map(tuple, chain.candles))
+                            if ts and ts >= since)
+            index = (IndexTick(None if np.isnan(ltp) else float(ltp), int(ltt), candles), int(current_ts))
+        return frame, int(chain.index_frame[0]), rows, chain.values[:, rows], chain.ltt[rows], chain.mode[rows], index
+
+    def read(self):    #   OffloadedFrame with everything new since the last read, None when nothing is
+        if int(self.chain.frame[0]) == self.seen:
+            return None
+        (frame, index_frame, rows, values, ltt, modes, index), _ = self.chain.lock.read(self._copy_changes)
+        self.seen, self.seen_index = frame, index_frame
+        self.reads += 1
+        nifty_tick, current_ts = index if index is not None else (None, 0)
+        if nifty_tick is not None and nifty_tick.candles:
+            self.seen_minute = nifty_tick.candles[-1].ts
+        return OffloadedFrame(frame, current_ts, nifty_tick, self.instrument_keys[rows].tolist(), values, ltt, modes)
+
+    def wait(self, timeout=1.0):   #   Block until the worker applied something (or timeout)
+        return self.results_ready.acquire(timeout=timeout)
+
+    def stop(self):
+        if self.chain.stats is None:
+            return
+        self.chain.stats[2] = 1
+        self.frames_ready.release()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.final_stats, self.final_mode_totals = self.stats(), self.mode_totals()
+        self.ring.close(unlink=True)
+        self.chain.close(unlink=True)
+
+    def mode_totals(self):     #   The worker's ModeStats counters as (records, bytes, decode_ns) dicts, for ModeStats.add_source()
+        if self.chain.mode_stats is None:
+            return self.final_mode_totals
+        return tuple(dict(zip(FEED_MODES, map(int, row))) for row in self.chain.mode_stats)
+
+    def stats(self):
+        if self.chain.stats is None:
+            return self.final_stats
+        counters, chain_stats = self.ring.counters, self.chain.stats
+        frames = int(self.chain.frame[0])
+        return {
+            'alive': self.process.is_alive(),
+            'frames_pushed': int(counters[2]),
+            'frames_dropped': int(counters[3]),
+            'frames_decoded': frames,
+            'backlog_bytes': self.ring.backlog(),
+            'decode_errors': int(chain_stats[1]),
+            'decode_us_avg': round(int(chain_stats[0]) / frames / 1000, 1) if frames else None,
+            'reads': self.reads,
+        }
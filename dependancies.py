@@ -14,6 +14,7 @@ def main():
         "pyotp",
         "requests",
         "pandas",
+        "pyarrow",
         "pytest-playwright"
     ]
     
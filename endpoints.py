@@ -0,0 +1,14 @@
+#   endpoints.py
+#   Base URLs for the Upstox REST API and the instrument master.
+#   Both can be pointed at a local stand-in (see mock_upstox.py) through environment variables:
+#       UPSTOX_API_URL=http://127.0.0.1:8765
+#       UPSTOX_INSTRUMENTS_URL=http://127.0.0.1:8765/instruments/complete.csv.gz
+
+import os
+
+API_BASE_URL = os.environ.get('UPSTOX_API_URL', 'https://api.upstox.com').rstrip('/')
+INSTRUMENTS_URL = os.environ.get('UPSTOX_INSTRUMENTS_URL', 'https://assets.upstox.com/market-quote/instruments/exchange/complete.csv.gz')
+
+
+def api_url(path):     #   api_url('/v2/market-quote/quotes') -> 'https://api.upstox.com/v2/market-quote/quotes'
+    return f"{API_BASE_URL}{path}"
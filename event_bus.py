@@ -0,0 +1,209 @@
+#   event_bus.py
+#   In-process pub/sub fed by the websocket processors. Publishing never blocks: every subscriber
+#   has its own bounded queue and overflow policy, so a slow consumer loses (or conflates) its own
+#   events instead of stalling the feed thread. Consume with a callback (run on the subscriber's
+#   own thread), a blocking get()/iterator, or `async for`.
+#
+#   Topics:
+#       spot                            Nifty spot price (float), on change
+#       option:<instrument_key>         decoded OptionTick
+#       candle:<instrument_key>:<n>     (bucket_ts, open, high, low, close) when an n-minute candle closes
+#       snapshot                        MarketSnapshot after each publish, see snapshot.py
+#   A topic ending in '*' subscribes by prefix, e.g. 'option:*' or 'candle:NSE_INDEX|Nifty 50:*'.
+
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from metrics import METRICS
+
+POLICIES = ('conflate', 'drop_oldest', 'drop_newest')
+
+TOPIC_SPOT = 'spot'
+TOPIC_SNAPSHOT = 'snapshot'
+
+
+def option_topic(instrument_key):
+    return f'option:{instrument_key}'
+
+def candle_topic(instrument_key, interval_minutes):
+    return f'candle:{instrument_key}:{interval_minutes}'
+
+
+class Subscription:
+    # conflate:     keep only the newest event per topic, a topic that is already queued keeps its place
+    # drop_oldest:  evict the oldest queued event to make room
+    # drop_newest:  reject the incoming event while the queue is full
+
+    def __init__(self, bus, topics, maxsize=1000, policy='conflate', callback=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+        self.bus = bus
+        self.topics = tuple(topics)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.queue = OrderedDict() if policy == 'conflate' else deque()
+        self.condition = threading.Condition()
+        self.async_waiters = []     #   (loop, future) of pending __anext__ calls
+        self.closed = False
+        self.delivered = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.thread = None
+        if callback is not None:
+            self.thread = threading.Thread(target=self._dispatch, args=(callback,), daemon=True,
+                                           name=f"events-{'+'.join(self.topics)}")
+            self.thread.start()
+
+    def put(self, topic, payload):     #   Called on the publisher's thread, never blocks
+        with self.condition:
+            if self.closed:
+                return
+            queue = self.queue
+            if self.policy == 'conflate':
+                if topic in queue:
+                    queue[topic] = payload
+                    self.conflated += 1
+                else:
+                    if len(queue) >= self.maxsize:
+                        queue.popitem(last=False)
+                        self.dropped += 1
+                        METRICS.increment('events_dropped')
+                    queue[topic] = payload
+            elif len(queue) >= self.maxsize:
+                self.dropped += 1
+                METRICS.increment('events_dropped')
+                if self.policy == 'drop_newest':
+                    return
+                queue.popleft()
+                queue.append((topic, payload))
+            else:
+                queue.append((topic, payload))
+            self.condition.notify()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _pop(self):    #   (topic, payload) or None, caller holds the condition
+        if not self.queue:
+            return None
+        self.delivered += 1
+        if self.policy == 'conflate':
+            return self.queue.popitem(last=False)
+        return self.queue.popleft()
+
+    def get(self, timeout=None):   #   Next (topic, payload), None on timeout or once closed
+        with self.condition:
+            self.condition.wait_for(lambda: self.queue or self.closed, timeout)
+            return self._pop()
+
+    def drain(self):   #   Everything queued right now, without waiting
+        with self.condition:
+            events = []
+            while self.queue:
+                events.append(self._pop())
+            return events
+
+    def __iter__(self):
+        while True:
+            event = self.get()
+            if event is None:
+                return
+            yield event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            with self.condition:
+                event = self._pop()
+                if event is not None:
+                    return event
+                if self.closed:
+                    raise StopAsyncIteration
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self.async_waiters.append((loop, future))
+            await future
+
+    def _dispatch(self, callback):
+        for topic, payload in self:
+            try:
+                callback(topic, payload)
+            except Exception as e:
+                METRICS.increment('event_callback_errors')
+                print(f"Error in event callback for {topic}: {e}")
+
+    def stats(self):
+        return {'topics': self.topics, 'policy': self.policy, 'queued': len(self.queue),
+                'delivered': self.delivered, 'conflated': self.conflated, 'dropped': self.dropped}
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self.condition:
+            self.closed = True
+            self.queue.clear()
+            self.condition.notify_all()
+            waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class EventBus:
+    # Routing tables are rebuilt on (un)subscribe and swapped in whole, so publish() reads
+    # them without a lock; with no subscribers for a topic it costs one dict lookup.
+
+    def __init__(self):
+        self.exact = {}         #   topic -> tuple of subscriptions
+        self.prefixed = ()      #   ((prefix, subscription), ...) for topics ending in '*'
+        self.families = frozenset()     #   Leading 'spot' / 'option' / 'candle' part of every subscribed topic
+        self.subscriptions = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, *topics, callback=None, maxsize=1000, policy='conflate'):
+        subscription = Subscription(self, topics, maxsize, policy, callback)
+        with self.lock:
+            self.subscriptions.append(subscription)
+            self._rebuild()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+                self._rebuild()
+
+    def _rebuild(self):
+        exact, prefixed, families = {}, [], set()
+        for subscription in self.subscriptions:
+            for topic in subscription.topics:
+                if topic.endswith('*'):
+                    prefixed.append((topic[:-1], subscription))
+                else:
+                    exact[topic] = exact.get(topic, ()) + (subscription,)
+                families.add(topic.split(':', 1)[0].rstrip('*'))
+        self.exact, self.prefixed, self.families = exact, tuple(prefixed), frozenset(families)
+
+    def has_subscribers(self, family):     #   Cheap check before building events nobody listens to
+        return family in self.families or '' in self.families
+
+    def publish(self, topic, payload):
+        for subscription in self.exact.get(topic, ()):
+            subscription.put(topic, payload)
+        for prefix, subscription in self.prefixed:
+            if topic.startswith(prefix):
+                subscription.put(topic, payload)
+
+    def stats(self):
+        return [subscription.stats() for subscription in list(self.subscriptions)]
@@ -0,0 +1,266 @@
+#   feed_decoder.py
+#   Field-by-field decoder for MarketDataFeed_pb2.FeedResponse frames.
+#   Reads only the fields the processors consume straight into typed records,
+#   instead of building a nested dict with MessageToDict and walking it with .get() chains.
+#   Handles every subscription mode: full (ff), option_greeks (oc) and ltpc; sparser modes
+#   leave the fields they do not carry as None. merge_frames() collapses a batch of frames into one.
+
+import threading
+import time
+from typing import NamedTuple, Optional
+import MarketDataFeed_pb2 as pb
+
+FEED_MODES = ('full', 'option_greeks', 'ltpc')
+_MODE_OF = {'ff': 'full', 'oc': 'option_greeks', 'ltpc': 'ltpc'}     #   Feed oneof -> subscription mode
+
+
+class Candle(NamedTuple):      #   One OHLC bar from marketOHLC, ts in epoch milliseconds (UTC)
+    interval: str
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+    ts: int
+
+
+class IndexTick(NamedTuple):   #   ff.indexFF record (Nifty 50 spot)
+    ltp: Optional[float]
+    ltt: Optional[int]
+    candles: tuple
+
+
+class OptionTick(NamedTuple):  #   ff.marketFF record (option strike)
+    ltp: Optional[float]
+    ltt: Optional[int]
+    delta: Optional[float]
+    theta: Optional[float]
+    gamma: Optional[float]
+    vega: Optional[float]
+    iv: Optional[float]
+    bid: Optional[float]
+    ask: Optional[float]
+    volume: Optional[int]
+    oi: Optional[float]
+    poi: Optional[float]
+    mode: str = 'full'          #   Subscription mode the record came from, decides which fields it carries
+
+
+class DecodedFrame(NamedTuple):
+    current_ts: int
+    index: dict                 #   instrument_key -> IndexTick
+    options: dict               #   instrument_key -> OptionTick
+
+
+_EMPTY_CANDLES = ()
+
+
+def _read_candles(market_ohlc):
+    return tuple(Candle(c.interval, c.open, c.high, c.low, c.close, c.volume, c.ts) for c in market_ohlc.ohlc)
+
+
+def _decode_index(index_ff):
+    if index_ff.HasField('ltpc'):
+        ltpc = index_ff.ltpc
+        ltp, ltt = ltpc.ltp, ltpc.ltt
+    else:
+        ltp = ltt = None
+    candles = _read_candles(index_ff.marketOHLC) if index_ff.HasField('marketOHLC') else _EMPTY_CANDLES
+    return IndexTick(ltp, ltt, candles)
+
+
+def _decode_market(market_ff):
+    if market_ff.HasField('ltpc'):
+        ltpc = market_ff.ltpc
+        ltp, ltt = ltpc.ltp, ltpc.ltt
+    else:
+        ltp = ltt = None
+
+    if market_ff.HasField('optionGreeks'):
+        greeks = market_ff.optionGreeks
+        delta, theta, gamma, vega, iv = greeks.delta, greeks.theta, greeks.gamma, greeks.vega, greeks.iv
+    else:
+        delta = theta = gamma = vega = iv = None
+
+    quotes = market_ff.marketLevel.bidAskQuote
+    if quotes:
+        best = quotes[0]
+        bid, ask = best.bp, best.ap
+    else:
+        bid = ask = None
+
+    ohlc = market_ff.marketOHLC.ohlc
+    volume = ohlc[0].volume if ohlc else None
+
+    if market_ff.HasField('eFeedDetails'):
+        details = market_ff.eFeedDetails
+        oi, poi = details.oi, details.poi
+    else:
+        oi = poi = None
+
+    return OptionTick(ltp, ltt, delta, theta, gamma, vega, iv, bid, ask, volume, oi, poi)
+
+
+def _decode_option_greeks(option_chain):    #   oc record: ltpc, best bid/ask, greeks and OI, no depth or OHLC
+    if option_chain.HasField('ltpc'):
+        ltpc = option_chain.ltpc
+        ltp, ltt = ltpc.ltp, ltpc.ltt
+    else:
+        ltp = ltt = None
+
+    if option_chain.HasField('optionGreeks'):
+        greeks = option_chain.optionGreeks
+        delta, theta, gamma, vega, iv = greeks.delta, greeks.theta, greeks.gamma, greeks.vega, greeks.iv
+    else:
+        delta = theta = gamma = vega = iv = None
+
+    if option_chain.HasField('bidAskQuote'):
+        quote = option_chain.bidAskQuote
+        bid, ask = quote.bp, quote.ap
+    else:
+        bid = ask = None
+
+    if option_chain.HasField('eFeedDetails'):
+        details = option_chain.eFeedDetails
+        oi, poi = details.oi, details.poi
+    else:
+        oi = poi = None
+
+    return OptionTick(ltp, ltt, delta, theta, gamma, vega, iv, bid, ask, None, oi, poi, 'option_greeks')
+
+
+def _is_index(key):    #   NSE_INDEX|Nifty 50, BSE_INDEX|SENSEX
+    return key.split('|', 1)[0].endswith('_INDEX')
+
+
+class ModeStats:   #   Records, wire bytes and decode time per subscription mode
+    # Savings are estimated against the average full record: what the same records would have
+    # cost had they been subscribed in full mode. Decoders on several threads each write their
+    # own for_thread() part, savings() adds them up. Records are counted in every frame; bytes
+    # and decode time are measured per record in one frame of sample_every and scaled up, the
+    # per-record ByteSize() and clock reads would otherwise cost a third of the decode.
+
+    def __init__(self, sample_every=16):
+        self.records = dict.fromkeys(FEED_MODES, 0)
+        self.bytes = dict.fromkeys(FEED_MODES, 0)
+        self.decode_ns = dict.fromkeys(FEED_MODES, 0)
+        self.sample_every = sample_every
+        self.frames = 0
+        self._parts = []
+        self._sources = []      #   Callables returning (records, bytes, decode_ns) dicts, e.g. a decode worker's counters
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def for_thread(self):  #   Counters only the calling thread writes, pass these to decode_feed_response()
+        part = getattr(self._local, 'part', None)
+        if part is None:
+            part = ModeStats(self.sample_every)
+            with self._lock:
+                self._parts.append(part)
+            self._local.part = part
+        return part
+
+    def add_source(self, func):    #   Counters kept elsewhere (another process), summed into totals()
+        with self._lock:
+            self._sources.append(func)
+
+    def totals(self):  #   (records, bytes, decode_ns) dicts summed over this object, every thread part and source
+        with self._lock:
+            parts, sources = [self] + self._parts, list(self._sources)
+        counters = [(part.records, part.bytes, part.decode_ns) for part in parts] + [func() for func in sources]
+        return tuple({mode: sum(counter[field][mode] for counter in counters) for mode in FEED_MODES}
+                     for field in range(3))
+
+    def savings(self):
+        records, wire_bytes, decode_ns = self.totals()
+        full_records = records['full']
+        full_bytes = wire_bytes['full'] / full_records if full_records else 0
+        full_ns = decode_ns['full'] / full_records if full_records else 0
+        summary = {}
+        for mode in FEED_MODES:
+            summary[mode] = {
+                'records': records[mode],
+                'bytes': wire_bytes[mode],
+                'decode_ns': decode_ns[mode],
+                'bytes_saved': int(records[mode] * full_bytes - wire_bytes[mode]) if mode != 'full' else 0,
+                'decode_ns_saved': int(records[mode] * full_ns - decode_ns[mode]) if mode != 'full' else 0,
+            }
+        return summary
+
+
+def decode_feed_response(message, response=None, mode_stats=None):   #   Decode one raw websocket frame into a DecodedFrame
+    if response is None:
+        response = pb.FeedResponse()
+    response.ParseFromString(message)
+
+    index, options = {}, {}
+    counts = clock = None
+    if mode_stats is not None:
+        counts = dict.fromkeys(_MODE_OF, 0)
+        if mode_stats.frames % mode_stats.sample_every == 0:   #   Sampled frame: per-record bytes and time
+            clock = time.perf_counter_ns
+        mode_stats.frames += 1
+    for key, feed in response.feeds.items():
+        kind = feed.WhichOneof('FeedUnion')
+        if clock is not None:
+            started = clock()
+        if kind == 'ff':
+            full_feed = feed.ff
+            full_kind = full_feed.WhichOneof('FullFeedUnion')
+            if full_kind == 'indexFF':
+                index[key] = _decode_index(full_feed.indexFF)
+            elif full_kind == 'marketFF':
+                options[key] = _decode_market(full_feed.marketFF)
+        elif kind == 'oc':
+            options[key] = _decode_option_greeks(feed.oc)
+        elif kind == 'ltpc':
+            ltpc = feed.ltpc
+            if _is_index(key):
+                index[key] = IndexTick(ltpc.ltp, ltpc.ltt, _EMPTY_CANDLES)
+            else:
+                options[key] = OptionTick(ltpc.ltp, ltpc.ltt, None, None, None, None, None, None, None, None, None, None, 'ltpc')
+        else:
+            continue
+        if counts is not None:
+            counts[kind] += 1
+            if clock is not None:
+                mode = _MODE_OF[kind]
+                mode_stats.decode_ns[mode] += (clock() - started) * mode_stats.sample_every
+                mode_stats.bytes[mode] += feed.ByteSize() * mode_stats.sample_every
+
+    if counts is not None:
+        for kind, count in counts.items():
+            mode_stats.records[_MODE_OF[kind]] += count
+    return DecodedFrame(response.currentTs, index, options)
+
+
+_RICHNESS = {'ltpc': 0, 'option_greeks': 1, 'full': 2}    #   Fields carried: ltpc < option_greeks (no volume) < full
+
+
+def merge_option_ticks(older, newer):  #   One tick that leaves the store as applying older then newer would
+    if _RICHNESS[newer.mode] >= _RICHNESS[older.mode]:
+        return newer
+    if newer.mode == 'ltpc':
+        return older._replace(ltp=newer.ltp, ltt=newer.ltt or older.ltt)
+    return newer._replace(volume=older.volume, mode=older.mode)    #   option_greeks over full keeps the volume
+
+
+def merge_index_ticks(older, newer):   #   Latest spot, I1 bars of both (newer revision of a bar wins), in time order
+    bars = {(c.interval, c.ts): c for c in older.candles}
+    bars.update(((c.interval, c.ts), c) for c in newer.candles)
+    candles = tuple(sorted(bars.values(), key=lambda c: c.ts)) if newer.candles else older.candles
+    return IndexTick(newer.ltp if newer.ltp is not None else older.ltp, newer.ltt or older.ltt, candles)
+
+
+def merge_frames(frames):  #   Micro-batch: one DecodedFrame with each instrument's latest state, frames oldest first
+    if len(frames) == 1:
+        return frames[0]
+    index, options = dict(frames[0].index), dict(frames[0].options)
+    for frame in frames[1:]:
+        for key, tick in frame.options.items():
+            older = options.get(key)
+            options[key] = tick if older is None else merge_option_ticks(older, tick)
+        for key, tick in frame.index.items():
+            older = index.get(key)
+            index[key] = tick if older is None else merge_index_ticks(older, tick)
+    return DecodedFrame(max(frame.current_ts for frame in frames), index, options)
@@ -0,0 +1,113 @@
+#   feed_recorder.py
+#   Records raw FeedResponse frames with their monotonic receive time and replays them
+#   through the same processing pipeline at 1x, Nx or maximum speed.
+#   File layout: 8 byte magic, then per frame <receive_ns:int64><length:uint32><payload>.
+#   The option chain instruments are stored next to it in <path>.meta.json.
+#   Usage:  python feed_recorder.py <recording> [speed]     (speed 0 = as fast as possible)
+
+import json
+import struct
+import sys
+import time
+import pandas as pd
+
+FILE_MAGIC = b'UPXFEED1'
+FRAME_HEADER = struct.Struct('<qI')
+
+
+def meta_path(path):
+    return path + '.meta.json'
+
+
+class FrameRecorder:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(FILE_MAGIC)
+        self.frames = 0
+        self.bytes = 0
+        self.instruments = None
+
+    def write_meta(self, instruments_df):  #   Option chain layout needed to rebuild the store on replay
+        if self.instruments is not None:    #   Re-written as the strike window moves, keeps every instrument recorded so far
+            instruments_df = pd.concat([self.instruments, instruments_df]).drop_duplicates('instrument_key')
+        self.instruments = instruments_df
+        with open(meta_path(self.path), 'w') as file:
+            json.dump({'instruments': instruments_df.astype(str).to_dict('records')}, file)
+
+    def record(self, message, received_ns=None):
+        received_ns = received_ns if received_ns is not None else time.monotonic_ns()
+        self.file.write(FRAME_HEADER.pack(received_ns, len(message)))
+        self.file.write(message)
+        self.frames += 1
+        self.bytes += len(message)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_frames(path):     #   Yields (received_ns, payload) in recorded order
+    with open(path, 'rb') as file:
+        if file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a feed recording")
+        while True:
+            header = file.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return      #   End of file, or a frame cut off by a crash while recording
+            received_ns, length = FRAME_HEADER.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length:
+                return
+            yield received_ns, payload
+
+
+def load_meta(path):    #   Instruments DataFrame saved with the recording, None if there is none
+    try:
+        with open(meta_path(path)) as file:
+            return pd.DataFrame(json.load(file)['instruments'])
+    except FileNotFoundError:
+        return None
+
+
+def replay(path, handle_frame, speed=1.0):  #   Feed recorded frames to handle_frame(payload) keeping the recorded spacing / speed
+    frames = 0
+    started = time.perf_counter()
+    first_ns = None
+    for received_ns, payload in read_frames(path):
+        if speed:
+            if first_ns is None:
+                first_ns = received_ns
+            delay = (received_ns - first_ns) / 1e9 / speed - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        handle_frame(payload)
+        frames += 1
+    elapsed = time.perf_counter() - started
+    return {'frames': frames, 'elapsed': elapsed, 'frames_per_second': frames / elapsed if elapsed else 0.0}
+
+
+def replay_into(data_dict, path, speed=1.0, analytics=True):  #   Replay a recording into a market_data dict like start_websocket would
+    import MarketDataFeed_pb2 as pb
+    from candle_data import CANDLE_INSTRUMENT, register_candle_engine
+    from websocket import attach_option_chain, process_frame
+
+    data_dict['replay'] = True     #   Feed lag is not recorded, the frames' exchange timestamps are from the recording
+    instruments_df = load_meta(path)
+    if instruments_df is not None:
+        attach_option_chain(data_dict, instruments_df, analytics)
+    if data_dict.get('candle_engine') is None:     #   Candles are built from the recorded I1 bars alone, no history download
+        register_candle_engine(data_dict).seed(CANDLE_INSTRUMENT, [])
+
+    feed_response = pb.FeedResponse()
+    return replay(path, lambda payload: process_frame(data_dict, payload, feed_response), speed)
+
+
+if __name__ == "__main__":
+    from candle_data import CANDLE_INSTRUMENT, PUBLISHED_INTERVAL
+    market_data = {'nifty_spot_price': None, 'nifty_option_chain': None}
+    stats = replay_into(market_data, sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 1.0)
+    print(f"Replayed {stats['frames']} frames in {stats['elapsed']:.2f}s ({stats['frames_per_second']:.0f} frames/s)")
+    print(f"Nifty Spot: {market_data['nifty_spot_price']}")
+    print(market_data['candle_engine'].to_frame(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL).tail())
@@ -0,0 +1,73 @@
+#   http_client.py
+#   Shared HTTP client for all REST calls: one pooled keep-alive requests.Session with
+#   timeouts, retries with exponential backoff on transient errors, ETag / Last-Modified
+#   conditional GETs (the caller keeps the validators and the cached body), and a small thread
+#   pool for issuing independent requests concurrently.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (5, 30)      #   (connect, read) seconds
+
+
+class HttpClient:
+
+    def __init__(self, pool_size=16, retries=3, backoff=0.3, timeout=DEFAULT_TIMEOUT, max_workers=8):
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),   #   POSTs (token exchange) are never replayed
+            raise_on_status=False,                        #   Hand back the last response instead of raising
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='http')
+        return self._executor
+
+    def get(self, url, headers=None, params=None, timeout=None, validators=None):
+        # validators: (etag, last_modified) from an earlier response(), a 304 means the caller's copy is current
+        headers = dict(headers or {})
+        if validators:
+            etag, last_modified = validators
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return self.session.get(url, headers=headers, params=params, timeout=timeout or self.timeout)
+
+    def get_json(self, url, headers=None, params=None, timeout=None):
+        return self.get(url, headers, params, timeout).json()
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        return self.session.post(url, headers=headers, data=data, timeout=timeout or self.timeout)
+
+    def submit(self, func, *args, **kwargs):   #   Run any blocking call on the shared pool, returns a Future
+        return self.executor.submit(func, *args, **kwargs)
+
+    def get_many(self, urls, headers=None):    #   Concurrent GETs, JSON bodies in the order of urls
+        futures = [self.submit(self.get_json, url, headers) for url in urls]
+        return [future.result() for future in futures]
+
+
+def response_validators(response):     #   (etag, last_modified) to persist next to a cached body, None if the server sent neither
+    etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    return (etag, last_modified) if etag or last_modified else None
+
+
+HTTP = HttpClient()
@@ -0,0 +1,126 @@
+#   ingest_queue.py
+#   Bounded queue between a shard's receive coroutine and its processing thread, so slow
+#   processing no longer stalls websocket.recv() and the socket buffer behind it. What happens
+#   when the queue is full is an explicit policy:
+#       block        the receiver stops reading until there is room (backpressure onto TCP)
+#       drop_oldest  the oldest queued frame is discarded and counted
+#       conflate     the two oldest frames are decoded and merged, every instrument keeps its
+#                    latest state and only intermediate ticks are lost. The decode runs outside
+#                    the lock, get_batch() keeps draining meanwhile
+#   The processing side takes up to max_batch frames at once and merges them into one
+#   DecodedFrame, so several queued ticks of one instrument cost a single update.
+
+import asyncio
+import threading
+from collections import deque
+import MarketDataFeed_pb2 as pb
+from feed_decoder import DecodedFrame, merge_frames
+
+INGEST_POLICIES = ('block', 'drop_oldest', 'conflate')
+
+
+class IngestQueue:
+
+    def __init__(self, decode, maxsize=256, policy='block', max_batch=32):
+        if policy not in INGEST_POLICIES:
+            raise ValueError(f"Unknown ingest policy {policy!r}, expected one of {INGEST_POLICIES}")
+        if policy == 'conflate' and maxsize < 2:
+            raise ValueError("The conflate policy needs a queue of at least 2 frames")
+        self.decode = decode        #   decode(message, feed_response) -> DecodedFrame
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_batch = max_batch
+        self.entries = deque()      #   (raw bytes or DecodedFrame, wire bytes) oldest first
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.space = None           #   asyncio.Event of the receiving loop, for the block policy
+        self.loop = None
+        self.closed = False
+        self._conflate_response = pb.FeedResponse()     #   Conflation decodes on the receiving thread, outside the lock
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.batches = 0
+        self.batched_frames = 0
+        self.collapsed = 0          #   Instrument updates saved by merging batches
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _conflate(self, first, second):    #   Merge the two oldest entries into one, unless get_batch() took them meanwhile
+        frames = [entry if isinstance(entry, DecodedFrame) else self.decode(entry, self._conflate_response)
+                  for entry, _ in (first, second)]
+        merged = (merge_frames(frames), first[1] + second[1])
+        with self.lock:     #   Entries are only ever removed from the left, so still in place means still oldest
+            if len(self.entries) >= 2 and self.entries[0] is first and self.entries[1] is second:
+                self.entries.popleft()
+                self.entries[0] = merged
+                self.conflated += 1
+
+    def offer(self, message):  #   Non-blocking put, False only when full under the block policy
+        while True:
+            with self.lock:
+                if len(self.entries) >= self.maxsize:
+                    if self.policy == 'block':
+                        return False
+                    if self.policy == 'drop_oldest':
+                        self.entries.popleft()
+                        self.dropped += 1
+                if len(self.entries) < self.maxsize:
+                    self.entries.append((message, len(message)))
+                    self.enqueued += 1
+                    self.max_depth = max(self.max_depth, len(self.entries))
+                    self.not_empty.notify()
+                    return True
+                oldest = self.entries[0], self.entries[1]
+            self._conflate(*oldest)
+
+    async def put(self, message):  #   From the receive coroutine; waits for room only under the block policy
+        while not self.offer(message):
+            if self.space is None or self.loop is not asyncio.get_running_loop():
+                self.loop, self.space = asyncio.get_running_loop(), asyncio.Event()
+            self.space.clear()
+            self.blocked += 1
+            if len(self.entries) >= self.maxsize:   #   Room may have appeared since offer()
+                await self.space.wait()
+
+    def get_batch(self, timeout=None):     #   From the processing thread: up to max_batch entries, None on timeout or close
+        with self.not_empty:
+            self.not_empty.wait_for(lambda: self.entries or self.closed, timeout)
+            if not self.entries:
+                return None
+            batch = [self.entries.popleft() for _ in range(min(self.max_batch, len(self.entries)))]
+        if self.space is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.space.set)
+        return batch
+
+    def merge(self, batch, feed_response):     #   Decode what is still raw and collapse the batch into one frame
+        frames = [entry if isinstance(entry, DecodedFrame) else self.decode(entry, feed_response) for entry, _ in batch]
+        merged = merge_frames(frames)
+        self.batches += 1
+        self.batched_frames += len(batch)
+        if len(frames) > 1:
+            self.collapsed += sum(len(frame.options) for frame in frames) - len(merged.options)
+        return merged, sum(size for _, size in batch)
+
+    def close(self):
+        with self.not_empty:
+            self.closed = True
+            self.not_empty.notify_all()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'depth': len(self.entries),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'conflated': self.conflated,
+            'blocked': self.blocked,
+            'batches': self.batches,
+            'frames_per_batch': round(self.batched_frames / self.batches, 2) if self.batches else None,
+            'collapsed_updates': self.collapsed,
+        }
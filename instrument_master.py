@@ -0,0 +1,165 @@
+#   instrument_master.py
+#   Cached, pre-filtered copy of the Upstox instrument master.
+#   The full complete.csv.gz is downloaded at most once per trading day, trimmed to the
+#   NSE_FO index options we trade with compact dtypes, and stored as Feather under cache/.
+#   The download's ETag / Last-Modified are kept beside it, so the next day's refresh is a
+#   conditional GET and an unchanged master is served from the previous trimmed file.
+#   A warm start memory-maps the Feather file and looks strikes up through an in-memory index.
+
+import io
+import json
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from endpoints import INSTRUMENTS_URL
+from http_client import HTTP, response_validators
+
+CACHE_DIR = 'cache'
+VALIDATORS_FILE = 'instruments_validators.json'    #   {source, etag, last_modified, file} of the cached download
+
+COLUMN_DTYPES = {
+    'instrument_key': 'string',
+    'tradingsymbol': 'string',
+    'name': 'string',
+    'expiry': 'string',
+    'strike': 'float64',
+    'lot_size': 'int32',
+    'instrument_type': 'category',
+    'option_type': 'category',
+    'exchange': 'category',
+}
+INDEX_COLUMNS = ['name', 'instrument_type', 'expiry', 'strike', 'option_type']
+
+
+def trading_day(now=None):     #   IST calendar date the cache belongs to, e.g. '2024-11-28'
+    now = now or datetime.now(ZoneInfo("Asia/Kolkata"))
+    return now.strftime('%Y-%m-%d')
+
+
+def cache_path(day, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"instruments_{day}.feather")
+
+
+def _cached_validators(source, cache_dir):     #   Validators and path of the last cached download of source, ({}, None) if unusable
+    try:
+        with open(os.path.join(cache_dir, VALIDATORS_FILE)) as file:
+            validators = json.load(file)
+    except (OSError, ValueError):
+        return {}, None
+    path = os.path.join(cache_dir, validators.get('file', ''))
+    if validators.get('source') != source or not os.path.isfile(path):
+        return {}, None
+    return validators, path
+
+
+def _save_validators(source, validators, day, cache_dir):
+    path = os.path.join(cache_dir, VALIDATORS_FILE)
+    if validators is None:
+        if os.path.exists(path): os.remove(path)
+        return
+    with open(path, 'w') as file:
+        json.dump({'source': source, 'etag': validators[0], 'last_modified': validators[1],
+                   'file': os.path.basename(cache_path(day, cache_dir))}, file)
+
+
+def refresh_instrument_master(day, source=INSTRUMENTS_URL, cache_dir=CACHE_DIR, conditional=True):   #   Download, trim and cache, returns the DataFrame
+    # conditional=False ignores and drops the stored validators, for when the cached file cannot be trusted
+    compression = 'infer'
+    url, validators = source, None
+    if source.startswith(('http://', 'https://')):     #   Pooled session, conditional GET against the last cached download
+        cached, cached_path = _cached_validators(source, cache_dir) if conditional else ({}, None)
+        if not conditional: _save_validators(url, None, day, cache_dir)
+        response = HTTP.get(source, timeout=(5, 120),
+                            validators=(cached['etag'], cached['last_modified']) if cached_path else None)
+        if response.status_code == 304 and cached_path:    #   Unchanged upstream: the last trimmed file becomes today's
+            os.replace(cached_path, cache_path(day, cache_dir))
+            try:
+                instruments_df = feather.read_table(cache_path(day, cache_dir), memory_map=True).to_pandas()
+            except Exception as e:
+                print(f"Cached instruments unreadable after 304, downloading again: {e}")
+                return refresh_instrument_master(day, url, cache_dir, conditional=False)
+            _save_validators(url, (cached['etag'], cached['last_modified']), day, cache_dir)
+            return instruments_df
+        response.raise_for_status()
+        validators = response_validators(response)
+        content = response.content
+        compression = 'gzip' if content[:2] == b'\x1f\x8b' else None    #   Already inflated if sent with Content-Encoding
+        source = io.BytesIO(content)
+    instruments_df = pd.read_csv(source, usecols=list(COLUMN_DTYPES), dtype={'instrument_key': 'string', 'expiry': 'string'},
+                                 compression=compression)
+
+    instruments_df = instruments_df[
+        (instruments_df['exchange'] == 'NSE_FO') &
+        (instruments_df['instrument_type'] == 'OPTIDX') &
+        (instruments_df['option_type'].isin(['CE', 'PE']))
+    ]
+    instruments_df = instruments_df.astype(COLUMN_DTYPES)
+    instruments_df = instruments_df.sort_values(INDEX_COLUMNS).reset_index(drop=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path(day, cache_dir) + '.tmp'
+    instruments_df.to_feather(tmp_path, compression='uncompressed')   #   Uncompressed so warm starts can memory-map it
+    os.replace(tmp_path, cache_path(day, cache_dir))
+    _save_validators(url, validators, day, cache_dir)
+
+    # Drop older days so the cache directory does not grow
+    for name in os.listdir(cache_dir):
+        if name.startswith('instruments_') and name.endswith('.feather') and name != os.path.basename(cache_path(day, cache_dir)):
+            os.remove(os.path.join(cache_dir, name))
+
+    return instruments_df
+
+
+def load_instrument_master(source=INSTRUMENTS_URL, cache_dir=CACHE_DIR, day=None):    #   Warm start reads the cache, cold start refreshes it
+    day = day or trading_day()
+    path = cache_path(day, cache_dir)
+    if os.path.exists(path):
+        try:
+            return InstrumentMaster(feather.read_table(path, memory_map=True).to_pandas())
+        except Exception as e:
+            print(f"Instrument cache unreadable, refreshing: {e}")
+            #   Its validators describe the broken file, a 304 would hand it straight back
+            return InstrumentMaster(refresh_instrument_master(day, source, cache_dir, conditional=False))
+    return InstrumentMaster(refresh_instrument_master(day, source, cache_dir))
+
+
+class InstrumentMaster:
+
+    def __init__(self, instruments_df):
+        # Rows are sorted by INDEX_COLUMNS, so each (name, instrument_type, expiry) group is a
+        # contiguous slice with ascending strikes
+        self.df = instruments_df
+        names = instruments_df['name'].to_numpy(dtype=object)
+        types = instruments_df['instrument_type'].astype(str).to_numpy(dtype=object)
+        expiries = instruments_df['expiry'].to_numpy(dtype=object)
+        option_types = instruments_df['option_type'].astype(str).to_numpy(dtype=object)
+        self.strikes = instruments_df['strike'].to_numpy(dtype=np.float64)
+        keys = instruments_df['instrument_key'].to_numpy(dtype=object)
+
+        self._index = {}
+        self._groups = {}
+        for row, entry in enumerate(zip(names, types, expiries, self.strikes.tolist(), option_types)):
+            self._index[entry] = keys[row]
+            group = entry[:3]
+            start, _ = self._groups.get(group, (row, row))
+            self._groups[group] = (start, row + 1)
+
+    def __len__(self):
+        return len(self.df)
+
+    def lookup(self, underlying, instrument_type, expiry, strike, option_type):    #   instrument_key or None
+        return self._index.get((underlying, instrument_type, expiry, float(strike), option_type))
+
+    def expiries(self, underlying, instrument_type='OPTIDX'):
+        return sorted(expiry for name, kind, expiry in self._groups if name == underlying and kind == instrument_type)
+
+    def options(self, underlying, expiry, strike_range=None, instrument_type='OPTIDX'):    #   Slice of the master for one expiry
+        start, stop = self._groups.get((underlying, instrument_type, expiry), (0, 0))
+        if strike_range is not None and stop > start:
+            strikes = self.strikes[start:stop]
+            stop = start + int(np.searchsorted(strikes, strike_range[1], side='right'))
+            start = start + int(np.searchsorted(strikes, strike_range[0], side='left'))
+        return self.df.iloc[start:stop]
@@ -3,6 +3,7 @@ from urllib.parse import parse_qs, urlparse, quote
 import pyotp
 import requests
 import json
+from http_client import HTTP
 import time
 
 def fetch_access_token(credentials_file='credentials.json'):
@@ -108,7 +109,7 @@ def fetch_access_token(credentials_file='credentials.json'):
     }
 
     try:
-        response = requests.post(token_url, headers=headers, data=data)
+        response = HTTP.post(token_url, headers=headers, data=data)
         response.raise_for_status()
         access_token = response.json().get('access_token')
         
@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from urllib.parse import quote, urlparse, parse_qs
-import requests as rq
+from http_client import HTTP
 import pyperclip
 import time
 import json 
@@ -87,7 +87,7 @@ class UPSTOXManualLogin(tk.Tk):
             'redirect_uri': RURL,
             'grant_type': 'authorization_code'
         }
-        response = rq.post(url, headers=headers, data=data)
+        response = HTTP.post(url, headers=headers, data=data)
         if response.status_code == 200:
             json_response = response.json()
             access_token = json_response['access_token']
@@ -112,7 +112,7 @@ class UPSTOXManualLogin(tk.Tk):
             'Authorization': f'Bearer {access_token}'
         }
         payload = {'symbol': "NSE_INDEX|Nifty Bank"}
-        response = rq.get(url, headers=headers, params=payload)
+        response = HTTP.get(url, headers=headers, params=payload)
         if response.status_code == 200:
             response_data = response.json()
             open_value = response_data['data']['NSE_INDEX:Nifty Bank']['ohlc']['open']
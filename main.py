@@ -5,54 +5,86 @@ import pandas as pd
 import threading
 import nest_asyncio
 import os
-from datetime import datetime, timezone, timedelta
-import time
-from login_auto import fetch_access_token
-from websocket import start_websocket 
+from token_manager import TOKENS
+from websocket import start_websocket, get_open_value, create_options_df, INGEST_POLICY, INGEST_QUEUE_SIZE
+from instrument_master import load_instrument_master
+from startup import StartupGraph
 from candle_data import fetch_candle_data
+from metrics import start_metrics_dump
+from snapshot import SnapshotPublisher
+from event_bus import EventBus, TOPIC_SPOT
+from market_state import start_state_publisher, STATE_NAME
+from dashboard import Dashboard
 nest_asyncio.apply()    #   Enable nested event loops
 
 
 # Initialize data dictionary with default values
 market_data = {
     'nifty_spot_price': None,
-    'websocket_candle_data': pd.DataFrame(),
     'complete_candle_data': pd.DataFrame(),
     'historical_candle_data': pd.DataFrame(),
     'intraday_candle_data': pd.DataFrame(),
-    'nifty_option_chain': pd.DataFrame()    }
+    'nifty_option_chain': None,    #   OptionChainStore, use .to_frame() for a DataFrame view
+    'snapshots': SnapshotPublisher(),    #   Consistent read-only views for readers, see snapshot.py
+    'events': EventBus()    }    #   Spot / option / candle close subscriptions, see event_bus.py
 
 
 
 if __name__ == "__main__":
 
 
-    #   Fetch Access Token using Auto Login 
-    fetch_access_token(credentials_file='credentials.json') 
-
-
-    # Start websocket in a separate thread
-    market_data_thread = threading.Thread(target=start_websocket, args=(market_data,))
-    market_data_thread.daemon = True  # Set as daemon thread
-    market_data_thread.start()
-    time.sleep(3)
-
-
-    # Candle Data Thread
-    candle_data_thread = threading.Thread(target=fetch_candle_data,args=(market_data,))
-    candle_data_thread.daemon = True
-    candle_data_thread.start()
-
-
-    try:
-        while True:
-            os.system('cls' if os.name == 'nt' else 'clear')
-            #   print(f"\nNifty Spot: {market_data['nifty_spot_price']}")
-            #   print(f"\nOptions Chain Data \n: {market_data['nifty_option_chain']}")
-            print(f"\n Complete Candles Data : \n{market_data['complete_candle_data']}")
-            #   print(f"\n websocket Candles Data : \n{market_data['websocket_candle_data']}")
-            #   print(f"\n Intraday Candles Data : \n{market_data['intraday_candle_data']}")
-            #   print(f"\n Historical Candles Data : \n{market_data['historical_candle_data']}")
-            time.sleep(3)
-
+    #   Cold start as a dependency graph: independent steps overlap, readiness events replace fixed sleeps
+    candles_ready = threading.Event()
+    spot_updates = market_data['events'].subscribe(TOPIC_SPOT, maxsize=1)     #   Before the feed starts, so the first tick is seen
+
+    def start_candles():    #   Registers the candle engine right away, history downloads alongside everything else
+        candle_data_thread = threading.Thread(target=fetch_candle_data, args=(market_data, candles_ready))
+        candle_data_thread.daemon = True
+        candle_data_thread.start()
+        return candle_data_thread
+
+    def start_feed(token, strike_window):
+        # Start websocket in a separate thread, FEED_RECORD_PATH records raw frames for replay,
+        # FEED_SHARDS spreads the subscriptions over that many connections, FEED_DECODE_WORKER=1 decodes in a worker process,
+        # FEED_INGEST_POLICY (block / drop_oldest / conflate) and FEED_QUEUE_SIZE size the queue between recv and processing
+        market_data_thread = threading.Thread(target=start_websocket, args=(market_data, os.environ.get('FEED_RECORD_PATH'),
+                                                                            int(os.environ.get('FEED_SHARDS', 1)), strike_window,
+                                                                            os.environ.get('FEED_DECODE_WORKER') == '1',
+                                                                            os.environ.get('FEED_INGEST_POLICY', INGEST_POLICY),
+                                                                            int(os.environ.get('FEED_QUEUE_SIZE', INGEST_QUEUE_SIZE))))
+        market_data_thread.daemon = True  # Set as daemon thread
+        market_data_thread.start()
+        return market_data_thread
+
+    startup = StartupGraph()
+    startup.add('token', TOKENS.get)   #   Cached token reused, auto login (Playwright) only when missing, expired or revoked
+    startup.add('instrument_master', load_instrument_master)
+    startup.add('candle_thread', start_candles)
+    startup.add('history', lambda thread: candles_ready.wait(), deps=('candle_thread',))
+    startup.add('open_price', lambda token: get_open_value(), deps=('token',))
+    startup.add('option_chain', lambda master, open_value: create_options_df(market_data, master, open_value),
+                deps=('instrument_master', 'open_price'))
+    startup.add('feed', start_feed, deps=('token', 'option_chain'))
+    startup.add('first_tick', lambda thread: spot_updates.get(), deps=('feed',))
+    state_name = os.environ.get('MARKET_STATE_SHM')     #   1 (default name) or a block name: share the state with local readers
+    if state_name:
+        startup.add('state_publisher', lambda strike_window: start_state_publisher(
+            market_data, strike_window.universe(), STATE_NAME if state_name == '1' else state_name), deps=('option_chain',))
+    startup.start()
+
+
+    # Periodic metrics snapshot (stage latencies, feed lag, counters, startup phases) for alerting
+    start_metrics_dump(interval=60, path=os.environ.get('METRICS_DUMP_PATH', 'metrics.jsonl'))
+
+
+    # Usable once the first spot tick and the seeded candles are in
+    for phase in ('first_tick', 'history'):
+        try:    startup.wait(phase, timeout=120)
+        except Exception as e:  print(f"Startup: {e}")
+    spot_updates.close()
+    print(startup.report())
+
+
+    #   Live dashboard: spot, chain around ATM, candles and feed health, only changed cells redrawn, DASHBOARD_FPS caps redraws
+    try:    Dashboard(market_data, fps=float(os.environ.get('DASHBOARD_FPS', 4))).run()
     except KeyboardInterrupt:   print("Shutting down...")
@@ -0,0 +1,290 @@
+#   market_state.py
+#   Publisher mode for local consumers. One feed process (main.py with MARKET_STATE_SHM=1) keeps
+#   the spot, the option chain of the whole expiry and the index candles in one named
+#   shared-memory block; strategies attach with MarketStateReader instead of running their own
+#   login, websocket and history download. A seqlock version counter keeps reads consistent:
+#   readers work on the arrays in place and the read is retried if a publish overlapped it.
+#
+#       reader = MarketStateReader()
+#       spot, ltp = reader.read(lambda state: (state.spot, state.column('LTP')[reader.row_of[key]]))
+
+import atexit
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from candle_data import CANDLE_INSTRUMENT, CANDLE_INTERVALS
+from decode_worker import SeqLock, layout_size, shared_arrays
+from event_bus import TOPIC_SNAPSHOT
+from metrics import METRICS
+from option_chain import FIELD_COLUMNS, INSTRUMENT_COLUMNS
+
+STATE_NAME = 'awdesh_market_state'
+STATE_DEPTH = 64            #   Candles kept per series
+_HEADER = struct.Struct('<QQQ')     #   magic, length of the JSON layout that follows, publisher pid
+_MAGIC = 0x4157444553484D32     #   'AWDESHM2'
+
+
+def state_layout(rows, series_count, depth):
+    return (
+        ('seq', np.uint64, (1,)),
+        ('published_at', np.float64, (1,)),         #   time.time() of the last publish, for staleness checks
+        ('spot', np.float64, (1,)),
+        ('values', np.float64, (len(FIELD_COLUMNS), rows)),    #   NaN outside the subscribed strike window
+        ('ltt', np.int64, (rows,)),
+        ('candles', np.float64, (series_count, depth, 5)),     #   ts (IST seconds), open, high, low, close; oldest first
+        ('candle_counts', np.int64, (series_count,)),
+    )
+
+
+def _arrays_offset(meta_bytes):
+    return (_HEADER.size + meta_bytes + 63) // 64 * 64
+
+
+def _process_alive(pid):
+    if os.name == 'nt':     #   Windows frees a block with its last handle, a name still in use always has a live owner
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:     #   Exists, owned by another user
+        return True
+    return True
+
+
+def _reclaim_stale(name, wait=0.5):    #   Unlink a block left by a publisher that died, raise if its publisher is alive
+    stale = shared_memory.SharedMemory(name=name)
+    try:
+        deadline = time.monotonic() + wait
+        while True:     #   A publisher starting right now writes the magic last
+            magic, _, pid = _HEADER.unpack_from(stale.buf, 0) if stale.size >= _HEADER.size else (0, 0, 0)
+            if magic == _MAGIC or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+        if magic == _MAGIC and pid and _process_alive(pid):
+            try:    resource_tracker.unregister(stale._name, 'shared_memory')   #   Our exit must not unlink the live block
+            except Exception:   pass
+            raise FileExistsError(f"Market state '{name}' is published by live process {pid}, "
+                                  f"pick another MARKET_STATE_SHM name or stop that process")
+    finally:
+        stale.close()
+    stale.unlink()  #   Crashed publisher (or one that never finished initialising)
+    print(f"Reclaimed stale market state '{name}' (publisher pid {pid or 'unknown'} is gone)")
+
+
+class MarketState(NamedTuple):     #   Zero-copy views as of one version, only valid inside MarketStateReader.read()
+    version: int
+    published_at: float
+    spot: float
+    values: np.ndarray
+    ltt: np.ndarray
+    candles: np.ndarray
+    candle_counts: np.ndarray
+
+    def column(self, name):     #   state.column('LTP') -> one value per instrument row
+        return self.values[list(FIELD_COLUMNS).index(name)]
+
+    def series(self, index):   #   (count, 5) candles of one candle series
+        return self.candles[index, :self.candle_counts[index]]
+
+    def copy(self):    #   Detached copy, safe to keep after read() returns
+        return self._replace(values=self.values.copy(), ltt=self.ltt.copy(), candles=self.candles.copy(),
+                             candle_counts=self.candle_counts.copy())
+
+
+class MarketStatePublisher:    #   Single writer, owns (and unlinks) the block
+
+    def __init__(self, instruments_df, name=STATE_NAME, candle_series=None, depth=STATE_DEPTH):
+        self.instruments = instruments_df[INSTRUMENT_COLUMNS].reset_index(drop=True)
+        self.row_of = {key: row for row, key in enumerate(self.instruments['instrument_key'])}
+        self.candle_series = list(candle_series or [(CANDLE_INSTRUMENT, interval) for interval in CANDLE_INTERVALS])
+        self.depth = depth
+        meta = json.dumps({
+            'fields': list(FIELD_COLUMNS),
+            'instruments': {column: self.instruments[column].astype(str if column != 'strike' else float).tolist()
+                            for column in INSTRUMENT_COLUMNS},
+            'candle_series': self.candle_series,
+            'depth': depth,
+        }).encode()
+        layout = state_layout(len(self.instruments), len(self.candle_series), depth)
+        offset = _arrays_offset(len(meta))
+        size = offset + layout_size(layout)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:     #   Left behind by a publisher that did not shut down cleanly, or still in use
+            _reclaim_stale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = name
+        self.arrays = shared_arrays(self.shm.buf, layout, offset)
+        for field, array in self.arrays.items():
+            setattr(self, field, array)
+        self.values[:] = np.nan
+        self.lock = SeqLock(self.seq)
+        self.shm.buf[_HEADER.size:_HEADER.size + len(meta)] = meta
+        _HEADER.pack_into(self.shm.buf, 0, _MAGIC, len(meta), os.getpid())    #   Last: readers wait for the magic
+        self.window_rows = None     #   Store rows -> block rows for the current strike window
+        self.window_keys = None
+        self.candle_versions = {}
+        self.publishes = 0
+
+    def _map_window(self, option_chain):   #   Block rows of the window, rebuilt only when the window moved
+        if option_chain.instrument_keys is not self.window_keys:
+            rows = np.fromiter((self.row_of.get(key, -1) for key in option_chain.instrument_keys), dtype=np.intp,
+                               count=len(option_chain.instrument_keys))
+            self.window_keys, self.window_rows = option_chain.instrument_keys, rows
+            self.values[:] = np.nan    #   Strikes that left the window stop showing stale prices
+        return self.window_rows
+
+    def publish(self, snapshot, candle_engine=None):   #   One MarketSnapshot (plus the engine's candles) under the seqlock
+        if self.arrays is None:
+            return
+        changed_candles = []
+        if candle_engine is not None:
+            for index, (key, interval) in enumerate(self.candle_series):
+                version = candle_engine.version(key, interval)
+                if version and version != self.candle_versions.get(index):
+                    self.candle_versions[index] = version
+                    changed_candles.append((index, candle_engine.candles(key, interval)[-self.depth:]))
+        option_chain = snapshot.option_chain
+        started = time.perf_counter_ns()
+        self.lock.write_begin()
+        try:
+            if snapshot.nifty_spot_price is not None:
+                self.spot[0] = snapshot.nifty_spot_price
+            if option_chain is not None:
+                rows = self._map_window(option_chain)
+                known = rows >= 0
+                for i, column in enumerate(FIELD_COLUMNS):
+                    self.values[i, rows[known]] = option_chain.columns[column][known]
+                self.ltt[rows[known]] = option_chain.ltt[known]
+            for index, rows in changed_candles:
+                if rows:
+                    self.candles[index, :len(rows)] = rows
+                self.candle_counts[index] = len(rows)
+            self.published_at[0] = time.time()
+        finally:
+            self.lock.write_end()
+        self.publishes += 1
+        METRICS.histogram('state_publish').record(time.perf_counter_ns() - started)
+
+    def close(self):
+        if self.arrays is None:
+            return
+        self.arrays = self.lock = None
+        for field, _, _ in state_layout(0, 0, 0):
+            setattr(self, field, None)
+        self.shm.close()
+        self.shm.unlink()
+
+
+def start_state_publisher(data_dict, instruments_df, name=STATE_NAME):     #   Mirror every snapshot into shared memory from a thread
+    publisher = MarketStatePublisher(instruments_df, name)
+    data_dict['state_publisher'] = publisher
+    atexit.register(publisher.close)   #   Readers see FileNotFoundError on their next attach, not a stale block
+    updates = data_dict['events'].subscribe(TOPIC_SNAPSHOT, maxsize=1, policy='conflate')    #   Only the newest version matters
+
+    def run():
+        for _, snapshot in updates:
+            try:    publisher.publish(snapshot, data_dict.get('candle_engine'))
+            except Exception as e:
+                METRICS.increment('state_publish_errors')
+                print(f"Error publishing market state: {e}")
+
+    thread = threading.Thread(target=run, daemon=True, name='state-publisher')
+    thread.start()
+    print(f"Market state published to shared memory '{name}'")
+    return publisher
+
+
+class MarketStateReader:   #   Read-only attach from any local process, no login or websocket needed
+
+    def __init__(self, name=STATE_NAME, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        try:    resource_tracker.unregister(self.shm._name, 'shared_memory')    #   The publisher owns the block
+        except Exception:   pass
+        while True:
+            magic, meta_bytes, _ = _HEADER.unpack_from(self.shm.buf, 0)
+            if magic == _MAGIC:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Market state '{name}' was never initialised")
+            time.sleep(0.01)
+        meta = json.loads(bytes(self.shm.buf[_HEADER.size:_HEADER.size + meta_bytes]))
+        self.fields = meta['fields']
+        self.instruments = pd.DataFrame(meta['instruments'])
+        self.row_of = {key: row for row, key in enumerate(self.instruments['instrument_key'])}
+        self.candle_series = [tuple(series) for series in meta['candle_series']]
+        layout = state_layout(len(self.instruments), len(self.candle_series), meta['depth'])
+        self.arrays = shared_arrays(self.shm.buf, layout, _arrays_offset(meta_bytes))
+        for array in self.arrays.values():
+            array.flags.writeable = False
+        self.lock = SeqLock(self.arrays['seq'])
+
+    @property
+    def version(self):     #   Even, grows by 2 per publish
+        return int(self.arrays['seq'][0])
+
+    def _state(self):
+        arrays = self.arrays
+        return MarketState(int(arrays['seq'][0]), float(arrays['published_at'][0]), float(arrays['spot'][0]),
+                           arrays['values'], arrays['ltt'], arrays['candles'], arrays['candle_counts'])
+
+    def read(self, func=None):     #   func(MarketState) on in-place views, retried until no publish overlapped it
+        if func is None:
+            return self.lock.read(lambda: self._state().copy())[0]
+        return self.lock.read(lambda: func(self._state()))[0]
+
+    def wait_for_change(self, version, timeout=None, poll=0.001):  #   Newest version once it differs from `version`
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.version == version or self.version & 1:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            time.sleep(poll)
+        return self.version
+
+    def age(self):     #   Seconds since the last publish, a large value means the publisher stopped
+        return time.time() - float(self.arrays['published_at'][0])
+
+    def option_chain(self):    #   DataFrame copy, same columns as OptionChainStore.to_frame()
+        values = self.read(lambda state: state.values.copy())
+        df = self.instruments.copy()
+        for i, column in enumerate(self.fields):
+            df[column] = values[i]
+        return df
+
+    def candles(self, interval, instrument_key=CANDLE_INSTRUMENT):     #   DataFrame copy in CandleEngine.to_frame() layout
+        index = self.candle_series.index((instrument_key, interval))
+        rows = self.read(lambda state: state.series(index).copy())
+        df = pd.DataFrame(rows[:, 1:], columns=['Open', 'High', 'Low', 'Close'],
+                          index=pd.to_datetime(rows[:, 0].astype(np.int64), unit='s'))
+        df.index.name = 'Datetime'
+        return df
+
+    def close(self):
+        self.arrays = self.lock = None
+        self.shm.close()
+
+
+if __name__ == "__main__":     #   python market_state.py [name]: follow a running publisher
+    reader = MarketStateReader(sys.argv[1] if len(sys.argv) > 1 else STATE_NAME)
+    version = 0
+    while True:
+        version = reader.wait_for_change(version, timeout=5)
+        spot = reader.read(lambda state: state.spot)
+        print(f"version {version}  spot {spot}  age {reader.age():.3f} s")
+        print(reader.candles(5).tail(3))
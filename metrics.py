@@ -0,0 +1,209 @@
+#   metrics.py
+#   Low-overhead in-process metrics: HDR-style log-linear histograms, counters and gauges.
+#   Hot paths record with time.perf_counter_ns() deltas and a list increment; readers query
+#   METRICS.snapshot() at any time, and start_metrics_dump() writes it out periodically.
+#   `+=` is not atomic across threads, so each recording thread writes its own shard of every
+#   histogram and counter, and readers add the shards up.
+
+import json
+import threading
+import time
+
+SUB_BUCKET_BITS = 6                 #   64 sub-buckets per power of two, about 1.5% worst case relative error
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+LINEAR_LIMIT = SUB_BUCKET_COUNT * 2 #   Values below this get an exact bucket each
+BUCKET_COUNT = LINEAR_LIMIT + 57 * SUB_BUCKET_COUNT
+
+
+def bucket_index(value):
+    if value < LINEAR_LIMIT:
+        return value if value > 0 else 0
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return LINEAR_LIMIT + (shift - 1) * SUB_BUCKET_COUNT + (value >> shift) - SUB_BUCKET_COUNT
+
+
+def bucket_value(index):   #   Lowest value that lands in bucket `index`
+    if index < LINEAR_LIMIT:
+        return index
+    shift, sub = divmod(index - LINEAR_LIMIT, SUB_BUCKET_COUNT)
+    return (sub + SUB_BUCKET_COUNT) << (shift + 1)
+
+
+class _HistogramShard:   #   One thread's counts, only that thread writes them
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+class Histogram:    #   Integer values (ns for timers, ms for lag), fixed memory, mergeable
+
+    def __init__(self, name, unit='ns'):
+        self.name = name
+        self.unit = unit
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()   #   Guards the shard list, not recording
+
+    def _shard(self):
+        shard = _HistogramShard()
+        with self._lock:    #   Both under the lock, so a reset() cannot orphan the shard
+            self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def record(self, value):
+        value = int(value)
+        shard = getattr(self._local, 'shard', None) or self._shard()
+        shard.counts[bucket_index(value)] += 1
+        shard.count += 1
+        shard.total += value
+        if value > shard.max:
+            shard.max = value
+
+    @property
+    def counts(self):  #   Bucket counts summed over every thread
+        shards = list(self._shards)
+        if len(shards) == 1:
+            return list(shards[0].counts)
+        return [sum(column) for column in zip(*(shard.counts for shard in shards))] if shards else [0] * BUCKET_COUNT
+
+    @property
+    def count(self):
+        return sum(shard.count for shard in list(self._shards))
+
+    @property
+    def total(self):
+        return sum(shard.total for shard in list(self._shards))
+
+    @property
+    def max(self):
+        return max((shard.max for shard in list(self._shards)), default=0)
+
+    def percentile(self, percent, counts=None):
+        counts = counts if counts is not None else self.counts
+        count = sum(counts)
+        if not count:
+            return 0
+        target = count * percent / 100.0
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                return bucket_value(index)
+        return self.max
+
+    def reset(self):   #   Writers pick up a fresh shard on their next record
+        with self._lock:
+            self._shards = []
+            self._local = threading.local()
+
+    def summary(self):
+        counts, count, total = self.counts, self.count, self.total
+        return {
+            'unit': self.unit,
+            'count': count,
+            'mean': round(total / count, 1) if count else 0,
+            'p50': self.percentile(50, counts),
+            'p99': self.percentile(99, counts),
+            'p999': self.percentile(99.9, counts),
+            'max': self.max,
+        }
+
+
+class Metrics:
+
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}        #   Plain assignment, the last writer wins
+        self.sources = {}       #   name -> callable returning a JSON-able dict, evaluated on snapshot()
+        self._counter_shards = []   #   One name -> value dict per incrementing thread
+        self._local = threading.local()
+        self.lock = threading.Lock()    #   Guards creation of histograms and shards, recording takes no lock
+
+    def histogram(self, name, unit='ns'):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(name, unit))
+        return histogram
+
+    def increment(self, name, amount=1):
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = {}
+            with self.lock:
+                self._counter_shards.append(counters)
+                self._local.counters = counters
+        counters[name] = counters.get(name, 0) + amount
+
+    @property
+    def counters(self):    #   name -> value summed over every thread
+        totals = {}
+        for counters in list(self._counter_shards):
+            for name, value in list(counters.items()):
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def counter(self, name):
+        return sum(counters.get(name, 0) for counters in list(self._counter_shards))
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def gauge(self, name, default=None):
+        return self.gauges.get(name, default)
+
+    def add_source(self, name, func):  #   Stats kept elsewhere (e.g. per feed mode) that only need reading on snapshot
+        self.sources[name] = func
+
+    def snapshot(self):    #   Plain dict, safe to serialize
+        snapshot = {
+            'timestamp': time.time(),
+            'counters': self.counters,
+            'gauges': dict(self.gauges),
+            'histograms': {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+        }
+        for name, func in list(self.sources.items()):
+            snapshot[name] = func()
+        return snapshot
+
+    def reset(self):
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+        with self.lock:
+            self._counter_shards = []
+            self._local = threading.local()
+
+
+METRICS = Metrics()
+
+
+def record_feed_lag(exchange_ts_ms, now_ms=None, metrics=METRICS):  #   How far behind the exchange timestamp our processing is
+    if not exchange_ts_ms:
+        return
+    now_ms = now_ms if now_ms is not None else time.time() * 1000
+    lag_ms = max(0, int(now_ms - exchange_ts_ms))
+    metrics.histogram('feed_lag', unit='ms').record(lag_ms)
+    metrics.set_gauge('feed_lag_ms', lag_ms)
+
+
+def start_metrics_dump(interval=60, path='metrics.jsonl', lag_alert_ms=2000, metrics=METRICS):   #   Appends a snapshot every interval seconds
+    def dump():
+        while True:
+            time.sleep(interval)
+            snapshot = metrics.snapshot()
+            try:
+                with open(path, 'a') as file:
+                    file.write(json.dumps(snapshot) + '\n')
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+            lag = snapshot['gauges'].get('feed_lag_ms')
+            if lag is not None and lag > lag_alert_ms:
+                print(f"WARNING: processing is {lag} ms behind the feed")
+
+    thread = threading.Thread(target=dump, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,252 @@
+#   mock_upstox.py
+#   Local stand-in for the Upstox endpoints the feed uses, for offline load and latency testing.
+#   REST (served from --fixtures when a file is there, synthetic otherwise):
+#       GET /v2/market-quote/quotes                                  quotes.json
+#       GET /v2/historical-candle/<key>/1minute/<to>/<from>          historical.json
+#       GET /v2/historical-candle/intraday/<key>/1minute             intraday.json
+#       GET /v2/feed/market-data-feed/authorize                      (points at the websocket below)
+#       GET /v2/user/profile                                         (token check, always valid)
+#       GET /instruments/complete.csv.gz                             complete.csv.gz
+#   Websocket: accepts the usual "sub"/"unsub"/"change_mode" JSON messages and pushes synthetic
+#   FeedResponse frames for the subscribed instruments, each in its subscribed mode, at --rate frames per second.
+#
+#   Usage:  python mock_upstox.py --instruments 80 --rate 10
+#           UPSTOX_API_URL=http://127.0.0.1:8765 UPSTOX_INSTRUMENTS_URL=http://127.0.0.1:8765/instruments/complete.csv.gz python main.py
+
+import argparse
+import asyncio
+import gzip
+import io
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+import pandas as pd
+import websockets
+from synthetic_feed import NIFTY_KEY, build_feed_response, restamp, timestamp_fields
+
+
+def upcoming_thursday():   #   Same expiry rule create_options_df uses
+    today = datetime.today()
+    return (today + timedelta(days=(3 - today.weekday()) % 7)).strftime('%Y-%m-%d')
+
+
+def instruments_csv(spot, strikes_count, expiry):  #   Gzipped complete.csv.gz look-alike with NIFTY options around spot
+    atm = round(spot / 50) * 50
+    rows = []
+    for i in range(strikes_count):
+        strike = atm + 50 * (i // 2 - strikes_count // 4)
+        option_type = 'CE' if i % 2 == 0 else 'PE'
+        rows.append({
+            'instrument_key': f"NSE_FO|{40000 + i}", 'exchange_token': 40000 + i,
+            'tradingsymbol': f"NIFTY{strike}{option_type}", 'name': 'NIFTY', 'last_price': 0.0,
+            'expiry': expiry, 'strike': float(strike), 'tick_size': 0.05, 'lot_size': 25,
+            'instrument_type': 'OPTIDX', 'option_type': option_type, 'exchange': 'NSE_FO'})
+    rows.append({
+        'instrument_key': NIFTY_KEY, 'exchange_token': 26000, 'tradingsymbol': 'NIFTY', 'name': 'NIFTY 50',
+        'last_price': spot, 'expiry': None, 'strike': None, 'tick_size': 0.0, 'lot_size': 0,
+        'instrument_type': 'INDEX', 'option_type': None, 'exchange': 'NSE_INDEX'})
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+        gz.write(pd.DataFrame(rows).to_csv(index=False).encode())
+    return buffer.getvalue()
+
+
+def synthetic_candles(day, spot, until=None, rng=random):   #   Upstox style [ts, o, h, l, c, volume, oi] minutes of one session, newest first
+    candles = []
+    start = datetime.strptime(day, '%Y-%m-%d').replace(hour=9, minute=15)
+    price = spot
+    for minute in range(375):
+        ts = start + timedelta(minutes=minute)
+        if until is not None and ts >= until:
+            break
+        open_ = price
+        price += rng.uniform(-5, 5)
+        candles.append([ts.strftime('%Y-%m-%dT%H:%M:00+05:30'), round(open_, 2), round(max(open_, price) + 2, 2),
+                        round(min(open_, price) - 2, 2), round(price, 2), 0, 0])
+    return candles[::-1]
+
+
+class MockUpstox:
+
+    def __init__(self, host='127.0.0.1', port=8765, ws_port=8766, spot=24000.0, strikes_count=80,
+                 rate=10.0, pool_size=50, fixtures=None):
+        self.host, self.port, self.ws_port = host, port, ws_port
+        self.spot = spot
+        self.strikes_count = strikes_count
+        self.rate = rate
+        self.pool_size = pool_size
+        self.fixtures = fixtures
+        self.expiry = upcoming_thursday()
+        self.instruments_gz = instruments_csv(spot, strikes_count, self.expiry)
+        self.stats = {'connections': 0, 'frames_sent': 0, 'bytes_sent': 0, 'late_sends': 0}
+
+    @property
+    def api_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def instruments_url(self):
+        return f"{self.api_url}/instruments/complete.csv.gz"
+
+    def _fixture(self, name):
+        if self.fixtures:
+            path = os.path.join(self.fixtures, name)
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    return file.read()
+        return None
+
+    def handle_rest(self, path, query):     #   Returns (status, content_type, body)
+        if path == '/instruments/complete.csv.gz':
+            return 200, 'application/gzip', self._fixture('complete.csv.gz') or self.instruments_gz
+
+        if path == '/v2/feed/market-data-feed/authorize':
+            body = {'status': 'success', 'data': {'authorizedRedirectUri': f"ws://{self.host}:{self.ws_port}/feed"}}
+            return 200, 'application/json', json.dumps(body).encode()
+
+        if path == '/v2/user/profile':     #   Token check, every token is valid here
+            body = {'status': 'success', 'data': {'user_id': 'MOCK01', 'user_name': 'Mock User', 'is_active': True}}
+            return 200, 'application/json', json.dumps(body).encode()
+
+        if path == '/v2/market-quote/quotes':
+            fixture = self._fixture('quotes.json')
+            if fixture:
+                return 200, 'application/json', fixture
+            symbol = query.get('symbol', [NIFTY_KEY])[0].replace('|', ':')
+            ohlc = {'open': self.spot, 'high': self.spot + 50, 'low': self.spot - 50, 'close': self.spot}
+            body = {'status': 'success', 'data': {symbol: {'ohlc': ohlc, 'last_price': self.spot}}}
+            return 200, 'application/json', json.dumps(body).encode()
+
+        if path.startswith('/v2/historical-candle/intraday/'):
+            fixture = self._fixture('intraday.json')
+            if fixture:
+                return 200, 'application/json', fixture
+            now = datetime.now()
+            candles = synthetic_candles(now.strftime('%Y-%m-%d'), self.spot, until=now.replace(second=0, microsecond=0))
+            return 200, 'application/json', json.dumps({'status': 'success', 'data': {'candles': candles}}).encode()
+
+        if path.startswith('/v2/historical-candle/'):
+            fixture = self._fixture('historical.json')
+            if fixture:
+                return 200, 'application/json', fixture
+            to_date, from_date = path.rstrip('/').split('/')[-2:]
+            candles = []
+            for day in pd.bdate_range(from_date, to_date, inclusive='left')[::-1]:  # Newest day first
+                candles.extend(synthetic_candles(day.strftime('%Y-%m-%d'), self.spot))
+            return 200, 'application/json', json.dumps({'status': 'success', 'data': {'candles': candles}}).encode()
+
+        return 404, 'application/json', json.dumps({'status': 'error', 'errors': [{'message': f"No mock for {path}"}]}).encode()
+
+    def start_rest(self):  #   REST server on a daemon thread
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                status, content_type, body = mock.handle_rest(unquote(parsed.path), parse_qs(parsed.query))
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def build_pool(self, keys, modes=None):     #   Pre-built responses cycled by the sender so generation cost does not cap the rate
+        # Kept parsed with their timestamp fields, the sender restamps each from the wall clock so
+        # lag stays real and candles keep closing however long the pool is cycled
+        option_keys = [key for key in keys if key != NIFTY_KEY]
+        rng = random.Random(len(option_keys))
+        spot, now_ms = self.spot, int(time.time() * 1000)
+        pool = []
+        for i in range(self.pool_size):
+            spot += rng.uniform(-2, 2)
+            response = build_feed_response(option_keys, spot, now_ms + i, rng, include_index=NIFTY_KEY in keys, modes=modes)
+            pool.append((response, timestamp_fields(response)))
+        return pool
+
+    async def handle_feed(self, websocket):
+        self.stats['connections'] += 1
+        loop = asyncio.get_running_loop()
+        subscribed = {}     #   instrument_key -> mode
+        pool = []
+
+        async def receive_requests():
+            nonlocal pool
+            async for request in websocket:
+                request = json.loads(request)
+                data = request.get('data', {})
+                keys = data.get('instrumentKeys', [])
+                if request.get('method') == 'sub':
+                    subscribed.update(dict.fromkeys(keys, data.get('mode', 'full')))
+                elif request.get('method') == 'change_mode':
+                    subscribed.update({key: data.get('mode', 'full') for key in keys if key in subscribed})
+                elif request.get('method') == 'unsub':
+                    for key in keys: subscribed.pop(key, None)
+                pool = await loop.run_in_executor(None, self.build_pool, sorted(subscribed), dict(subscribed))
+
+        receiver = asyncio.ensure_future(receive_requests())
+        try:
+            interval = 1.0 / self.rate
+            next_send = loop.time()
+            sent = 0
+            while not receiver.done():
+                if pool:
+                    response, fields = pool[sent % len(pool)]
+                    frame = restamp(response, int(time.time() * 1000), fields).SerializeToString()
+                    await websocket.send(frame)
+                    sent += 1
+                    self.stats['frames_sent'] += 1
+                    self.stats['bytes_sent'] += len(frame)
+                next_send += interval
+                delay = next_send - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.stats['late_sends'] += 1   #   Client (or this sender) cannot keep up with the rate
+                    next_send = loop.time()
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+
+    async def serve(self):
+        self.start_rest()
+        async with websockets.serve(self.handle_feed, self.host, self.ws_port, max_size=None):
+            print(f"Mock Upstox REST at {self.api_url}, feed at ws://{self.host}:{self.ws_port}/feed")
+            last = dict(self.stats)
+            while True:
+                await asyncio.sleep(5)
+                sent = self.stats['frames_sent'] - last['frames_sent']
+                print(f"frames/s={sent / 5:.1f}  MB/s={(self.stats['bytes_sent'] - last['bytes_sent']) / 5e6:.2f}  "
+                      f"late_sends={self.stats['late_sends']}  connections={self.stats['connections']}")
+                last = dict(self.stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in Upstox server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ws-port', type=int, default=8766)
+    parser.add_argument('--spot', type=float, default=24000.0)
+    parser.add_argument('--instruments', type=int, default=80, help="option instruments in the synthetic master")
+    parser.add_argument('--rate', type=float, default=10.0, help="frames per second per connection")
+    parser.add_argument('--pool', type=int, default=50, help="pre-built frames cycled per connection")
+    parser.add_argument('--fixtures', default=None, help="directory with quotes.json / historical.json / intraday.json / complete.csv.gz")
+    args = parser.parse_args()
+
+    mock = MockUpstox(args.host, args.port, args.ws_port, args.spot, args.instruments, args.rate, args.pool, args.fixtures)
+    try:    asyncio.run(mock.serve())
+    except KeyboardInterrupt:   print("Shutting down...")
@@ -0,0 +1,246 @@
+#   option_analytics.py
+#   Vectorized Black-Scholes (prices, greeks, implied volatility) over NumPy arrays, and chain
+#   aggregates kept up to date incrementally from the strikes each frame touched.
+#   Conventions follow the feed: IV as a decimal (0.15), theta per calendar day, vega per
+#   1 volatility point, time to expiry in years to 15:30 IST on the expiry date.
+
+import math
+import numpy as np
+import pandas as pd
+
+RISK_FREE_RATE = 0.065
+YEAR_SECONDS = 365.0 * 86400
+EXPIRY_CLOSE_SECONDS = 15 * 3600 + 30 * 60     #   Options expire at 15:30 IST
+MIN_TIME = 1.0 / (365.0 * 24 * 60)            #   One minute, keeps d1/d2 finite on expiry day
+IV_BOUNDS = (0.005, 5.0)
+SQRT_2PI = math.sqrt(2 * math.pi)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def norm_cdf(x):   #   Abramowitz & Stegun 7.1.26 erf, absolute error below 1.5e-7, no SciPy needed
+    z = np.abs(x) / math.sqrt(2)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def _d1_d2(spot, strike, t, rate, vol):
+    sqrt_t = np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * vol * vol) * t) / (vol * sqrt_t)
+    return d1, d1 - vol * sqrt_t
+
+
+def bs_price(spot, strike, t, vol, is_call, rate=RISK_FREE_RATE):
+    d1, d2 = _d1_d2(spot, strike, t, rate, vol)
+    discount = strike * np.exp(-rate * t)
+    call = spot * norm_cdf(d1) - discount * norm_cdf(d2)
+    return np.where(is_call, call, call - spot + discount)     #   Put from put-call parity
+
+
+def bs_greeks(spot, strike, t, vol, is_call, rate=RISK_FREE_RATE):     #   (delta, gamma, theta per day, vega per vol point)
+    d1, d2 = _d1_d2(spot, strike, t, rate, vol)
+    sqrt_t = np.sqrt(t)
+    pdf = norm_pdf(d1)
+    discount = strike * np.exp(-rate * t)
+    delta = np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1.0)
+    gamma = pdf / (spot * vol * sqrt_t)
+    decay = -spot * pdf * vol / (2 * sqrt_t)
+    theta = np.where(is_call, decay - rate * discount * norm_cdf(d2), decay + rate * discount * norm_cdf(-d2)) / 365.0
+    vega = spot * pdf * sqrt_t / 100.0
+    return delta, gamma, theta, vega
+
+
+def implied_volatility(price, spot, strike, t, is_call, rate=RISK_FREE_RATE, iterations=50, tolerance=1e-4):
+    # Newton steps on vega, falling back to bisection inside a shrinking bracket where Newton
+    # leaves it; NaN where the price is below intrinsic value, not finite or did not converge
+    price, strike, t = np.broadcast_arrays(np.asarray(price, float), np.asarray(strike, float), np.asarray(t, float))
+    is_call = np.broadcast_to(is_call, price.shape)
+    discount = strike * np.exp(-rate * t)
+    intrinsic = np.where(is_call, np.maximum(spot - discount, 0.0), np.maximum(discount - spot, 0.0))
+    valid = np.isfinite(price) & (price > intrinsic) & (t > 0)
+
+    vol = np.full(price.shape, np.nan)
+    todo = np.flatnonzero(valid)    #   Only unconverged rows are priced again
+    low, high, guess = np.full(len(todo), IV_BOUNDS[0]), np.full(len(todo), IV_BOUNDS[1]), np.full(len(todo), 0.2)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for _ in range(iterations):
+            if not len(todo):
+                break
+            k, tt, c = strike[todo], t[todo], is_call[todo]
+            error = bs_price(spot, k, tt, guess, c, rate) - price[todo]
+            done = np.abs(error) <= tolerance
+            vol[todo[done]] = guess[done]
+            low = np.where(error < 0, guess, low)
+            high = np.where(error > 0, guess, high)
+            step = guess - error / (spot * norm_pdf(_d1_d2(spot, k, tt, rate, guess)[0]) * np.sqrt(tt))
+            bisect = ~np.isfinite(step) | (step <= low) | (step >= high)
+            guess = np.where(bisect, 0.5 * (low + high), step)
+            keep = ~done
+            todo, guess, low, high = todo[keep], guess[keep], low[keep], high[keep]
+    return vol
+
+
+def expiry_close(expiries):     #   IST wall-clock epoch seconds of 15:30 on each expiry date
+    days = pd.to_datetime(pd.Series(expiries).astype(str)).to_numpy(dtype='datetime64[s]').astype(np.int64)
+    return days + EXPIRY_CLOSE_SECONDS
+
+
+def time_to_expiry(expiry_close_ist, now_ist):    #   Years left, floored at MIN_TIME
+    return np.maximum((expiry_close_ist - now_ist) / YEAR_SECONDS, MIN_TIME)
+
+
+class OptionAnalytics:
+    # Fills greeks the feed did not send (ltpc strikes, missing optionGreeks) from LTP, and keeps
+    # chain totals as sums of per-row contributions: a frame costs O(rows it touched), vectorized,
+    # and summary() reads the totals in O(1). A re-laid store (strike window moved) is rebuilt once.
+
+    def __init__(self, option_chain, rate=RISK_FREE_RATE):
+        self.option_chain = option_chain
+        self.rate = rate
+        self.row_of = None
+        self.spot = None
+        self.filled = 0
+        self._reset()
+
+    def _reset(self):  #   Contributions for the store's current layout, recomputed from scratch
+        store = self.option_chain
+        self.row_of = store.row_of
+        size = len(store)
+        self.sign = np.where(store.is_call, 1.0, -1.0)
+        self.order = np.argsort(store.strikes, kind='stable')
+        self.expiry_close = expiry_close(store.instruments['expiry']) if size else np.zeros(0, dtype=np.int64)
+        self.reference_ltp = np.full(size, np.nan)     #   First LTP seen, the price side of OI buildup
+        self.contrib = {name: np.zeros(size) for name in ('oi', 'volume', 'oi_change', 'delta_oi', 'gamma_oi')}
+        self.totals = {name: [0.0, 0.0] for name in self.contrib}   #   [calls, puts]
+        self._update_rows(np.arange(size))
+
+    def _update_rows(self, rows):  #   Swap the contributions of `rows` for their current values
+        if not len(rows):
+            return
+        store = self.option_chain
+        oi = np.nan_to_num(store.oi[rows])
+        values = {
+            'oi': oi,
+            'volume': np.nan_to_num(store.volume[rows]),
+            'oi_change': np.where(np.isnan(store.poi[rows]), 0.0, oi - store.poi[rows]),
+            'delta_oi': np.nan_to_num(store.delta[rows]) * oi,
+            'gamma_oi': np.nan_to_num(store.gamma[rows]) * oi,
+        }
+        calls = store.is_call[rows]
+        for name, new in values.items():
+            diff = new - self.contrib[name][rows]
+            self.contrib[name][rows] = new
+            totals = self.totals[name]
+            totals[0] += float(diff[calls].sum())
+            totals[1] += float(diff[~calls].sum())
+        ltp = store.ltp[rows]
+        unseen = np.isnan(self.reference_ltp[rows])
+        self.reference_ltp[rows[unseen]] = ltp[unseen]
+
+    def fill_greeks(self, rows, spot, now_ist):    #   IV and greeks from LTP for `rows`, written into the store
+        if not len(rows) or not spot:
+            return 0
+        store = self.option_chain
+        t = time_to_expiry(self.expiry_close[rows], now_ist)
+        strikes, is_call = store.strikes[rows], store.is_call[rows]
+        iv = implied_volatility(store.ltp[rows], spot, strikes, t, is_call, self.rate)
+        delta, gamma, theta, vega = bs_greeks(spot, strikes, t, np.where(np.isnan(iv), 0.2, iv), is_call, self.rate)
+        known = ~np.isnan(iv)
+        rows = rows[known]
+        for column, values in (('IV', iv), ('Delta', delta), ('Gamma', gamma), ('Theta', theta), ('Vega', vega)):
+            store.fill(column, rows, values[known])
+        self.filled += len(rows)
+        return len(rows)
+
+    def apply(self, option_ticks, spot, now_ist):  #   After OptionChainStore.update_many() with the same ticks
+        if self.option_chain.row_of is not self.row_of:
+            self._reset()
+        row_of = self.row_of
+        rows, missing = [], []
+        for key, tick in option_ticks.items():
+            row = row_of.get(key)
+            if row is None:
+                continue
+            rows.append(row)
+            if tick.delta is None and tick.ltp:     #   ltpc mode, or a record without optionGreeks
+                missing.append(row)
+        self.apply_rows(np.asarray(rows, dtype=np.intp), np.asarray(missing, dtype=np.intp), spot, now_ist)
+
+    def apply_rows(self, rows, missing, spot, now_ist):    #   Same for store rows written in bulk, `missing` lack greeks
+        if self.option_chain.row_of is not self.row_of:
+            self._reset()
+        self.spot = spot
+        if len(missing):
+            self.fill_greeks(missing, spot, now_ist)
+        self._update_rows(rows)
+
+    def atm_row(self, option_type='CE'):   #   Row of the strike nearest the spot for one side
+        store = self.option_chain
+        if not self.spot or not len(store):
+            return None
+        side = np.flatnonzero(store.is_call == (option_type == 'CE'))
+        if not len(side):
+            return None
+        return int(side[np.argmin(np.abs(store.strikes[side] - self.spot))])
+
+    def iv_skew(self, distance=200):   #   OTM put IV minus OTM call IV `distance` points from the spot
+        store = self.option_chain
+        if not self.spot:
+            return None
+        puts = np.flatnonzero(~store.is_call)
+        calls = np.flatnonzero(store.is_call)
+        if not len(puts) or not len(calls):
+            return None
+        put = puts[np.argmin(np.abs(store.strikes[puts] - (self.spot - distance)))]
+        call = calls[np.argmin(np.abs(store.strikes[calls] - (self.spot + distance)))]
+        return float(store.iv[put] - store.iv[call])
+
+    def smile(self):   #   (strike, call IV, put IV) rows in strike order
+        store = self.option_chain
+        frame = pd.DataFrame({'strike': store.strikes, 'call': store.is_call, 'iv': store.iv})
+        return frame.pivot_table(index='strike', columns='call', values='iv', aggfunc='first').rename(
+            columns={True: 'call_iv', False: 'put_iv'})
+
+    def max_pain(self):    #   Settlement strike with the least total payout to option holders, O(strikes) with prefix sums
+        store = self.option_chain
+        if not len(store):
+            return None
+        oi = self.contrib['oi']
+        frame = pd.DataFrame({'strike': store.strikes, 'call_oi': np.where(store.is_call, oi, 0.0),
+                              'put_oi': np.where(store.is_call, 0.0, oi)}).groupby('strike').sum()
+        strikes = frame.index.to_numpy(dtype=np.float64)
+        call_oi, put_oi = frame['call_oi'].to_numpy(), frame['put_oi'].to_numpy()
+        # Calls below a settlement strike K pay sum(oi * (K - k)), puts above pay sum(oi * (k - K))
+        call_cum, call_weighted = np.cumsum(call_oi), np.cumsum(call_oi * strikes)
+        put_rcum, put_rweighted = np.cumsum(put_oi[::-1])[::-1], np.cumsum((put_oi * strikes)[::-1])[::-1]
+        pain = strikes * call_cum - call_weighted + put_rweighted - strikes * put_rcum
+        return float(strikes[int(np.argmin(pain))])
+
+    def buildup(self):     #   Per-row OI buildup: long/short buildup, short covering, long unwinding
+        store = self.option_chain
+        oi_up = self.contrib['oi_change'] > 0
+        price_up = store.ltp > self.reference_ltp
+        labels = np.where(oi_up, np.where(price_up, 'long_buildup', 'short_buildup'),
+                          np.where(price_up, 'short_covering', 'long_unwinding'))
+        return pd.Series(labels, index=store.instrument_keys)
+
+    def summary(self):     #   O(1) aggregates for snapshots and dashboards
+        call_oi, put_oi = self.totals['oi']
+        call_volume, put_volume = self.totals['volume']
+        gamma_calls, gamma_puts = self.totals['gamma_oi']
+        spot = self.spot or 0.0
+        return {
+            'pcr_oi': put_oi / call_oi if call_oi else None,
+            'pcr_volume': put_volume / call_volume if call_volume else None,
+            'call_oi': call_oi,
+            'put_oi': put_oi,
+            'call_oi_change': self.totals['oi_change'][0],
+            'put_oi_change': self.totals['oi_change'][1],
+            'net_delta': sum(self.totals['delta_oi']),
+            'net_gamma_exposure': (gamma_calls - gamma_puts) * spot * spot * 0.01,     #   Calls long, puts short gamma
+            'greeks_filled': self.filled,
+        }
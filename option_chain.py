@@ -0,0 +1,165 @@
+#   option_chain.py
+#   Columnar option chain store: preallocated NumPy arrays per field plus an
+#   instrument_key -> row dict built once, so every tick is an O(1) array write.
+
+import numpy as np
+import pandas as pd
+
+INSTRUMENT_COLUMNS = ['instrument_key', 'strike', 'option_type', 'expiry']
+
+#   DataFrame column name -> OptionTick field
+FIELD_COLUMNS = {
+    'LTP': 'ltp',
+    'Delta': 'delta',
+    'Theta': 'theta',
+    'Gamma': 'gamma',
+    'Vega': 'vega',
+    'IV': 'iv',
+    'Best_Bid_Price': 'bid',
+    'Best_Ask_Price': 'ask',
+    'Volume': 'volume',
+    'OI': 'oi',
+    'POI': 'poi',
+}
+
+
+class OptionChainStore:
+
+    def __init__(self, instruments_df, buffers=None):
+        self._layout(instruments_df, buffers)
+        self.updates = 0
+        self.frozen = False     #   Arrays handed out by freeze() are copied before the next write
+        self._bind_columns()
+
+    def _layout(self, instruments_df, buffers=None):   #   Row index and empty field arrays, or (values, ltt) arrays to write into
+        instruments_df = instruments_df[INSTRUMENT_COLUMNS].reset_index(drop=True)
+        self.instruments = instruments_df
+        self.instrument_keys = instruments_df['instrument_key'].tolist()
+        self.row_of = {key: row for row, key in enumerate(self.instrument_keys)}
+        self.strikes = pd.to_numeric(instruments_df['strike']).to_numpy(dtype=np.float64)
+        self.is_call = (instruments_df['option_type'] == 'CE').to_numpy()
+
+        size = len(instruments_df)
+        if buffers is not None:     #   e.g. shared memory, one row of `values` per FIELD_COLUMNS entry
+            values, self.ltt = buffers
+            self.columns = dict(zip(FIELD_COLUMNS, values))
+            return
+        self.columns = {column: np.full(size, np.nan) for column in FIELD_COLUMNS}
+        self.ltt = np.zeros(size, dtype=np.int64)     #   Last trade time (epoch ms) per row
+
+    def set_instruments(self, instruments_df):     #   Grow/shrink to a new instrument set, returns (added, removed) keys
+        old_row_of, old_columns, old_ltt = self.row_of, self.columns, self.ltt
+        self._layout(instruments_df)
+        kept = [(row, old_row_of[key]) for row, key in enumerate(self.instrument_keys) if key in old_row_of]
+        if kept:    #   Surviving instruments keep their last values, new ones start empty
+            new_rows, old_rows = np.array(kept, dtype=np.intp).T
+            for column, values in self.columns.items():
+                values[new_rows] = old_columns[column][old_rows]
+            self.ltt[new_rows] = old_ltt[old_rows]
+        self.frozen = False     #   Fresh arrays, views handed out earlier keep the old ones
+        self._bind_columns()
+        added = [key for key in self.instrument_keys if key not in old_row_of]
+        removed = [key for key in old_row_of if key not in self.row_of]
+        return added, removed
+
+    def _bind_columns(self):   #   Bound per-field arrays for the hot path
+        self.ltp, self.delta, self.theta, self.gamma, self.vega, self.iv = (
+            self.columns[c] for c in ('LTP', 'Delta', 'Theta', 'Gamma', 'Vega', 'IV'))
+        self.bid, self.ask, self.volume, self.oi, self.poi = (
+            self.columns[c] for c in ('Best_Bid_Price', 'Best_Ask_Price', 'Volume', 'OI', 'POI'))
+
+    def _thaw(self):    #   Copy-on-write: one copy per column after a freeze(), not one per tick
+        self.columns = {column: values.copy() for column, values in self.columns.items()}
+        self.ltt = self.ltt.copy()
+        self._bind_columns()
+        self.frozen = False
+
+    def freeze(self):  #   Read-only view of the current state, later writes go to fresh arrays
+        if not self.frozen:
+            for values in self.columns.values():
+                values.flags.writeable = False
+            self.ltt.flags.writeable = False
+            self.frozen = True
+        return OptionChainView(self)
+
+    def __len__(self):
+        return len(self.instrument_keys)
+
+    def update(self, key, tick):    #   Write one decoded OptionTick, returns False for unknown instruments
+        row = self.row_of.get(key)
+        if row is None:
+            return False
+        if self.frozen:
+            self._thaw()
+        self.ltp[row] = np.nan if tick.ltp is None else tick.ltp
+        # Sparser modes only overwrite what they carry: ltpc keeps the last greeks/quotes/OI,
+        # option_greeks keeps the last volume
+        mode = tick.mode
+        if mode != 'ltpc':
+            self.delta[row] = np.nan if tick.delta is None else tick.delta
+            self.theta[row] = np.nan if tick.theta is None else tick.theta
+            self.gamma[row] = np.nan if tick.gamma is None else tick.gamma
+            self.vega[row] = np.nan if tick.vega is None else tick.vega
+            self.iv[row] = np.nan if tick.iv is None else tick.iv
+            self.bid[row] = np.nan if tick.bid is None else tick.bid
+            self.ask[row] = np.nan if tick.ask is None else tick.ask
+            if mode == 'full':
+                self.volume[row] = np.nan if tick.volume is None else tick.volume
+            self.oi[row] = np.nan if tick.oi is None else tick.oi
+            self.poi[row] = np.nan if tick.poi is None else tick.poi
+        if tick.ltt:
+            self.ltt[row] = tick.ltt
+        self.updates += 1
+        return True
+
+    def fill(self, column, rows, values):  #   Vectorized write of derived values (e.g. computed greeks) into rows
+        if self.frozen:
+            self._thaw()
+        self.columns[column][rows] = values
+
+    def write_rows(self, instrument_keys, values, ltt):    #   Bulk copy of rows decoded elsewhere, returns the rows written
+        rows = np.fromiter((self.row_of.get(key, -1) for key in instrument_keys), dtype=np.intp, count=len(instrument_keys))
+        known = rows >= 0
+        rows = rows[known]
+        if self.frozen:
+            self._thaw()
+        for column, column_values in zip(FIELD_COLUMNS, values):
+            self.columns[column][rows] = column_values[known]
+        self.ltt[rows] = ltt[known]
+        self.updates += len(rows)
+        return rows, known
+
+    def update_many(self, option_ticks):
+        for key, tick in option_ticks.items():
+            self.update(key, tick)
+
+    def to_frame(self):     #   DataFrame view in the layout the old nifty_option_chain DataFrame had
+        df = self.instruments.copy()
+        for column, values in self.columns.items():
+            df[column] = values.copy()
+        return df
+
+
+class OptionChainView:     #   Immutable, zero-copy view of an OptionChainStore as of one freeze()
+
+    def __init__(self, store):
+        self.instruments = store.instruments
+        self.instrument_keys = store.instrument_keys
+        self.row_of = store.row_of
+        self.strikes = store.strikes
+        self.is_call = store.is_call
+        self.columns = dict(store.columns)
+        self.ltt = store.ltt
+        self.updates = store.updates
+
+    def __len__(self):
+        return len(self.instrument_keys)
+
+    def __getitem__(self, column):     #   view['LTP'] -> read-only array
+        return self.columns[column]
+
+    def to_frame(self):
+        df = self.instruments.copy()
+        for column, values in self.columns.items():
+            df[column] = values
+        return df
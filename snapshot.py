@@ -0,0 +1,63 @@
+#   snapshot.py
+#   Consistent, versioned snapshots of the shared market state.
+#   Writers build the next state off to the side and publish it with one reference swap;
+#   readers take latest() and get an immutable view that never changes underneath them,
+#   and can ask whether anything (or a given field) changed since the version they last saw.
+
+import threading
+import time
+from types import MappingProxyType
+from typing import NamedTuple, Any
+
+SNAPSHOT_FIELDS = ('nifty_spot_price', 'option_chain', 'complete_candle_data', 'option_analytics')
+
+
+class MarketSnapshot(NamedTuple):
+    version: int
+    published_at: float                 #   time.monotonic() of the publish
+    nifty_spot_price: Any
+    option_chain: Any                   #   OptionChainView with read-only arrays, or None
+    complete_candle_data: Any           #   Candles with the forming one last, replaced on publish, never modified afterwards
+    option_analytics: Any               #   OptionAnalytics.summary() dict as of the same frame
+    field_versions: MappingProxyType    #   field -> version in which it last changed
+
+    def changed_since(self, version, *fields):     #   Any field (or any of `fields`) newer than `version`
+        if not fields:
+            return self.version > version
+        return any(self.field_versions.get(field, 0) > version for field in fields)
+
+
+EMPTY_SNAPSHOT = MarketSnapshot(0, 0.0, None, None, None, None, MappingProxyType({}))
+
+
+class SnapshotPublisher:
+
+    def __init__(self):
+        self._current = EMPTY_SNAPSHOT
+        self._condition = threading.Condition()     #   Serializes writers, wakes wait_for_change() readers
+
+    def latest(self):  #   Lock-free, a single attribute read
+        return self._current
+
+    @property
+    def version(self):
+        return self._current.version
+
+    def publish(self, **changes):
+        unknown = set(changes) - set(SNAPSHOT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown snapshot fields: {sorted(unknown)}")
+        with self._condition:
+            current = self._current
+            version = current.version + 1
+            field_versions = dict(current.field_versions)
+            field_versions.update((field, version) for field in changes)
+            self._current = current._replace(version=version, published_at=time.monotonic(),
+                                             field_versions=MappingProxyType(field_versions), **changes)
+            self._condition.notify_all()
+            return self._current
+
+    def wait_for_change(self, version, timeout=None):  #   Block until a snapshot newer than `version` exists
+        with self._condition:
+            self._condition.wait_for(lambda: self._current.version > version, timeout)
+            return self._current
@@ -0,0 +1,67 @@
+#   startup.py
+#   Cold start as a small dependency graph: every step runs on its own thread as soon as the
+#   steps it depends on are done, so independent work (token, instrument master, candle history,
+#   open price) overlaps instead of running back to back. Each step has a readiness event to
+#   wait on in place of fixed sleeps, and its start/finish offsets are kept for the report.
+
+import threading
+import time
+from metrics import METRICS
+
+
+class StartupGraph:
+
+    def __init__(self):
+        self.steps = {}         #   name -> (func, deps), func is called with the results of deps in order
+        self.ready = {}         #   name -> threading.Event, set when the step finished or failed
+        self.results = {}
+        self.errors = {}
+        self.timings = {}       #   name -> (started, finished) in seconds since start()
+        self.started_at = None
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"Step {name!r} depends on unknown step {dep!r}")
+        self.steps[name] = (func, tuple(deps))
+        self.ready[name] = threading.Event()
+
+    def _run(self, name):
+        func, deps = self.steps[name]
+        try:
+            for dep in deps:
+                self.ready[dep].wait()
+                if dep in self.errors:
+                    raise RuntimeError(f"{dep} failed: {self.errors[dep]}")
+            started = time.perf_counter() - self.started_at
+            try:
+                self.results[name] = func(*(self.results[dep] for dep in deps))
+            finally:
+                finished = time.perf_counter() - self.started_at
+                self.timings[name] = (started, finished)
+                METRICS.set_gauge(f'startup_{name}_ms', round((finished - started) * 1000, 1))
+        except Exception as e:
+            self.errors[name] = e
+            print(f"Startup step {name} failed: {e}")
+        finally:
+            self.ready[name].set()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for name in self.steps:
+            threading.Thread(target=self._run, args=(name,), daemon=True, name=f'startup-{name}').start()
+        return self
+
+    def wait(self, name, timeout=None):    #   Result of a step, raising its error or TimeoutError
+        if not self.ready[name].wait(timeout):
+            raise TimeoutError(f"Startup step {name} not ready after {timeout} s")
+        if name in self.errors:
+            raise self.errors[name]
+        return self.results[name]
+
+    def report(self):  #   One line per finished step, in the order they finished
+        lines = ["Startup phases (s since start):"]
+        for name, (started, finished) in sorted(self.timings.items(), key=lambda item: item[1][1]):
+            status = 'failed' if name in self.errors else 'ok'
+            lines.append(f"    {name:20} {started:7.3f} -> {finished:7.3f}   {finished - started:7.3f}   {status}")
+        return '\n'.join(lines)
@@ -0,0 +1,118 @@
+#   subscription_manager.py
+#   Keeps the subscribed option strikes centred on the spot. The window is re-centred only once
+#   the spot has moved recentre_distance points away from the current centre (and no more often
+#   than every cooldown seconds), so a spot oscillating around a strike boundary causes no churn.
+#   Each re-centre yields the incremental sub/unsub key lists for the open socket and re-lays
+#   the OptionChainStore to the new window; every other frame costs one comparison.
+#   Strikes are subscribed in tiers by distance from ATM: full near the money, option_greeks
+#   (ltpc, best bid/ask, greeks, OI) further out, ltpc for the far wings. Explicit per-key
+#   overrides win over the tiers.
+
+import json
+import time
+from collections import defaultdict
+from feed_decoder import FEED_MODES
+from metrics import METRICS
+
+DEFAULT_MODE_TIERS = ((300, 'full'), (700, 'option_greeks'))    #   (max points from ATM, mode), anything further is ltpc
+
+
+def subscription_message(method, instrument_keys, mode='full'):  #   Binary sub/unsub/change_mode request for the feed socket
+    return json.dumps({
+        "guid": "someguid",
+        "method": method,
+        "data": {
+            "mode": mode,
+            "instrumentKeys": list(instrument_keys)
+        }
+    }).encode('utf-8')
+
+
+class StrikeWindow:
+
+    def __init__(self, instrument_master, underlying, expiry, half_width=1000, strike_step=50,
+                 recentre_distance=250, cooldown=5.0, mode_tiers=DEFAULT_MODE_TIERS, mode_overrides=None):
+        self.instrument_master = instrument_master
+        self.underlying = underlying
+        self.expiry = expiry
+        self.half_width = half_width
+        self.strike_step = strike_step
+        self.recentre_distance = recentre_distance
+        self.cooldown = cooldown
+        self.mode_tiers = tuple(mode_tiers) if mode_tiers is not None else ((float('inf'), 'full'),)
+        self.mode_overrides = dict(mode_overrides or {})     #   instrument_key -> mode
+        for mode in [mode for _, mode in self.mode_tiers] + list(self.mode_overrides.values()):
+            if mode not in FEED_MODES:
+                raise ValueError(f"Unknown feed mode {mode!r}, expected one of {FEED_MODES}")
+        self.modes = {}         #   instrument_key -> mode it is subscribed in
+        self.centre = None
+        self.recentred_at = 0.0
+        self.recentres = 0
+
+    def atm_strike(self, price):
+        return round(price / self.strike_step) * self.strike_step
+
+    def instruments(self, centre):  #   Option rows of the window around `centre`
+        return self.instrument_master.options(self.underlying, self.expiry,
+                                              (centre - self.half_width, centre + self.half_width))
+
+    def universe(self):    #   Every option row of the expiry, whatever the window
+        return self.instrument_master.options(self.underlying, self.expiry)
+
+    def mode_for(self, instrument_key, strike, centre):
+        mode = self.mode_overrides.get(instrument_key)
+        if mode is not None:
+            return mode
+        distance = abs(strike - centre)
+        for limit, mode in self.mode_tiers:
+            if distance <= limit:
+                return mode
+        return 'ltpc'
+
+    def plan_modes(self, instruments_df, centre):  #   instrument_key -> mode for a window
+        return {key: self.mode_for(key, strike, centre)
+                for key, strike in zip(instruments_df['instrument_key'].tolist(), instruments_df['strike'].astype(float).tolist())}
+
+    def subscriptions(self):   #   mode -> keys currently subscribed, for the initial sub messages
+        return group_by_mode(self.modes)
+
+    def start(self, price):     #   Initial window, centred on the open (or the first spot seen)
+        self.centre = self.atm_strike(price)
+        self.recentred_at = time.monotonic()
+        instruments = self.instruments(self.centre)
+        self.modes = self.plan_modes(instruments, self.centre)
+        return instruments
+
+    def should_recentre(self, spot, now=None):
+        if not spot or self.centre is None or abs(spot - self.centre) < self.recentre_distance:
+            return False
+        now = now if now is not None else time.monotonic()
+        return now - self.recentred_at >= self.cooldown
+
+    def recentre(self, option_chain, spot, now=None):
+        # Returns (subscribe, unsubscribe, change_mode) or None when the window holds;
+        # subscribe and change_mode are {mode: [keys]}, unsubscribe is [keys]
+        if not self.should_recentre(spot, now):
+            return None
+        started = time.perf_counter_ns()
+        self.centre = self.atm_strike(spot)
+        self.recentred_at = now if now is not None else time.monotonic()
+        instruments = self.instruments(self.centre)
+        added, removed = option_chain.set_instruments(instruments)
+        modes = self.plan_modes(instruments, self.centre)
+        subscribe = group_by_mode({key: modes[key] for key in added})
+        change_mode = group_by_mode({key: mode for key, mode in modes.items()
+                                     if key in self.modes and self.modes[key] != mode})
+        self.modes = modes
+        self.recentres += 1
+        METRICS.increment('strike_recentres')
+        METRICS.set_gauge('strike_window_centre', self.centre)
+        METRICS.histogram('strike_recentre').record(time.perf_counter_ns() - started)
+        return subscribe, removed, change_mode
+
+
+def group_by_mode(modes):  #   {key: mode} -> {mode: [keys]}
+    grouped = defaultdict(list)
+    for key, mode in modes.items():
+        grouped[mode].append(key)
+    return dict(grouped)
@@ -0,0 +1,123 @@
+#   synthetic_feed.py
+#   Builds realistic FeedResponse frames for benchmarks and offline testing, every option in
+#   "full" mode unless a per-key mode ("ltpc", "option_greeks") is given.
+
+import random
+import time
+import MarketDataFeed_pb2 as pb
+
+NIFTY_KEY = "NSE_INDEX|Nifty 50"
+
+
+def option_instrument_keys(strikes_count, first_token=40000):
+    return [f"NSE_FO|{first_token + i}" for i in range(strikes_count)]
+
+
+def _fill_ohlc(ohlc, interval, price, ts, volume=0):
+    ohlc.interval = interval
+    ohlc.open = price
+    ohlc.high = price + 5
+    ohlc.low = price - 5
+    ohlc.close = price
+    ohlc.volume = volume
+    ohlc.ts = ts
+
+
+def _fill_greeks(greeks, ltp, spot, rng):
+    greeks.op, greeks.up, greeks.iv = ltp, spot, rng.uniform(0.1, 0.3)
+    greeks.delta, greeks.theta, greeks.gamma, greeks.vega, greeks.rho = rng.uniform(-1, 1), -12.5, 0.0012, 8.4, 0.5
+
+
+def build_feed_response(option_keys, spot=24000.0, ts_ms=None, rng=random, include_index=True, modes=None):
+    ts_ms = ts_ms if ts_ms is not None else int(time.time() * 1000)
+    minute_ts = ts_ms - ts_ms % 60000
+    response = pb.FeedResponse()
+    response.type = pb.live_feed
+    response.currentTs = ts_ms
+
+    if include_index:
+        index_ff = response.feeds[NIFTY_KEY].ff.indexFF
+        index_ff.ltpc.ltp = spot
+        index_ff.ltpc.ltt = ts_ms
+        index_ff.ltpc.cp = spot - 50
+        _fill_ohlc(index_ff.marketOHLC.ohlc.add(), "1d", spot, ts_ms - ts_ms % 86400000)
+        _fill_ohlc(index_ff.marketOHLC.ohlc.add(), "I1", spot - 2, minute_ts - 60000)
+        _fill_ohlc(index_ff.marketOHLC.ohlc.add(), "I1", spot, minute_ts)
+
+    modes = modes or {}
+    for key in option_keys:
+        ltp = round(rng.uniform(1, 500), 2)
+        mode = modes.get(key, 'full')
+        if mode == 'ltpc':
+            ltpc = response.feeds[key].ltpc
+            ltpc.ltp, ltpc.ltt, ltpc.ltq, ltpc.cp = ltp, ts_ms, 25, ltp
+            continue
+        if mode == 'option_greeks':
+            option_chain = response.feeds[key].oc
+            ltpc = option_chain.ltpc
+            ltpc.ltp, ltpc.ltt, ltpc.ltq, ltpc.cp = ltp, ts_ms, 25, ltp
+            quote = option_chain.bidAskQuote
+            quote.bq, quote.bp, quote.bno, quote.aq, quote.ap, quote.ano = 75, ltp - 0.05, 3, 75, ltp + 0.05, 2
+            _fill_greeks(option_chain.optionGreeks, ltp, spot, rng)
+            option_chain.eFeedDetails.oi, option_chain.eFeedDetails.poi = float(rng.randint(10**4, 10**7)), float(rng.randint(10**4, 10**7))
+            continue
+
+        market_ff = response.feeds[key].ff.marketFF
+        market_ff.ltpc.ltp = ltp
+        market_ff.ltpc.ltt = ts_ms
+        market_ff.ltpc.ltq = 25
+        market_ff.ltpc.cp = ltp
+        for level in range(5):
+            quote = market_ff.marketLevel.bidAskQuote.add()
+            quote.bq, quote.bp, quote.bno = 75, ltp - 0.05 * (level + 1), 3
+            quote.aq, quote.ap, quote.ano = 75, ltp + 0.05 * (level + 1), 2
+        _fill_greeks(market_ff.optionGreeks, ltp, spot, rng)
+        _fill_ohlc(market_ff.marketOHLC.ohlc.add(), "1d", ltp, ts_ms - ts_ms % 86400000, rng.randint(1000, 10**6))
+        _fill_ohlc(market_ff.marketOHLC.ohlc.add(), "I1", ltp, minute_ts, rng.randint(10, 1000))
+        details = market_ff.eFeedDetails
+        details.atp, details.cp, details.vtt = ltp, ltp, rng.randint(1000, 10**6)
+        details.oi, details.poi = float(rng.randint(10**4, 10**7)), float(rng.randint(10**4, 10**7))
+        details.tbq, details.tsq, details.lc, details.uc = 1e5, 1e5, 0.05, ltp * 3
+
+    return response
+
+
+def timestamp_fields(response):    #   (ltpc messages, 1d bars, (I1 bar, minutes old) pairs) of a built response, for restamp()
+    ltpcs, day_bars, minute_bars = [], [], []
+    for feed in response.feeds.values():
+        kind = feed.WhichOneof('FeedUnion')
+        if kind == 'ltpc':
+            ltpcs.append(feed.ltpc)
+            continue
+        if kind == 'oc':
+            ltpcs.append(feed.oc.ltpc)
+            continue
+        full_feed = feed.ff.indexFF if feed.ff.WhichOneof('FullFeedUnion') == 'indexFF' else feed.ff.marketFF
+        ltpcs.append(full_feed.ltpc)
+        day_bars += [ohlc for ohlc in full_feed.marketOHLC.ohlc if ohlc.interval == "1d"]
+        bars = [ohlc for ohlc in full_feed.marketOHLC.ohlc if ohlc.interval == "I1"]
+        minute_bars += [(ohlc, age) for age, ohlc in enumerate(reversed(bars))]    #   Newest I1 bar is the current minute
+    return ltpcs, day_bars, minute_bars
+
+
+def restamp(response, ts_ms, fields=None):     #   Move a built response's timestamps to ts_ms in place, as build_feed_response(ts_ms=) would set them
+    ltpcs, day_bars, minute_bars = fields or timestamp_fields(response)    #   Pass timestamp_fields() when restamping the same response often
+    minute_ts, day_ts = ts_ms - ts_ms % 60000, ts_ms - ts_ms % 86400000
+    response.currentTs = ts_ms
+    for ltpc in ltpcs:
+        ltpc.ltt = ts_ms
+    for ohlc in day_bars:
+        ohlc.ts = day_ts
+    for ohlc, age in minute_bars:
+        ohlc.ts = minute_ts - age * 60000
+    return response
+
+
+def build_frames(option_keys, count, spot=24000.0, start_ts_ms=None, step_ms=250, seed=7, modes=None):
+    rng = random.Random(seed)
+    start_ts_ms = start_ts_ms if start_ts_ms is not None else int(time.time() * 1000)
+    frames = []
+    for i in range(count):
+        spot += rng.uniform(-2, 2)
+        frames.append(build_feed_response(option_keys, spot, start_ts_ms + i * step_ms, rng, modes=modes).SerializeToString())
+    return frames
@@ -0,0 +1,125 @@
+#   tick_history.py
+#   Bounded intraday tick history per instrument. Each instrument owns one row of a preallocated
+#   structured array used as a ring; every record is written twice (at i and i + capacity), so
+#   the last N records are always one contiguous slice and window queries return read-only
+#   views, never copies. A frame's ticks are appended in one vectorized step. Memory is capped
+#   up front: when every slot is taken the least recently updated instrument is evicted.
+
+import numpy as np
+import pandas as pd
+
+TICK_DTYPE = np.dtype([
+    ('ts', np.int64),          #   Exchange last trade time, epoch ms
+    ('ltp', np.float64),
+    ('bid', np.float64),
+    ('ask', np.float64),
+    ('volume', np.float64),
+    ('oi', np.float64),
+    ('iv', np.float64),
+])
+DEFAULT_CAPACITY = 4096         #   Records per instrument, ~17 minutes at 4 ticks/s
+DEFAULT_MEMORY_CAP = 128 << 20  #   Bytes for all rings together (pages are only touched when written)
+
+
+class TickHistory:
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, memory_cap=DEFAULT_MEMORY_CAP):
+        self.capacity = capacity
+        slot_bytes = 2 * capacity * TICK_DTYPE.itemsize
+        self.slots = max(1, memory_cap // slot_bytes)
+        self.data = np.zeros((self.slots, 2 * capacity), dtype=TICK_DTYPE)
+        self.head = np.zeros(self.slots, dtype=np.int64)        #   Next write position, 0..capacity-1
+        self.count = np.zeros(self.slots, dtype=np.int64)
+        self.touched = np.zeros(self.slots, dtype=np.int64)     #   Append sequence of the last write, for eviction
+        self.slot_of = {}       #   instrument_key -> slot
+        self.key_of = {}        #   slot -> instrument_key
+        self.sequence = 0
+        self.appends = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, instrument_key):
+        return instrument_key in self.slot_of
+
+    def _slot(self, instrument_key):   #   Slot of an instrument, claiming (or evicting) one on first use
+        slot = self.slot_of.get(instrument_key)
+        if slot is not None:
+            return slot
+        if len(self.slot_of) < self.slots:
+            slot = len(self.slot_of)
+        else:   #   Memory cap reached: reuse the slot that went longest without an update
+            slot = int(np.argmin(self.touched))
+            del self.slot_of[self.key_of[slot]]
+            self.evictions += 1
+        self.slot_of[instrument_key] = slot
+        self.key_of[slot] = instrument_key
+        self.head[slot] = self.count[slot] = 0
+        self.touched[slot] = self.sequence + 1  #   Not evicted again within the same batch
+        return slot
+
+    def append_many(self, instrument_keys, ts, ltp, bid, ask, volume, oi, iv):    #   One record per key, each argument an array
+        if not len(instrument_keys):
+            return
+        slots = np.fromiter((self._slot(key) for key in instrument_keys), dtype=np.intp, count=len(instrument_keys))
+        records = np.empty(len(slots), dtype=TICK_DTYPE)
+        records['ts'], records['ltp'], records['bid'], records['ask'] = ts, ltp, bid, ask
+        records['volume'], records['oi'], records['iv'] = volume, oi, iv
+        head = self.head[slots]
+        self.data[slots, head] = records
+        self.data[slots, head + self.capacity] = records    #   Mirror, keeps the newest `capacity` records contiguous
+        self.head[slots] = (head + 1) % self.capacity
+        self.count[slots] = np.minimum(self.count[slots] + 1, self.capacity)
+        self.sequence += 1
+        self.touched[slots] = self.sequence
+        self.appends += len(slots)
+
+    def append(self, instrument_key, ts, ltp, bid=np.nan, ask=np.nan, volume=np.nan, oi=np.nan, iv=np.nan):
+        self.append_many([instrument_key], ts, ltp, bid, ask, volume, oi, iv)
+
+    def record(self, option_chain, instrument_keys):   #   Append the current store values of keys just written to an OptionChainStore
+        row_of = option_chain.row_of
+        keys = [key for key in instrument_keys if key in row_of]
+        if not keys:
+            return
+        rows = np.fromiter((row_of[key] for key in keys), dtype=np.intp, count=len(keys))
+        self.append_many(keys, option_chain.ltt[rows], option_chain.ltp[rows], option_chain.bid[rows], option_chain.ask[rows],
+                         option_chain.volume[rows], option_chain.oi[rows], option_chain.iv[rows])
+
+    def last(self, instrument_key, n=None):    #   Newest n records (all kept if None), oldest first, read-only view
+        slot = self.slot_of.get(instrument_key)
+        if slot is None:
+            return self.data[0, :0]
+        count = int(self.count[slot])
+        n = count if n is None else min(n, count)
+        end = int(self.head[slot]) + self.capacity
+        window = self.data[slot, end - n:end]
+        window.flags.writeable = False
+        return window      #   Overwritten after `capacity` more appends, copy() to keep it longer
+
+    def since(self, instrument_key, ts):   #   Records with ts >= ts (epoch ms), read-only view
+        window = self.last(instrument_key)
+        return window[int(np.searchsorted(window['ts'], ts, side='left')):]
+
+    def latest(self, instrument_key):
+        window = self.last(instrument_key, 1)
+        return window[0] if len(window) else None
+
+    def to_frame(self, instrument_key, n=None):    #   DataFrame copy indexed by exchange time (UTC)
+        df = pd.DataFrame(self.last(instrument_key, n).copy())
+        df.index = pd.to_datetime(df.pop('ts'), unit='ms')
+        return df
+
+    def memory_bytes(self):    #   Upper bound, reserved at construction
+        return self.data.nbytes
+
+    def stats(self):
+        return {
+            'instruments': len(self.slot_of),
+            'slots': self.slots,
+            'capacity': self.capacity,
+            'appends': self.appends,
+            'evictions': self.evictions,
+            'memory_cap_bytes': self.memory_bytes(),
+        }
@@ -0,0 +1,110 @@
+#   token_manager.py
+#   Hands out the Upstox access token from memory. On first use the cached access_token.txt is
+#   checked locally (JWT exp claim, else the 3:30 AM IST daily rollover against the file's mtime)
+#   and with one profile request; only when that fails is login_auto (Playwright + Chromium)
+#   imported and the browser login run.
+
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from endpoints import api_url
+from http_client import HTTP
+
+TOKEN_FILE = 'access_token.txt'
+IST = timezone(timedelta(hours=5, minutes=30))
+TOKEN_ROLLOVER = (3, 30)    #   Upstox access tokens stop working at 3:30 AM IST the next day
+EXPIRY_MARGIN = 60          #   Treat a token as expired this many seconds early
+
+
+def jwt_expiry(token):     #   exp claim (epoch seconds) of a JWT, None when the token is not one
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:
+        return None
+
+
+def rollover_expiry(issued_at):    #   Next 3:30 AM IST after issued_at (epoch seconds)
+    issued = datetime.fromtimestamp(issued_at, IST)
+    expiry = issued.replace(hour=TOKEN_ROLLOVER[0], minute=TOKEN_ROLLOVER[1], second=0, microsecond=0)
+    if expiry <= issued:
+        expiry += timedelta(days=1)
+    return expiry.timestamp()
+
+
+class TokenManager:
+
+    def __init__(self, token_file=TOKEN_FILE, credentials_file='credentials.json', verify=True):
+        self.token_file = token_file
+        self.credentials_file = credentials_file
+        self.verify = verify        #   One profile request to catch tokens revoked by a newer login
+        self._token = None
+        self._expires_at = 0.0
+        self._rejected = None       #   Token the server refused, never reloaded from the file
+        self._lock = threading.Lock()
+        self.source = None          #   'cache' or 'login', for startup reporting
+
+    def _load_cached(self):    #   (token, expires_at) from the token file, None when missing or expired
+        try:
+            with open(self.token_file, 'r') as file:
+                token = file.read().strip()
+            issued_at = os.path.getmtime(self.token_file)
+        except OSError:
+            return None
+        if not token or token == self._rejected:
+            return None
+        expires_at = jwt_expiry(token) or rollover_expiry(issued_at)
+        if expires_at - EXPIRY_MARGIN <= time.time():
+            return None
+        return token, expires_at
+
+    def verify_remote(self, token):    #   False only on an explicit 401, network trouble keeps the local verdict
+        try:
+            response = HTTP.get(api_url('/v2/user/profile'), headers=self.headers(token), timeout=(3, 5))
+        except Exception as e:
+            print(f"Token check skipped: {e}")
+            return True
+        return response.status_code != 401
+
+    def login(self):   #   Full browser login, Playwright is only imported here
+        from login_auto import fetch_access_token
+        token = fetch_access_token(credentials_file=self.credentials_file)
+        self._token = token
+        self._expires_at = jwt_expiry(token) or rollover_expiry(time.time())
+        self.source = 'login'
+        return token
+
+    def get(self):     #   Valid access token, logging in at most once per expiry
+        if self._token is not None and self._expires_at - EXPIRY_MARGIN > time.time():
+            return self._token
+        with self._lock:
+            if self._token is not None and self._expires_at - EXPIRY_MARGIN > time.time():
+                return self._token
+            cached = self._load_cached()
+            if cached is not None:
+                if not self.verify or self.verify_remote(cached[0]):
+                    self._token, self._expires_at = cached
+                    self.source = 'cache'
+                    return self._token
+                self._rejected = cached[0]
+            return self.login()
+
+    def invalidate(self):  #   After a 401 elsewhere, the next get() logs in again
+        with self._lock:
+            self._rejected = self._token
+            self._token = None
+            self._expires_at = 0.0
+
+    def headers(self, token=None):
+        return {
+            'accept': 'application/json',
+            'Api-Version': '2.0',
+            'Authorization': f'Bearer {token or self.get()}'
+        }
+
+
+TOKENS = TokenManager()
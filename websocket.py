@@ -1,185 +1,377 @@
-import asyncio
-import json
-import ssl
-import upstox_client
-import websockets
-from google.protobuf.json_format import MessageToDict
-import MarketDataFeed_pb2 as pb
-import pandas as pd
-import requests as rq
+import threading
+import time
+from feed_decoder import decode_feed_response, ModeStats, FEED_MODES
+from option_chain import OptionChainStore, FIELD_COLUMNS
+from instrument_master import load_instrument_master
+from candle_builder import exchange_ms_to_ist_seconds, IST_OFFSET_SECONDS
+from candle_data import CANDLE_INSTRUMENT, PUBLISHED_INTERVAL, backfill_instruments
+from feed_recorder import FrameRecorder
+from connection_manager import ConnectionManager
+from endpoints import api_url
+from http_client import HTTP
+from token_manager import TOKENS
+from metrics import METRICS, record_feed_lag
+from event_bus import TOPIC_SPOT, TOPIC_SNAPSHOT, option_topic
+from subscription_manager import StrikeWindow, DEFAULT_MODE_TIERS
+from option_analytics import OptionAnalytics
+from decode_worker import DecodeOffload
+from tick_history import TickHistory
+import numpy as np
 import nest_asyncio
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timedelta
 nest_asyncio.apply()    # Enable nested event loops
 
 # Initialize global market data dictionary
 market_data = {
     'nifty_spot_price': None,
-    'websocket_candle_data': pd.DataFrame(),
-    'nifty_option_chain': pd.DataFrame()
+    'nifty_option_chain': None     #   OptionChainStore, use .to_frame() for a DataFrame view
 }
 
-def start_websocket(data_dict):
-    def get_access_token():
-        with open('access_token.txt', 'r') as file:
-            return file.read().strip()
+# Option feed mode by distance from ATM (None subscribes every strike in full), overrides are instrument_key -> mode
+OPTION_MODE_TIERS = DEFAULT_MODE_TIERS
+OPTION_MODE_OVERRIDES = {}
 
-    def initialize_market_data():   #   Initialize required market data and return instrument keys list
-        
-        def get_open_value(access_token):
-            url = "https://api.upstox.com/v2/market-quote/quotes"
-            headers = {
-                'accept': 'application/json',
-                'Api-Version': '2.0',
-                'Authorization': f'Bearer {access_token}'
-            }
-            response = rq.get(url, headers=headers, params={'symbol': "NSE_INDEX|Nifty 50"})
-            return response.json()['data']['NSE_INDEX:Nifty 50']['ohlc']['open']
-
-        def create_options_df(open_value):
-            strike_price_cap = 1000
-            rounded_open = round(open_value / 50) * 50
-            strike_range = (rounded_open - strike_price_cap, rounded_open + strike_price_cap)
-            
-            # Read the instruments data
-            instruments_df = pd.read_csv("https://assets.upstox.com/market-quote/instruments/exchange/complete.csv.gz")
-            
-            # Filter for the relevant options
-            options_df = instruments_df[
-                (instruments_df['exchange'] == 'NSE_FO') &
-                (instruments_df['instrument_type'] == 'OPTIDX') &
-                (instruments_df['lot_size'] == 25) &
-                (instruments_df['option_type'].isin(['CE', 'PE']))
-            ]
-            
-            # Find the upcoming Thursday
-            today = datetime.today()
-            days_until_thursday = (3 - today.weekday()) % 7  # 3 is Thursday (0=Monday, 6=Sunday)
-            upcoming_thursday = today + timedelta(days=days_until_thursday)
-            upcoming_thursday_str = upcoming_thursday.strftime('%Y-%m-%d')  # Format: 2024-11-28
-            
-            data_dict['nifty_option_chain'] = options_df[
-                (options_df['expiry'] == upcoming_thursday_str) &
-                (pd.to_numeric(options_df['strike']) >= strike_range[0]) &
-                (pd.to_numeric(options_df['strike']) <= strike_range[1])
-            ][['instrument_key', 'strike', 'option_type', 'expiry']]
-            
-            return data_dict['nifty_option_chain']['instrument_key'].tolist()
-
-        access_token = get_access_token()
-        open_value = get_open_value(access_token)
-        instrument_keys = create_options_df(open_value)
-        instrument_keys.append("NSE_INDEX|Nifty 50")
-        
-        return access_token, instrument_keys
+# Records, bytes and decode time per feed mode, with the savings against full mode in every metrics snapshot
+MODE_STATS = ModeStats()
+METRICS.add_source('feed_modes', MODE_STATS.savings)
 
+# Per shard: frames queued between recv() and processing, and what happens when the queue is full (see ingest_queue.py)
+INGEST_QUEUE_SIZE = 256
+INGEST_POLICY = 'conflate'      #   Latest state of every instrument matters more than each intermediate tick
+INGEST_MAX_BATCH = 32
 
-    def process_nifty_spot(nifty_data): #   Extract Nifty 50 spot price from websocket data
-        
-        if nifty_data:
-            data_dict['nifty_spot_price'] = nifty_data.get("ff", {}).get("indexFF", {}).get("ltpc", {}).get("ltp")
+# Rows of DecodeOffload values and the ltpc mode code, for the offloaded path
+_LTP_ROW, _DELTA_ROW = list(FIELD_COLUMNS).index('LTP'), list(FIELD_COLUMNS).index('Delta')
+_LTPC_MODE = FEED_MODES.index('ltpc')
 
-    def process_nifty_candles(nifty_data):  #   Process Nifty 50 candle data, convert to IST
-        
-        if not nifty_data:  return
-        IST_OFFSET = timedelta(hours=5, minutes=30)
-        candles = []
-
-        ohlc_data = nifty_data.get("ff", {}).get("indexFF", {}).get("marketOHLC", {}).get("ohlc", [])
-        for candle in ohlc_data:
-            if candle.get("interval") == "I1" and candle.get("ts"):
-                timestamp = int(candle["ts"])
-                ist_dt = (datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc) + IST_OFFSET)
-                candles.append({
-                    "Date": ist_dt.strftime('%Y-%m-%d'),
-                    "Time": ist_dt.strftime('%H:%M:%S'),
-                    "Open": candle.get("open"),
-                    "High": candle.get("high"),
-                    "Low": candle.get("low"),
-                    "Close": candle.get("close"),})
+def process_nifty_spot(data_dict, nifty_tick): #   Extract Nifty 50 spot price from the decoded index record
+    
+    if nifty_tick:
+        changed = nifty_tick.ltp != data_dict['nifty_spot_price']
+        data_dict['nifty_spot_price'] = nifty_tick.ltp
+        events = data_dict.get('events')
+        if changed and events is not None: events.publish(TOPIC_SPOT, nifty_tick.ltp)
+        tick_history = data_dict.get('tick_history')
+        if changed and tick_history is not None and nifty_tick.ltt: tick_history.append("NSE_INDEX|Nifty 50", nifty_tick.ltt, nifty_tick.ltp)
+
+def process_nifty_candles(data_dict, nifty_tick):  #   Fold the Nifty 50 I1 bars into the candle engine, timestamps in IST
+    
+    if not nifty_tick:  return
+
+    # Every subscribed interval is updated in place
+    candle_engine = data_dict.get('candle_engine')
+    if candle_engine is not None:
+        for candle in nifty_tick.candles:
+            if candle.interval == "I1" and candle.ts:
+                candle_engine.update_bar(CANDLE_INSTRUMENT, exchange_ms_to_ist_seconds(candle.ts),
+                                         candle.open, candle.high, candle.low, candle.close)
+        # The candle DataFrame is rebuilt once per closed bucket, ticks in between only replace the forming row
+        closed = candle_engine.closed_version(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+        if closed != data_dict.get('complete_candle_closed'):
+            started = time.perf_counter_ns()
+            data_dict['complete_candle_data'] = candle_engine.to_frame(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+            data_dict['complete_candle_closed'] = closed
+            METRICS.histogram('candle_rebuild').record(time.perf_counter_ns() - started)
+        else:
+            data_dict['complete_candle_data'] = candle_engine.forming_frame(data_dict.get('complete_candle_data'),
+                                                                            CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+
+    # Every I1 bar except the newest one has closed, persist those
+    candle_store = data_dict.get('candle_store')
+    if candle_store is not None:
+        bars = sorted((exchange_ms_to_ist_seconds(c.ts), c.open, c.high, c.low, c.close)
+                      for c in nifty_tick.candles if c.interval == "I1" and c.ts)
+        if len(bars) > 1: candle_store.append("NSE_INDEX|Nifty 50", '1minute', bars[:-1])
         
-        if candles: data_dict['websocket_candle_data'] = pd.DataFrame(candles)
-            
 
 
-    def process_options_chain(feeds_data):  #   Process options chain data from websocket feed
+def process_options_chain(data_dict, option_ticks):  #   Process decoded option records from websocket feed
+    
+    option_chain = data_dict['nifty_option_chain']
+    if option_chain is not None:
+        option_chain.update_many(option_ticks)     #   O(1) array writes per instrument
+    analytics = data_dict.get('option_analytics')
+    if analytics is not None and option_ticks:     #   Missing greeks and chain aggregates, only for the rows in this frame
+        analytics.apply(option_ticks, data_dict['nifty_spot_price'], time.time() + IST_OFFSET_SECONDS)
+    tick_history = data_dict.get('tick_history')
+    if tick_history is not None and option_chain is not None:   #   After analytics, so filled IVs are kept too
+        tick_history.record(option_chain, option_ticks)
+
+    events = data_dict.get('events')
+    if events is not None and events.has_subscribers('option'):
+        for key, tick in option_ticks.items():
+            events.publish(option_topic(key), tick)
+
+    # Option candles are built from trades, only for the instruments the candle engine follows
+    candle_engine = data_dict.get('candle_engine')
+    if candle_engine is not None:
+        for key in list(candle_engine.instruments):
+            tick = option_ticks.get(key)
+            if tick is not None and tick.ltp and tick.ltt:
+                candle_engine.update_tick(key, exchange_ms_to_ist_seconds(tick.ltt), tick.ltp)
+
+def process_option_rows(data_dict, update):  #   process_options_chain() for rows the decode worker already applied
+    
+    option_chain = data_dict['nifty_option_chain']
+    if option_chain is not None:
+        rows, known = option_chain.write_rows(update.options, update.values, update.ltt)    #   Rows outside the window are skipped
+        analytics = data_dict.get('option_analytics')
+        if analytics is not None:
+            ltp, delta = update.values[_LTP_ROW, known], update.values[_DELTA_ROW, known]
+            missing = ((update.modes[known] == _LTPC_MODE) | np.isnan(delta)) & (ltp > 0)
+            analytics.apply_rows(rows, rows[missing], data_dict['nifty_spot_price'], time.time() + IST_OFFSET_SECONDS)
+        tick_history = data_dict.get('tick_history')
+        if tick_history is not None: tick_history.record(option_chain, update.options)
+
+    events = data_dict.get('events')
+    if events is not None and events.has_subscribers('option'):
+        for i, key in enumerate(update.options):
+            events.publish(option_topic(key), update.option_tick(i))
+
+    candle_engine = data_dict.get('candle_engine')
+    if candle_engine is not None and candle_engine.instruments:
+        position = {key: i for i, key in enumerate(update.options)}
+        for key in list(candle_engine.instruments):
+            i = position.get(key)
+            if i is not None and update.values[_LTP_ROW, i] > 0 and update.ltt[i]:
+                candle_engine.update_tick(key, exchange_ms_to_ist_seconds(int(update.ltt[i])), float(update.values[_LTP_ROW, i]))
+
+def publish_snapshot(data_dict, frame):  #   Publish everything this frame changed as one consistent version
+    snapshots = data_dict.get('snapshots')
+    if snapshots is None:   return
+    
+    latest = snapshots.latest()
+    changes = {}
+    if data_dict['nifty_spot_price'] != latest.nifty_spot_price:
+        changes['nifty_spot_price'] = data_dict['nifty_spot_price']
+    option_chain = data_dict['nifty_option_chain']
+    if frame.options and option_chain is not None:
+        changes['option_chain'] = option_chain.freeze()    #   Later ticks go to fresh arrays, readers keep this view
+        analytics = data_dict.get('option_analytics')
+        if analytics is not None: changes['option_analytics'] = analytics.summary()
+    if data_dict.get('complete_candle_data') is not latest.complete_candle_data:
+        changes['complete_candle_data'] = data_dict.get('complete_candle_data')
+    if changes:
+        snapshot = snapshots.publish(**changes)
+        events = data_dict.get('events')
+        if events is not None: events.publish(TOPIC_SNAPSHOT, snapshot)
+
+def process_frame(data_dict, message, feed_response=None):  #   Decode one raw frame and apply it to data_dict, timing each stage
+    started = time.perf_counter_ns()
+    frame = decode_feed_response(message, feed_response, MODE_STATS.for_thread())
+    METRICS.histogram('decode').record(time.perf_counter_ns() - started)
+    return apply_frame(data_dict, frame, len(message))
+
+
+def apply_frame(data_dict, frame, frame_bytes):  #   Apply one DecodedFrame (possibly several merged frames) to data_dict
+    # 'process_frame' times this apply only, on every path; decoding is timed apart as 'decode' per frame
+    # (process_frame, replay) or 'decode_batch' (shard processing threads)
+    clock = time.perf_counter_ns
+    decoded = clock()
+    
+    # Process each data type - directly updating data_dict, serialized when several shards feed it
+    state_lock = data_dict.get('state_lock')
+    if state_lock is not None: state_lock.acquire()
+    try:
+        nifty_tick = frame.index.get("NSE_INDEX|Nifty 50")
+        process_nifty_spot(data_dict, nifty_tick)
+        spot_done = clock()
+        process_nifty_candles(data_dict, nifty_tick)
+        candles_done = clock()
+        process_options_chain(data_dict, frame.options)
+        processed = clock()
+        publish_snapshot(data_dict, frame)
+        finished = clock()
+    finally:
+        if state_lock is not None: state_lock.release()
+    
+    METRICS.histogram('process_nifty_spot').record(spot_done - decoded)
+    METRICS.histogram('process_nifty_candles').record(candles_done - spot_done)
+    METRICS.histogram('process_options_chain').record(processed - candles_done)
+    METRICS.histogram('publish_snapshot').record(finished - processed)
+    METRICS.histogram('process_frame').record(finished - decoded)
+    METRICS.increment('frames')
+    METRICS.increment('frame_bytes', frame_bytes)
+    METRICS.increment('option_updates', len(frame.options))
+    
+    # Feed lag from the newest exchange timestamp in the frame (index ltt, falling back to currentTs);
+    # replayed frames carry the recording's timestamps, so lag against the wall clock means nothing there
+    if not data_dict.get('replay'):
+        record_feed_lag(nifty_tick.ltt if nifty_tick and nifty_tick.ltt else frame.current_ts)
+    return frame
+
+
+def process_offloaded(data_dict, update):  #   Apply one DecodeOffload.read() to data_dict, the counterpart of process_frame()
+    started = time.perf_counter_ns()
+    state_lock = data_dict.get('state_lock')
+    if state_lock is not None: state_lock.acquire()
+    try:
+        process_nifty_spot(data_dict, update.index)
+        process_nifty_candles(data_dict, update.index)
+        process_option_rows(data_dict, update)
+        publish_snapshot(data_dict, update)
+    finally:
+        if state_lock is not None: state_lock.release()
+    
+    METRICS.histogram('process_offloaded').record(time.perf_counter_ns() - started)
+    METRICS.increment('offloaded_reads')
+    METRICS.increment('option_updates', len(update.options))
+    if not data_dict.get('replay'):
+        record_feed_lag(update.index.ltt if update.index and update.index.ltt else update.current_ts)
+
+
+def backfill_gap(data_dict, instrument_keys, last_frame_wall):  #   Refill candle minutes a dropped connection missed
+    candle_engine = data_dict.get('candle_engine')
+    if candle_engine is None or last_frame_wall is None:   return 0
+    
+    # The index feed carries the previous and current I1 bars, so a gap within one minute boundary heals itself
+    since = int(last_frame_wall) + IST_OFFSET_SECONDS
+    since -= since % 60
+    now = int(time.time()) + IST_OFFSET_SECONDS
+    keys = [key for key in list(candle_engine.instruments) if key in instrument_keys]
+    if not keys or now - now % 60 - since < 120:   return 0
+    
+    started = time.perf_counter_ns()
+    folded = backfill_instruments(candle_engine, keys, since, data_dict.get('candle_store'))
+    if CANDLE_INSTRUMENT in keys:   #   Picked up by the next frame's snapshot publish
+        data_dict['complete_candle_data'] = candle_engine.to_frame(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+        data_dict['complete_candle_closed'] = candle_engine.closed_version(CANDLE_INSTRUMENT, PUBLISHED_INTERVAL)
+    METRICS.increment('gap_backfills')
+    METRICS.increment('gap_backfill_bars', folded)
+    METRICS.histogram('gap_backfill').record(time.perf_counter_ns() - started)
+    print(f"Backfilled {folded} candle minutes for {len(keys)} instruments after a feed gap")
+    return folded
+
+
+def get_open_value():  #   Today's Nifty 50 open from the quotes endpoint
+    url = api_url("/v2/market-quote/quotes")
+    response = HTTP.get_json(url, headers=TOKENS.headers(), params={'symbol': "NSE_INDEX|Nifty 50"})
+    return response['data']['NSE_INDEX:Nifty 50']['ohlc']['open']
+
+def create_options_df(data_dict, instrument_master, open_value):  #   Strike window around the open and its option chain store
+    strike_price_cap = 1000
+    
+    # Find the upcoming Thursday
+    today = datetime.today()
+    days_until_thursday = (3 - today.weekday()) % 7  # 3 is Thursday (0=Monday, 6=Sunday)
+    upcoming_thursday = today + timedelta(days=days_until_thursday)
+    upcoming_thursday_str = upcoming_thursday.strftime('%Y-%m-%d')  # Format: 2024-11-28
+    
+    # Window of +-strike_price_cap around the open, re-centred on the spot as it moves
+    strike_window = StrikeWindow(instrument_master, 'NIFTY', upcoming_thursday_str, half_width=strike_price_cap,
+                                 mode_tiers=OPTION_MODE_TIERS, mode_overrides=OPTION_MODE_OVERRIDES)
+    
+    attach_option_chain(data_dict, strike_window.start(open_value))
+    return strike_window
+
+
+def attach_option_chain(data_dict, instruments_df, analytics=True):   #   Option chain store and what reads it, as the live feed expects them
+    # Preallocate the columnar store, row lookup by instrument key is built once per window
+    data_dict['nifty_option_chain'] = OptionChainStore(instruments_df)
+    if analytics:
+        data_dict['option_analytics'] = OptionAnalytics(data_dict['nifty_option_chain'])
+    
+    # Intraday ticks per instrument in fixed memory, for last-N / since-T window queries
+    if data_dict.get('tick_history') is None:
+        data_dict['tick_history'] = TickHistory()
+        METRICS.add_source('tick_history', data_dict['tick_history'].stats)
+
+
+def start_websocket(data_dict, record_path=None, shards=1, strike_window=None, decode_worker=False, ingest_policy=INGEST_POLICY,
+                    ingest_queue_size=INGEST_QUEUE_SIZE):
+    # strike_window comes ready from the startup graph in main.py, standalone runs build it here
+    def initialize_market_data():   #   Open price, then the instrument master (cached per trading day) and the window
+        open_value = get_open_value()
+        return create_options_df(data_dict, load_instrument_master(), open_value)
+
+
+    def authorize_feed():  #   One-time authorized feed uri, every connection needs its own
+        # Authorize goes through the pooled session like the other REST calls, token from memory
+        response = HTTP.get(api_url("/v2/feed/market-data-feed/authorize"), headers=TOKENS.headers())
+        if response.status_code == 401:     #   Revoked or expired: the reconnect after this logs in again
+            TOKENS.invalidate()
+        response = response.json()
+        if response.get('status') != 'success':
+            raise Exception(f"Feed authorization failed: {response.get('errors')}")
+        return response['data']['authorizedRedirectUri']
+
+    def run_market_data_websocket():  #   Subscribe over the shards and merge every shard's frames into data_dict
+        
+        nonlocal strike_window
+        if strike_window is None: strike_window = initialize_market_data()
+        
+        # Raw frames are recorded for offline replay, the option chain layout goes alongside
+        if recorder is not None: recorder.write_meta(data_dict['nifty_option_chain'].instruments)
+        
+        # Shards share data_dict, so frames are applied under one lock (decode runs outside it)
+        state_lock = data_dict.setdefault('state_lock', threading.Lock())
         
-        for key, data in feeds_data.items():
-            if key != "NSE_INDEX|Nifty 50" and data:
-                market_ff = data.get("ff", {}).get("marketFF", {})
-                ltpc = market_ff.get("ltpc", {})
-                greeks = market_ff.get("optionGreeks", {})
-                bid_ask = market_ff.get("marketLevel", {}).get("bidAskQuote", [{}])[0]
-                ohlc = market_ff.get("marketOHLC", {}).get("ohlc", [{}])[0]
-                feed_details = market_ff.get("eFeedDetails", {})
-                
-                # Find the row index for this instrument key
-                idx = data_dict['nifty_option_chain'].index[
-                    data_dict['nifty_option_chain']['instrument_key'] == key
-                ]
-                
-                if len(idx) > 0:
-                    # Update values directly in the dataframe
-                    data_dict['nifty_option_chain'].loc[idx, 'LTP'] = ltpc.get("ltp")
-                    data_dict['nifty_option_chain'].loc[idx, 'Delta'] = greeks.get("delta")
-                    data_dict['nifty_option_chain'].loc[idx, 'Theta'] = greeks.get("theta")
-                    data_dict['nifty_option_chain'].loc[idx, 'Gamma'] = greeks.get("gamma")
-                    data_dict['nifty_option_chain'].loc[idx, 'Vega'] = greeks.get("vega")
-                    data_dict['nifty_option_chain'].loc[idx, 'IV'] = greeks.get("iv")
-                    data_dict['nifty_option_chain'].loc[idx, 'Best_Bid_Price'] = bid_ask.get("bp")
-                    data_dict['nifty_option_chain'].loc[idx, 'Best_Ask_Price'] = bid_ask.get("ap")
-                    data_dict['nifty_option_chain'].loc[idx, 'Volume'] = ohlc.get("volume")
-                    data_dict['nifty_option_chain'].loc[idx, 'OI'] = feed_details.get("oi")
-                    data_dict['nifty_option_chain'].loc[idx, 'POI'] = feed_details.get("poi")
-
-    async def run_market_data_websocket():  #   Main function to run websocket connection and process market data"""
+        def recentre_window():
+            # Spot moved far enough from the window centre: swap only the strikes that changed
+            with state_lock:
+                changes = strike_window.recentre(data_dict['nifty_option_chain'], data_dict['nifty_spot_price'])
+                if changes and recorder is not None: recorder.write_meta(data_dict['nifty_option_chain'].instruments)
+            if changes: connections.apply(*changes)
         
-        access_token, instrument_keys = initialize_market_data()
+        record_lock = threading.Lock()
         
-        # Setup websocket connection
-        configuration = upstox_client.Configuration()
-        configuration.access_token = access_token
-        response = upstox_client.WebsocketApi(
-            upstox_client.ApiClient(configuration)
-        ).get_market_data_feed_authorize('2.0')
+        def receive_frame(shard, message):     #   On the receiving thread, every frame before any queueing or conflation
+            if recorder is not None:
+                with record_lock: recorder.record(message)
+            if offload is not None:     #   Decoded in the worker process, applied by apply_offloaded()
+                offload.push(message)
         
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
+        def handle_frame(shard, frame, frame_bytes):   #   On the shard's processing thread, a batch of queued frames merged into one
+            apply_frame(data_dict, frame, frame_bytes)
+            recentre_window()
         
-        async with websockets.connect(
-            response.data.authorized_redirect_uri,
-            ssl=ssl_context
-        ) as websocket:
-            await websocket.send(json.dumps({
-                "guid": "someguid",
-                "method": "sub",
-                "data": {
-                    "mode": "full",
-                    "instrumentKeys": instrument_keys
-                }
-            }).encode('utf-8'))
-            
-            while True:
+        def apply_offloaded():     #   Thread body: fold what the decode worker applied into data_dict
+            while offload.process.is_alive():
+                offload.wait(1.0)
                 try:
-                    message = await websocket.recv()
-                    feed_data = MessageToDict(pb.FeedResponse().FromString(message))
-                    feeds = feed_data.get("feeds", {})
-                    # print("\nfeeds : \n", feeds)
-                    
-                    # Process each data type - directly updating data_dict
-                    process_nifty_spot(feeds.get("NSE_INDEX|Nifty 50"))
-                    process_nifty_candles(feeds.get("NSE_INDEX|Nifty 50"))
-                    process_options_chain(feeds)
-                    
+                    update = offload.read()
+                    if update is None: continue
+                    process_offloaded(data_dict, update)
+                    recentre_window()
                 except Exception as e:
-                    print(f"Error in websocket processing: {e}")
-                    await asyncio.sleep(1)
+                    METRICS.increment('processing_errors')
+                    print(f"Error applying decoded frames: {e}")
+            print(f"Decode worker exited with code {offload.process.exitcode}")
+        
+        def handle_reconnect(shard, last_frame_wall):   #   Token from memory, fresh authorize already done, subscriptions resent
+            try:    backfill_gap(data_dict, shard.subscriptions, last_frame_wall)
+            except Exception as e:
+                METRICS.increment('candle_errors')
+                print(f"Error backfilling feed gap: {e}")
+        
+        # Optional: protobuf decode and chain writes in a worker process, over the whole expiry so re-centres need no handshake
+        offload = None
+        if decode_worker:
+            offload = DecodeOffload(strike_window.universe()).start()
+            data_dict['decode_offload'] = offload
+            METRICS.add_source('decode_worker', offload.stats)
+            MODE_STATS.add_source(offload.mode_totals)     #   Frames are decoded in the worker, its counters feed 'feed_modes'
+            threading.Thread(target=apply_offloaded, daemon=True, name='decode-applier').start()
+        
+        connections = ConnectionManager(shards, authorize_feed, handle_frame if offload is None else None, handle_reconnect,
+                                        on_message=receive_frame,
+                                        decode=lambda message, feed_response: decode_feed_response(message, feed_response, MODE_STATS.for_thread()),
+                                        queue_size=ingest_queue_size, policy=ingest_policy, max_batch=INGEST_MAX_BATCH)
+        data_dict['feed_connections'] = connections
+        METRICS.add_source('feed_shards', connections.stats)
+        
+        # Index in full for its candles on the first shard, each strike in the mode of its distance from ATM
+        connections.subscribe(["NSE_INDEX|Nifty 50"], "full", shard_id=0)
+        for mode, keys in strike_window.subscriptions().items():
+            connections.subscribe(keys, mode)
+        connections.run()
 
-    loop = asyncio.new_event_loop() #   Function to run in separate thread
-    asyncio.set_event_loop(loop)
-    try:    loop.run_until_complete(run_market_data_websocket())
+    recorder = FrameRecorder(record_path) if record_path else None
+    try:    run_market_data_websocket()
     except Exception as e:  print(f"Websocket thread error: {e}")
-    finally:    loop.close()
+    finally:
+        if recorder is not None: recorder.close()
+        if data_dict.get('decode_offload') is not None: data_dict['decode_offload'].stop()
 
 if __name__ == "__main__":
     start_websocket()